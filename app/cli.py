@@ -0,0 +1,261 @@
+# app/cli.py
+"""
+Comandos de manutenção.
+
+    python -m app.cli migrar
+    python -m app.cli aquecer-cache [--variantes 3] [--concorrencia 4]
+    python -m app.cli limpar-cache
+    python -m app.cli especulacao
+    python -m app.cli limpar-relatorios [--max-mb N] [--max-dias N]
+    python -m app.cli compactar-respostas [--lote 500] [--criar-view]
+    python -m app.cli criar-indices
+    python -m app.cli limpar-mensagens [--dias N]
+    python -m app.cli questionarios [--arquivo nova_versao.json]
+    python -m app.cli repontuar [--lote 10000] [--simular] [--regenerar] [--concorrencia 4]
+    python -m app.cli reconstruir-percentis
+    python -m app.cli exportar [--formato csv|ndjson|parquet] [--saida arquivo] [--desde 2026-01-01] [--incremental crm]
+"""
+import argparse
+import logging
+
+from app.db import engine, Base
+
+
+def cmd_migrar(args):
+    # colunas e índices já entraram em main(), antes de qualquer comando
+    for item in args.adicionadas:
+        print(f"{item}: criado")
+    print(f"{len(args.adicionadas)} coluna(s)/índice(s) criado(s)")
+
+
+def cmd_aquecer_cache(args):
+    from app.services.gpt_logic import tarefas_aquecimento
+    from app.services.llm_cache import aquecer
+    from app.services.questionario import PERFIS, PILARES
+
+    gerados = aquecer(
+        tarefas_aquecimento(PERFIS, PILARES),
+        variantes=args.variantes,
+        concorrencia=args.concorrencia,
+    )
+    print(f"{gerados} texto(s) gerado(s)")
+
+
+def cmd_limpar_cache(args):
+    from app.services.gpt_logic import versao_prompt
+    from app.services.llm_cache import limpar_obsoletos
+
+    apagados = limpar_obsoletos({
+        "interpretacao": versao_prompt("interpretacao"),
+        "convite": versao_prompt("convite"),
+    })
+    print(f"{apagados} texto(s) apagado(s)")
+
+
+def cmd_especulacao(args):
+    from app.db import SessionLocal
+    from app.services.especulacao import estatisticas
+
+    db = SessionLocal()
+    try:
+        for chave, valor in estatisticas(db).items():
+            print(f"{chave}: {valor:.1%}" if isinstance(valor, float) else f"{chave}: {valor}")
+    finally:
+        db.close()
+
+
+def cmd_limpar_relatorios(args):
+    from datetime import timedelta
+
+    from app.config import settings
+    from app.services.relatorio_store import get_relatorio_store
+
+    max_mb = settings.relatorios_max_mb if args.max_mb is None else args.max_mb
+    max_dias = settings.relatorios_max_dias if args.max_dias is None else args.max_dias
+    apagados = get_relatorio_store().despejar(
+        max_bytes=max_mb * 1024 * 1024 if max_mb else None,
+        max_idade=timedelta(days=max_dias) if max_dias else None,
+    )
+    print(f"{apagados} relatório(s) apagado(s)")
+
+
+def cmd_compactar_respostas(args):
+    from app.db import SessionLocal
+    from app.services.respostas import backfill, criar_view_compativel
+
+    db = SessionLocal()
+    try:
+        convertidas = backfill(db, lote=args.lote)
+    finally:
+        db.close()
+    print(f"{convertidas} sessão(ões) convertida(s)")
+
+    if args.criar_view:
+        criar_view_compativel(engine)
+        print("score_answers agora é uma view sobre score_sessions.respostas")
+
+
+def cmd_criar_indices(args):
+    from app.db import SessionLocal
+    from app.services.indices import criar_indices
+
+    db = SessionLocal()
+    try:
+        resultado = criar_indices(engine, db)
+    finally:
+        db.close()
+    print(f"{resultado['usuarios_apagados']} usuário(s) duplicado(s) unificado(s)")
+    print(f"{resultado['sessoes_abandonadas']} sessão(ões) em andamento duplicada(s) abandonada(s)")
+
+
+def cmd_limpar_mensagens(args):
+    from app.services.idempotencia import compactar
+
+    print(f"{compactar(args.dias)} id(s) de mensagem apagado(s)")
+
+
+def cmd_questionarios(args):
+    import json
+
+    from app.config import settings
+    from app.services.questionario import compilar, questionarios
+
+    if args.arquivo:
+        # valida uma definição antes de copiá-la para app/questionarios
+        with open(args.arquivo, encoding="utf-8") as f:
+            compilados = {"": compilar(json.load(f))}
+    else:
+        compilados = questionarios()
+    for q in compilados.values():
+        padrao = " (sessões novas)" if q.versao == settings.questionario_versao else ""
+        print(f"{q.versao}{padrao}: {q.num_perguntas} perguntas, escala {q.escala[0]}-{q.escala[1]}, "
+              f"{len(q.passos)} passos. {q.descricao}")
+
+
+def cmd_repontuar(args):
+    from app.db import SessionLocal
+    from app.services.score_lote import regenerar_relatorios, repontuar
+
+    db = SessionLocal()
+    try:
+        resultado = repontuar(db, lote=args.lote, simular=args.simular)
+    finally:
+        db.close()
+    verbo = "mudaria(m)" if args.simular else "atualizada(s)"
+    print(f"{resultado['lidas']} sessão(ões) lida(s), {resultado['alteradas']} {verbo}")
+    if resultado["versao_desconhecida"]:
+        print(f"{resultado['versao_desconhecida']} sessão(ões) de versão do questionário não carregada")
+    if resultado["sem_respostas"]:
+        print(f"{resultado['sem_respostas']} sessão(ões) sem respostas compactas (rode compactar-respostas antes)")
+
+    if resultado["alteradas"] and not args.simular:
+        # pilares e totais mudaram: os histogramas dos percentis também
+        cmd_reconstruir_percentis(args)
+
+    if args.regenerar and not args.simular and resultado["ids"]:
+        r = regenerar_relatorios(resultado["ids"], concorrencia=args.concorrencia)
+        print(f"{r['refeitos']} relatório(s) refeito(s), {r['falhas']} falha(s)")
+
+
+def cmd_reconstruir_percentis(args):
+    from app.db import SessionLocal
+    from app.services.percentis import reconstruir
+
+    db = SessionLocal()
+    try:
+        sessoes = reconstruir(db)
+    finally:
+        db.close()
+    print(f"percentis recalculados com {sessoes} sessão(ões) concluída(s)")
+
+
+def cmd_exportar(args):
+    import sys
+    from datetime import datetime
+
+    from app.db import SessionLocal
+    from app.services.exportacao import exportar
+
+    desde = datetime.fromisoformat(args.desde) if args.desde else None
+    saida = sys.stdout.buffer if args.saida == "-" else open(args.saida, "wb")
+    db = SessionLocal()
+    try:
+        for bloco in exportar(db, args.formato, desde=desde, incremental=args.incremental, lote=args.lote):
+            saida.write(bloco)
+    finally:
+        db.close()
+        if saida is not sys.stdout.buffer:
+            saida.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Manutenção do Score de Riqueza Bot")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("migrar", help="adiciona as colunas e os índices novos em tabelas de bancos antigos")
+    p.set_defaults(func=cmd_migrar)
+
+    p = sub.add_parser("aquecer-cache", help="gera offline os textos da IA para todas as combinações")
+    p.add_argument("--variantes", type=int, default=None)
+    p.add_argument("--concorrencia", type=int, default=4)
+    p.set_defaults(func=cmd_aquecer_cache)
+
+    p = sub.add_parser("limpar-cache", help="apaga textos expirados ou de prompts antigos")
+    p.set_defaults(func=cmd_limpar_cache)
+
+    p = sub.add_parser("especulacao", help="taxa de acerto e desperdício do pré-cálculo especulativo")
+    p.set_defaults(func=cmd_especulacao)
+
+    p = sub.add_parser("limpar-relatorios", help="despeja PDFs por idade e tamanho total do armazenamento")
+    p.add_argument("--max-mb", type=int, default=None)
+    p.add_argument("--max-dias", type=int, default=None)
+    p.set_defaults(func=cmd_limpar_relatorios)
+
+    p = sub.add_parser("compactar-respostas", help="empacota as linhas de score_answers na sessão")
+    p.add_argument("--lote", type=int, default=500)
+    p.add_argument("--criar-view", action="store_true", help="troca score_answers por uma view compatível")
+    p.set_defaults(func=cmd_compactar_respostas)
+
+    p = sub.add_parser("criar-indices", help="deduplica usuários/sessões e cria os índices únicos em bancos antigos")
+    p.set_defaults(func=cmd_criar_indices)
+
+    p = sub.add_parser("limpar-mensagens", help="apaga ids de mensagens processadas mais velhos que o TTL")
+    p.add_argument("--dias", type=int, default=None)
+    p.set_defaults(func=cmd_limpar_mensagens)
+
+    p = sub.add_parser("questionarios", help="compila e lista as versões do questionário")
+    p.add_argument("--arquivo", default=None, help="só valida este JSON")
+    p.set_defaults(func=cmd_questionarios)
+
+    p = sub.add_parser("repontuar", help="recalcula pilares, total e perfil das sessões concluídas")
+    p.add_argument("--lote", type=int, default=10_000)
+    p.add_argument("--simular", action="store_true", help="só conta o que mudaria")
+    p.add_argument("--regenerar", action="store_true", help="refaz os PDFs das sessões alteradas")
+    p.add_argument("--concorrencia", type=int, default=4)
+    p.set_defaults(func=cmd_repontuar)
+
+    p = sub.add_parser("reconstruir-percentis", help="recalcula os histogramas dos percentis a partir do histórico")
+    p.set_defaults(func=cmd_reconstruir_percentis)
+
+    p = sub.add_parser("exportar", help="exporta as sessões concluídas (CRM/BI) em streaming")
+    p.add_argument("--formato", choices=("csv", "ndjson", "parquet"), default="csv")
+    p.add_argument("--saida", default="-", help="arquivo de saída (- = stdout)")
+    p.add_argument("--desde", default=None, help="só sessões alteradas depois desta data (ISO)")
+    p.add_argument("--incremental", default=None, help="nome da marca: exporta só o que mudou desde a última")
+    p.add_argument("--lote", type=int, default=None)
+    p.set_defaults(func=cmd_exportar)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    from app import models  # noqa: F401
+    from app.services.migracoes import migrar
+
+    Base.metadata.create_all(bind=engine)
+    # todo comando roda sobre o esquema atual (compactar-respostas lê colunas novas)
+    args.adicionadas = migrar(engine)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
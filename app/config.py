@@ -8,6 +8,119 @@ class Settings(BaseSettings):
     database_url: Optional[str] = None
     whatsapp_verify_token: Optional[str] = None
 
+    # Pool de conexões com o banco (por processo, vale para o engine sync e o async)
+    db_pool_tamanho: int = 10
+    db_pool_extra: int = 20  # conexões além do pool em pico, fechadas depois
+    db_pool_timeout_segundos: float = 30.0
+    db_pool_pre_ping: bool = True
+    db_pool_reciclar_segundos: int = 1800  # 0 = nunca
+
+    # Graph API do WhatsApp
+    whatsapp_token: Optional[str] = None
+    whatsapp_phone_id: Optional[str] = None
+    whatsapp_api_url: str = "https://graph.facebook.com/v20.0"
+    whatsapp_http2: bool = True
+    whatsapp_timeout_segundos: float = 10.0
+    whatsapp_max_conexoes: int = 20
+    whatsapp_max_tentativas: int = 4
+    whatsapp_retry_base_segundos: float = 0.5
+    whatsapp_retry_max_segundos: float = 8.0
+    whatsapp_msgs_por_segundo: float = 80.0  # limite padrão da Meta por número
+    whatsapp_envios_concorrentes: int = 8
+    whatsapp_media_validade_dias: int = 30   # validade do media id na Meta
+    whatsapp_media_margem_horas: int = 24    # renova antes de chegar perto disso
+
+    # Fila de jobs em background (app.worker)
+    job_max_tentativas: int = 5
+    job_backoff_base_segundos: float = 10.0
+    job_backoff_max_segundos: float = 600.0
+    job_lease_segundos: float = 60.0  # renovado enquanto o job roda (app.services.jobs)
+    job_intervalo_poll_segundos: float = 1.0
+    job_processos: int = 1
+    job_threads: int = 4  # jobs simultâneos por processo (IA e envio são I/O)
+
+    # Cache dos textos da IA (app.services.llm_cache)
+    llm_cache_variantes: int = 3
+    llm_cache_ttl_dias: int = 90
+    llm_cache_memoria_itens: int = 1024
+    llm_cache_memoria_ttl_segundos: float = 600.0
+
+    # Deadlines e circuit breaker das chamadas à OpenAI
+    llm_deadline_interpretacao_segundos: float = 20.0
+    llm_deadline_convite_segundos: float = 12.0
+    llm_breaker_falhas: int = 5
+    llm_breaker_segundos: float = 60.0
+    # envia a interpretação por WhatsApp parágrafo a parágrafo, antes do PDF
+    llm_streaming: bool = True
+
+    # Pré-cálculo especulativo dos textos (app.services.especulacao)
+    especulacao_ativa: bool = True
+    especulacao_a_partir_pergunta: int = 20
+    especulacao_abandono_horas: int = 24
+
+    # Radar do PDF: "reportlab" (vetorial) ou "matplotlib" (PNG)
+    pdf_radar: str = "reportlab"
+
+    # Pool de processos de renderização (0 = renderiza na própria thread)
+    pdf_pool_processos: int = 2
+    pdf_pool_jobs_por_processo: int = 200
+    pdf_pool_timeout_segundos: float = 60.0
+
+    # Armazenamento dos PDFs por conteúdo: "local" ou "s3" (app.services.relatorio_store;
+    # "s3" exige boto3, ver requirements-extras.txt)
+    relatorios_backend: str = "local"
+    relatorios_dir: Optional[str] = None  # padrão: app/reports
+    relatorios_s3_bucket: Optional[str] = None
+    relatorios_s3_prefixo: str = "relatorios/"
+    relatorios_s3_endpoint_url: Optional[str] = None  # MinIO, R2 etc.
+    relatorios_s3_regiao: Optional[str] = None
+    relatorios_max_mb: int = 5120  # 0 = sem limite
+    relatorios_max_dias: int = 365  # 0 = sem limite
+
+    # Percentis da população no relatório (app.services.percentis)
+    percentis_amostra_minima: int = 100  # sessões na faixa de renda para comparar só com ela; abaixo, todos
+
+    # Exportação em massa para CRM/BI (app.services.exportacao, /exportacao;
+    # o formato parquet exige pyarrow, ver requirements-extras.txt)
+    exportacao_token: Optional[str] = None  # header X-Exportacao-Token; None = endpoint desligado
+    exportacao_lote: int = 5000  # linhas por ida ao cursor e por bloco escrito
+    exportacao_sobreposicao_segundos: int = 60  # incremental relê esse trecho antes da marca (commits atrasados)
+
+    # Questionário (app.services.questionario)
+    questionario_versao: str = "v1"  # versão das sessões novas; as abertas terminam na delas
+    questionarios_dir: Optional[str] = None  # definições extras, além de app/questionarios
+
+    # Estado da conversa em cache com escrita adiada (app.services.estado_conversa)
+    estado_cache_ativo: bool = True
+    estado_backend: str = "memoria"  # "memoria" (um processo web) ou "redis" (requirements-extras.txt)
+    estado_redis_url: str = "redis://localhost:6379/0"
+    estado_redis_prefixo: str = "score:estado:"
+    estado_flush_intervalo_segundos: float = 1.0
+    estado_flush_lote: int = 200
+    estado_ocioso_segundos: float = 1800.0
+
+    # Deduplicação das reentregas do webhook pelo id da mensagem (app.services.idempotencia)
+    idempotencia_memoria_itens: int = 100_000
+    idempotencia_memoria_ttl_segundos: float = 3600.0
+    idempotencia_ttl_dias: int = 7  # a Meta reentrega por alguns dias; depois disso a linha sai
+    idempotencia_compactar_intervalo_segundos: float = 3600.0
+
+    # Status de entrega (delivered, read...) do webhook (app.services.status_entrega)
+    status_entrega_ttl_dias: int = 30
+
+    # Ordem das mensagens por número (app.services.despachante)
+    ordem_por_numero: bool = True  # fila serial por número (criada sob demanda); false = sem fila
+    ordem_lock_banco: bool = False  # advisory lock por número (vários processos web, PostgreSQL)
+
+    # Métricas e rastro por requisição (app.metrics, /metrics)
+    rastro_token: Optional[str] = None  # header X-Rastro com este valor devolve Server-Timing; None = desligado
+    worker_metricas_porta: int = 0  # /metrics do worker (processo i usa porta + i); 0 = desligado
+
+    # Pré-carga depois da subida (app.services.precarga)
+    precarga_ativa: bool = True
+    precarga_atraso_segundos: float = 1.0  # depois do startup, com o /health já respondendo
+    precarga_modulos: str = ""  # módulos extras, separados por vírgula
+
     # Diz para o Pydantic pegar as variáveis do arquivo .env
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
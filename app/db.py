@@ -1,28 +1,85 @@
 # app/db.py
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from app.config import settings
 
 # Usa a DATABASE_URL do .env ou, se estiver vazia, cai no sqlite local
 SQLALCHEMY_DATABASE_URL = settings.database_url or "sqlite:///./score.db"
 
+
+def _url_async(url: str) -> str:
+    """Troca o driver da URL pelo equivalente async (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite"):
+        return "sqlite+aiosqlite" + url[url.index(":"):]
+    if url.startswith("postgres://"):
+        # formato antigo usado por alguns provedores (Heroku)
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql"):
+        return "postgresql+asyncpg" + url[url.index(":"):]
+    return url
+
+
+ASYNC_DATABASE_URL = _url_async(SQLALCHEMY_DATABASE_URL)
+
+def _opcoes_pool(url: str) -> dict:
+    """Pool de conexões configurável (DB_POOL_*); sqlite fica no padrão."""
+    opcoes = {"pool_pre_ping": settings.db_pool_pre_ping}
+    if settings.db_pool_reciclar_segundos > 0:
+        # devolve conexões antes do timeout de ociosidade do servidor/proxy
+        opcoes["pool_recycle"] = settings.db_pool_reciclar_segundos
+    if not url.startswith("sqlite"):
+        opcoes.update(
+            pool_size=settings.db_pool_tamanho,
+            max_overflow=settings.db_pool_extra,
+            pool_timeout=settings.db_pool_timeout_segundos,
+        )
+    return opcoes
+
+
 # Para sqlite precisamos desse connect_args específico
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        **_opcoes_pool(SQLALCHEMY_DATABASE_URL),
     )
 else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **_opcoes_pool(SQLALCHEMY_DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine async usado no caminho do webhook (não bloqueia o event loop)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_opcoes_pool(ASYNC_DATABASE_URL))
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession
+)
+
 Base = declarative_base()
 
 
+def insert_upsert(dialeto: str):
+    """insert() do dialeto, com on_conflict_do_* (INSERT ... ON CONFLICT)."""
+    if dialeto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialeto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Upsert não suportado em {dialeto}")
+    return insert
+
+
 # Dependência para usar sessão de banco nas rotas, quando precisarmos
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Versão async da dependência, usada pelo webhook
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
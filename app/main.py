@@ -1,30 +1,86 @@
+import hmac
+import time
+from datetime import datetime
 from typing import Optional
 
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import JSONResponse, PlainTextResponse
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, Request, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 
+from app import metrics
 from app.config import settings
-from app.db import engine, Base, get_db
+from app.db import engine, Base, SessionLocal, get_async_db, get_db
 from app.services.whatsapp_logic import (
     extract_message_and_number,
-    get_or_create_user,
-    get_or_create_session,
-    process_message,
+    extract_message_id,
+    atender_mensagem_async,
+    eh_envelope_meta,
+    extrair_envelope_meta,
+    atender_lote_async,
 )
+from app.services import exportacao, percentis, status_entrega
+from app.services.migracoes import migrar
+from app.services.questionario import get_questionario
+from app.services.whatsapp_client import fechar_whatsapp_client
+from app.services.flusher import iniciar_flusher, parar_flusher
+from app.services.precarga import iniciar_precarga, parar_precarga
+from app.services.despachante import get_despachante, fechar_despachante
+from app.services.relatorio_store import chave_valida, get_relatorio_store
 
 
 class WhatsAppWebhook(BaseModel):
     # "from" é palavra reservada em Python, então usamos from_ com alias
     from_: Optional[str] = Field(default=None, alias="from")
     text: Optional[str] = None
+    # id da mensagem no provedor: reentregas chegam com o mesmo id
+    id: Optional[str] = None
 
     class Config:
         # permite usar tanto "from_" quanto "from" se precisar
         allow_population_by_field_name = True
 
 
+class RastroMiddleware:
+    """
+    Rastro opcional por requisição: com o header X-Rastro igual a
+    RASTRO_TOKEN, a resposta traz as etapas (lookup, transição, envio...)
+    e o total no header Server-Timing. Sem o header, só repassa.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.rastro_token or not self._pediu(scope):
+            await self.app(scope, receive, send)
+            return
+
+        rastro, token = metrics.iniciar_rastro()
+        inicio = time.perf_counter()
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                rastro.append(("total", time.perf_counter() - inicio, ""))
+                cabecalhos = list(mensagem.get("headers", []))
+                cabecalhos.append((b"server-timing", metrics.server_timing(rastro).encode()))
+                mensagem = {**mensagem, "headers": cabecalhos}
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            metrics.encerrar_rastro(token)
+
+    @staticmethod
+    def _pediu(scope) -> bool:
+        for nome, valor in scope["headers"]:
+            if nome == b"x-rastro":
+                return hmac.compare_digest(valor, settings.rastro_token.encode())
+        return False
+
+
 app = FastAPI(title="Score de Riqueza Bot", version="0.1.0")
+app.add_middleware(RastroMiddleware)
 
 
 # Evento de startup: cria as tabelas no banco ao subir o servidor
@@ -34,6 +90,24 @@ def on_startup():
     from app import models  # noqa: F401
 
     Base.metadata.create_all(bind=engine)
+    # colunas e índices novos em tabelas que já existiam (o create_all não altera tabelas)
+    migrar(engine)
+    # compila as versões do questionário agora: definição inválida impede a subida
+    get_questionario()
+    # grava em lote o que o webhook deixa em memória (estado das conversas,
+    # ids processados, status de entrega)
+    iniciar_flusher()
+    # aquece banco e cliente da Graph API depois que o servidor já atende
+    iniciar_precarga()
+
+
+# Grava o estado pendente e fecha as conexões persistentes com a Graph API
+@app.on_event("shutdown")
+async def on_shutdown():
+    await parar_precarga()
+    await fechar_despachante()
+    parar_flusher()
+    await fechar_whatsapp_client()
 
 
 @app.get("/health")
@@ -41,17 +115,29 @@ async def health_check():
     return {"status": "ok", "message": "Score de Riqueza Bot rodando"}
 
 
+# Métricas do processo no formato texto do Prometheus
+@app.get("/metrics")
+def exportar_metricas():
+    return Response(metrics.exportar(), media_type=metrics.TIPO_CONTEUDO)
+
+
 # Endpoint de verificação do webhook (para provedores tipo Meta/Facebook)
 @app.get("/webhook/whatsapp")
 async def verify_webhook(
     mode: Optional[str] = None,
     challenge: Optional[str] = None,
     verify_token: Optional[str] = None,
+    hub_mode: Optional[str] = Query(default=None, alias="hub.mode"),
+    hub_challenge: Optional[str] = Query(default=None, alias="hub.challenge"),
+    hub_verify_token: Optional[str] = Query(default=None, alias="hub.verify_token"),
 ):
     """
     Alguns provedores chamam este endpoint para verificar o webhook.
     Comparamos o verify_token com o WHATSAPP_VERIFY_TOKEN do .env.
+    A Meta manda os parâmetros com prefixo (hub.verify_token etc.).
     """
+    verify_token = hub_verify_token or verify_token
+    challenge = hub_challenge or challenge
     if verify_token != settings.whatsapp_verify_token:
         raise HTTPException(status_code=403, detail="Token de verificação inválido")
 
@@ -60,17 +146,36 @@ async def verify_webhook(
 
 @app.post("/webhook/whatsapp")
 async def receive_whatsapp_webhook(
-    payload: WhatsAppWebhook,
-    db=Depends(get_db),
+    request: Request,
+    db=Depends(get_async_db),
 ):
     """
     Endpoint que vai receber as mensagens do WhatsApp via webhook.
+    Aceita o envelope nativo da Cloud API (entry[].changes[].value) e o
+    formato simples {from, text, id}.
     Aqui já:
-    - extrai número e texto
-    - cria/recupera usuário
-    - cria/recupera sessão
-    - delega para a máquina de estados em process_message
+    - extrai número, texto e id da mensagem
+    - põe a mensagem na fila do número (ordem garantida por usuário)
+    - devolve a resposta já dada se o id for de uma reentrega
+    - responde do cache da conversa quando é só mais uma resposta de pergunta
+    - senão cria/recupera usuário e sessão e delega para a máquina de
+      estados em process_message
     """
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+
+    if eh_envelope_meta(body):
+        return await _receber_envelope_meta(body, db)
+
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=422, detail="O corpo deve ser um objeto JSON")
+    try:
+        payload = WhatsAppWebhook(**body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+
     # Converte o modelo em dict usando o alias "from"
     body = payload.dict(by_alias=True, exclude_none=True)
 
@@ -79,9 +184,165 @@ async def receive_whatsapp_webhook(
     if not number:
         return JSONResponse({"status": "ignored", "reason": "no number"})
 
-    user = get_or_create_user(db, number)
-    session = get_or_create_session(db, user)
+    # mensagens do mesmo número entram em fila e são aplicadas uma por vez
+    message_id = extract_message_id(body)
+    reply = await get_despachante().executar(
+        number, lambda: atender_mensagem_async(db, number, message, message_id)
+    )
+
+    return JSONResponse({"reply": reply})
+
+
+async def _receber_envelope_meta(body: dict, db):
+    """
+    Todas as mensagens do envelope juntas: um lote que segura a fila de
+    cada número envolvido, carrega usuários e sessões de uma vez e grava
+    numa transação só. Os status de entrega só são anotados.
+    """
+    mensagens, status = extrair_envelope_meta(body)
+    if status:
+        status_entrega.anotar(status)
+    if not mensagens:
+        return JSONResponse({"status": "ok", "replies": []})
+
+    numeros = list(dict.fromkeys(m.numero for m in mensagens))
+    replies = await get_despachante().executar_lote(numeros, lambda: atender_lote_async(db, mensagens))
+
+    corpo = {
+        "replies": [
+            {"from": m.numero, "id": m.message_id, "reply": reply}
+            for m, reply in zip(mensagens, replies)
+        ]
+    }
+    if any(reply is None for reply in replies):
+        # a Meta reentrega o envelope; o que já foi aplicado volta como duplicata
+        return JSONResponse({"status": "erro", **corpo}, status_code=500)
+    return JSONResponse({"status": "ok", **corpo})
+
+
+# Histogramas da população (por faixa de renda) e posição de um valor neles
+@app.get("/percentis")
+def consultar_percentis(
+    renda_faixa: Optional[str] = None,
+    metrica: Optional[str] = None,
+    valor: Optional[int] = None,
+    db=Depends(get_db),
+):
+    """
+    Sem `metrica`: os histogramas de todos os pilares e do total.
+    Com `metrica` e `valor`: em que "top X%" e percentil o valor fica.
+    Sem `renda_faixa`, compara com todos os participantes.
+    """
+    segmento = renda_faixa or percentis.SEGMENTO_TODOS
+    if metrica is None:
+        return {"renda_faixa": renda_faixa, "histogramas": percentis.histogramas(db, segmento)}
+    if metrica not in percentis.METRICAS:
+        raise HTTPException(status_code=404, detail="Métrica desconhecida")
+    if valor is None:
+        raise HTTPException(status_code=422, detail="Informe o valor")
+    histograma = percentis.histogramas(db, segmento)[metrica]
+    return {"renda_faixa": renda_faixa, "metrica": metrica, "valor": valor, **percentis.posicao(histograma, valor)}
+
 
-    reply = process_message(db, user, session, message)
+# Exportação em massa (CRM/BI), em streaming. Desligada sem EXPORTACAO_TOKEN.
+@app.get("/exportacao")
+def exportar_sessoes(
+    request: Request,
+    formato: str = "csv",
+    desde: Optional[datetime] = None,
+    incremental: Optional[str] = None,
+):
+    """
+    Sessões concluídas com contato, pilares e respostas abertas.
+    `desde` filtra por alteração; `incremental=<nome>` usa e avança a
+    marca gravada com esse nome (sincronização noturna só das diferenças).
+    """
+    token = request.headers.get("x-exportacao-token", "")
+    if not settings.exportacao_token or not hmac.compare_digest(token, settings.exportacao_token):
+        raise HTTPException(status_code=403, detail="Token de exportação inválido")
+    try:
+        exportacao.verificar_formato(formato)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
 
-    return JSONResponse({"reply": reply})
\ No newline at end of file
+    def blocos():
+        # sessão própria: vive enquanto a resposta está sendo enviada
+        db = SessionLocal()
+        try:
+            yield from exportacao.exportar(db, formato, desde=desde, incremental=incremental)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        blocos(),
+        media_type=exportacao.TIPOS_CONTEUDO[formato],
+        headers={"Content-Disposition": f'attachment; filename="sessoes.{formato}"'},
+    )
+
+
+# Download do PDF. A chave é o sha256 do conteúdo: o arquivo nunca muda,
+# então o ETag é a própria chave e o cache pode ser eterno.
+@app.get("/relatorios/{chave}")
+def download_relatorio(chave: str, request: Request):
+    if not chave_valida(chave):
+        raise HTTPException(status_code=404, detail="Relatório não encontrado")
+
+    store = get_relatorio_store()
+    tamanho = store.tamanho(chave)
+    if tamanho is None:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado")
+
+    headers = {
+        "ETag": f'"{chave}"',
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": 'inline; filename="relatorio.pdf"',
+    }
+    if f'"{chave}"' in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    intervalo = _intervalo_pedido(request.headers.get("range"), tamanho)
+    if intervalo is None:
+        headers["Content-Length"] = str(tamanho)
+        return StreamingResponse(store.iterar(chave), media_type="application/pdf", headers=headers)
+
+    inicio, fim = intervalo
+    headers["Content-Range"] = f"bytes {inicio}-{fim}/{tamanho}"
+    headers["Content-Length"] = str(fim - inicio + 1)
+    return StreamingResponse(
+        store.iterar(chave, inicio, fim),
+        status_code=206,
+        media_type="application/pdf",
+        headers=headers,
+    )
+
+
+def _intervalo_pedido(range_header: Optional[str], tamanho: int):
+    """
+    (inicio, fim) de um Range "bytes=a-b" / "bytes=a-" / "bytes=-n".
+    None para ausente, múltiplo ou malformado (resposta inteira); 416 se
+    estiver fora do arquivo.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    inicio, _, fim = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if inicio == "":
+            sufixo = int(fim)
+            if sufixo <= 0:
+                raise ValueError
+            inicio, fim = max(tamanho - sufixo, 0), tamanho - 1
+        else:
+            inicio = int(inicio)
+            fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    except ValueError:
+        return None
+    if inicio >= tamanho or inicio > fim:
+        raise HTTPException(
+            status_code=416,
+            detail="Intervalo inválido",
+            headers={"Content-Range": f"bytes */{tamanho}"},
+        )
+    return inicio, fim
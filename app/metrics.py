@@ -0,0 +1,264 @@
+# app/metrics.py
+"""
+Métricas em memória do processo (contadores, gauges e histogramas com labels).
+
+Etapas: `with metrics.etapa("pdf"):` cronometra um trecho no histograma
+etapa_segundos{etapa, estado}. O estado da conversa vem do label
+explícito ou do contexto (no_estado), para camadas que não conhecem a
+sessão (IA, render, envio). Se a requisição pediu rastro (iniciar_rastro),
+cada etapa também entra nele, e o webhook devolve a lista no header
+Server-Timing.
+
+exportar() gera o formato texto do Prometheus (/metrics no processo web;
+no worker, servir() abre uma porta só para isso).
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+# limites padrão em segundos (latências de ~1 ms a ~1 min)
+BUCKETS_PADRAO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# etapas vão de microssegundos (transição em memória) a dezenas de segundos (IA)
+BUCKETS_ETAPA = (0.00005, 0.0001, 0.00025, 0.0005) + BUCKETS_PADRAO
+_BUCKETS = {"etapa_segundos": BUCKETS_ETAPA}
+
+_lock = threading.Lock()
+
+
+class Histograma:
+    def __init__(self, buckets=BUCKETS_PADRAO):
+        self.buckets = tuple(buckets)
+        self.contagens = [0] * (len(self.buckets) + 1)  # último = +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.contagens[bisect.bisect_left(self.buckets, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def quantil(self, q: float) -> float:
+        """Aproximação pelo limite superior do bucket."""
+        if not self.total:
+            return 0.0
+        alvo = q * self.total
+        acumulado = 0
+        for i, n in enumerate(self.contagens):
+            acumulado += n
+            if acumulado >= alvo:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+_histogramas = {}
+_contadores = {}
+_gauges = {}
+
+
+def _chave(nome, labels):
+    return nome, tuple(sorted(labels.items()))
+
+
+def _histograma(nome, labels) -> Histograma:
+    chave = _chave(nome, labels)
+    with _lock:
+        h = _histogramas.get(chave)
+        if h is None:
+            h = _histogramas[chave] = Histograma(_BUCKETS.get(nome, BUCKETS_PADRAO))
+        return h
+
+
+def observar(nome: str, valor: float, **labels):
+    h = _histograma(nome, labels)
+    with _lock:
+        h.observar(valor)
+
+
+def incrementar(nome: str, valor: float = 1, **labels):
+    chave = _chave(nome, labels)
+    with _lock:
+        _contadores[chave] = _contadores.get(chave, 0) + valor
+
+
+def definir(nome: str, valor: float, **labels):
+    """Gauge: guarda o valor atual (ex.: tamanho de fila)."""
+    chave = _chave(nome, labels)
+    with _lock:
+        _gauges[chave] = valor
+
+
+def histograma(nome: str, **labels):
+    return _histogramas.get(_chave(nome, labels))
+
+
+def contador(nome: str, **labels) -> float:
+    return _contadores.get(_chave(nome, labels), 0)
+
+
+def gauge(nome: str, **labels) -> float:
+    return _gauges.get(_chave(nome, labels), 0)
+
+
+# ------------------------------------------------------------
+#   ETAPAS E RASTRO POR REQUISIÇÃO
+# ------------------------------------------------------------
+_estado = contextvars.ContextVar("metrics_estado", default="")
+_rastro = contextvars.ContextVar("metrics_rastro", default=None)
+# atalho (etapa, estado, labels na ordem da chamada) -> histograma, sem
+# montar e ordenar a chave a cada medida: a transição em memória leva ~1 µs
+_por_etapa = {}
+
+
+def registrar_etapa(nome: str, duracao: float, estado: str = None, **labels):
+    """Para durações já medidas (ex.: chamada da IA com resultado no label)."""
+    if estado is None:
+        estado = _estado.get()
+    atalho = (nome, estado, *labels.items())
+    h = _por_etapa.get(atalho)
+    if h is None:
+        h = _por_etapa[atalho] = _histograma("etapa_segundos", dict(labels, etapa=nome, estado=estado))
+    with _lock:
+        h.observar(duracao)
+    rastro = _rastro.get()
+    if rastro is not None:
+        rastro.append((nome, duracao, " ".join(filter(None, (estado, *labels.values())))))
+
+
+class etapa:
+    """
+    Cronômetro de um trecho (sync ou async, usado com `with`). O estado pode
+    ser definido dentro do bloco, quando só se sabe depois: `e.estado = ...`.
+    """
+    __slots__ = ("nome", "estado", "labels", "inicio")
+
+    def __init__(self, nome: str, estado: str = None, **labels):
+        self.nome = nome
+        self.estado = estado
+        self.labels = labels
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registrar_etapa(self.nome, time.perf_counter() - self.inicio, self.estado, **self.labels)
+        return False
+
+
+class no_estado:
+    """Etapas dentro do bloco (mesma thread/tarefa e o que ela criar) levam este estado."""
+    __slots__ = ("estado", "token")
+
+    def __init__(self, estado: str):
+        self.estado = estado
+
+    def __enter__(self):
+        self.token = _estado.set(self.estado or "")
+        return self
+
+    def __exit__(self, *exc):
+        _estado.reset(self.token)
+        return False
+
+
+def iniciar_rastro():
+    """Liga o rastro no contexto atual. Devolve (lista de etapas, token)."""
+    rastro = []
+    return rastro, _rastro.set(rastro)
+
+
+def encerrar_rastro(token):
+    _rastro.reset(token)
+
+
+def server_timing(rastro: list) -> str:
+    """Header Server-Timing: `etapa;dur=ms;desc="estado labels"`, na ordem em que terminaram."""
+    partes = []
+    for nome, duracao, descricao in rastro:
+        parte = f"{nome};dur={duracao * 1000:.3f}"
+        if descricao:
+            parte += f';desc="{descricao}"'
+        partes.append(parte)
+    return ", ".join(partes)
+
+
+# ------------------------------------------------------------
+#   EXPORTAÇÃO (formato texto do Prometheus)
+# ------------------------------------------------------------
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pares, extra=()) -> str:
+    itens = list(extra) + list(pares)
+    if not itens:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in itens) + "}"
+
+
+def _numero(valor) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def exportar() -> str:
+    with _lock:
+        contadores = sorted(_contadores.items())
+        gauges = sorted(_gauges.items())
+        histogramas = sorted(
+            ((chave, h.buckets, list(h.contagens), h.soma, h.total) for chave, h in _histogramas.items()),
+            key=lambda x: x[0],
+        )
+
+    linhas = []
+    tipos = set()
+
+    def tipo(nome, t):
+        if nome not in tipos:
+            tipos.add(nome)
+            linhas.append(f"# TYPE {nome} {t}")
+
+    for (nome, pares), valor in contadores:
+        tipo(nome, "counter")
+        linhas.append(f"{nome}{_labels(pares)} {_numero(valor)}")
+    for (nome, pares), valor in gauges:
+        tipo(nome, "gauge")
+        linhas.append(f"{nome}{_labels(pares)} {_numero(valor)}")
+    for (nome, pares), buckets, contagens, soma, total in histogramas:
+        tipo(nome, "histogram")
+        acumulado = 0
+        for limite, n in zip(buckets + (float("inf"),), contagens):
+            acumulado += n
+            linhas.append(f"{nome}_bucket{_labels(pares, [('le', _numero(limite))])} {acumulado}")
+        linhas.append(f"{nome}_sum{_labels(pares)} {_numero(soma)}")
+        linhas.append(f"{nome}_count{_labels(pares)} {total}")
+    return "\n".join(linhas) + "\n"
+
+
+def servir(porta: int, host: str = "0.0.0.0"):
+    """/metrics numa thread daemon (processos sem servidor HTTP, como o worker)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            corpo = exportar().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", TIPO_CONTEUDO)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, porta), Handler)
+    threading.Thread(target=servidor.serve_forever, name=f"metrics-{porta}", daemon=True).start()
+    return servidor
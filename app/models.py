@@ -10,6 +10,10 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     Text,
+    text,
+    LargeBinary,
+    Index,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
 
@@ -18,9 +22,13 @@ from app.db import Base
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # alvo do INSERT ... ON CONFLICT em get_or_create_user
+        Index("uq_users_whatsapp_number", "whatsapp_number", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    whatsapp_number = Column(String(50), index=True, nullable=False)
+    whatsapp_number = Column(String(50), nullable=False)
     nome = Column(String(255), nullable=True)
     instagram = Column(String(255), nullable=True)
     renda_faixa = Column(String(50), nullable=True)
@@ -34,12 +42,25 @@ class User(Base):
 
 class ScoreSession(Base):
     __tablename__ = "score_sessions"
+    __table_args__ = (
+        # no máximo uma sessão em andamento por usuário (alvo do upsert em
+        # get_or_create_session e índice da busca feita a cada mensagem)
+        Index(
+            "uq_score_sessions_user_em_andamento", "user_id", unique=True,
+            postgresql_where=text("status = 'em_andamento'"),
+            sqlite_where=text("status = 'em_andamento'"),
+        ),
+        # último relatório concluído do usuário (pedido de reenvio)
+        Index("ix_score_sessions_user_status", "user_id", "status", "completed_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
     status = Column(String(30), default="em_andamento")  # em_andamento, concluida, abandonada
     estado_atual = Column(String(50), nullable=True)
+    # versão do questionário em que a sessão começou (app.services.questionario); NULL = v1
+    questionario_versao = Column(String(20), nullable=True)
 
     perfil_nome = Column(String(50), nullable=True)
     score_total = Column(Integer, nullable=True)
@@ -47,6 +68,11 @@ class ScoreSession(Base):
     pilar_toxico = Column(String(50), nullable=True)
     renda_qualificada = Column(Boolean, default=False)
     pdf_url = Column(Text, nullable=True)
+    # sha256 do PDF no relatorio_store (pdf_url é o link de download)
+    pdf_hash = Column(String(64), nullable=True)
+    # PDF já enviado ao endpoint de mídia do WhatsApp (reaproveitado nos reenvios)
+    media_id = Column(String(100), nullable=True)
+    media_expira_em = Column(DateTime, nullable=True)
 
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(
@@ -54,6 +80,22 @@ class ScoreSession(Base):
     )
     completed_at = Column(DateTime, nullable=True)
 
+    # Status do relatório gerado em background: pendente, processando, pronto, falhou
+    relatorio_status = Column(String(20), nullable=True)
+
+    # Respostas 1 a N (até 30) empacotadas (1 byte por pergunta, 0 = sem resposta) e
+    # soma corrente de cada pilar na ordem de PILARES (app.services.respostas)
+    respostas = Column(LargeBinary(30), nullable=True)
+    soma_pilares = Column(LargeBinary(10), nullable=True)
+
+    # Parágrafos da interpretação já mandados na conversa (streaming); o
+    # retry do job reaproveita em vez de mandar outra leitura
+    interpretacao_enviada = Column(Text, nullable=True)
+
+    # Resultado previsto antes da pergunta 30 (perfil|pilar_forte|pilar_toxico)
+    especulacao_chave = Column(String(255), nullable=True)
+    especulado_em = Column(DateTime, nullable=True)
+
     user = relationship("User", back_populates="score_sessions")
     answers = relationship(
         "ScoreAnswer", back_populates="session", cascade="all, delete-orphan"
@@ -64,9 +106,18 @@ class ScoreSession(Base):
     pillars = relationship(
         "ScorePillars", back_populates="session", uselist=False, cascade="all, delete-orphan"
     )
+    jobs = relationship(
+        "ScoreJob", back_populates="session", cascade="all, delete-orphan"
+    )
 
 
 class ScoreAnswer(Base):
+    """
+    Formato antigo (uma linha por resposta). Respostas novas vão para
+    ScoreSession.respostas; depois de `python -m app.cli compactar-respostas`
+    score_answers vira uma view de leitura sobre a coluna compacta.
+    """
+
     __tablename__ = "score_answers"
 
     id = Column(Integer, primary_key=True, index=True)
@@ -100,7 +151,8 @@ class ScorePillars(Base):
     __tablename__ = "score_pillars"
 
     id = Column(Integer, primary_key=True, index=True)
-    score_session_id = Column(Integer, ForeignKey("score_sessions.id"), nullable=False)
+    # UPDATE por sessão do re-score em lote (app.services.score_lote)
+    score_session_id = Column(Integer, ForeignKey("score_sessions.id"), nullable=False, index=True)
 
     tempo = Column(Integer, nullable=True)
     familia = Column(Integer, nullable=True)
@@ -113,4 +165,119 @@ class ScorePillars(Base):
     aprendizado = Column(Integer, nullable=True)
     risco_medo = Column(Integer, nullable=True)
 
-    session = relationship("ScoreSession", back_populates="pillars")
\ No newline at end of file
+    session = relationship("ScoreSession", back_populates="pillars")
+
+
+class ScoreJob(Base):
+    """Fila de trabalhos pesados (IA, PDF, envio) processados pelo app.worker."""
+
+    __tablename__ = "score_jobs"
+    __table_args__ = (
+        Index("ix_score_jobs_status_disponivel_em", "status", "disponivel_em"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    score_session_id = Column(Integer, ForeignKey("score_sessions.id"), nullable=False, index=True)
+
+    tipo = Column(String(30), nullable=False, default="finalizar_score")
+    prioridade = Column(Integer, nullable=False, default=0)  # menor sai antes
+    status = Column(String(20), nullable=False, default="pendente")  # pendente, executando, concluido, falhou
+    tentativas = Column(Integer, nullable=False, default=0)
+    max_tentativas = Column(Integer, nullable=False, default=5)
+    erro = Column(Text, nullable=True)
+
+    disponivel_em = Column(DateTime, default=datetime.utcnow)  # próxima execução (backoff)
+    iniciado_em = Column(DateTime, nullable=True)               # lease: renovado enquanto executa
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    session = relationship("ScoreSession", back_populates="jobs")
+
+
+class ScoreTextoCache(Base):
+    """Textos gerados pela IA, reaproveitados entre sessões (app.services.llm_cache)."""
+
+    __tablename__ = "score_texto_cache"
+    __table_args__ = (
+        UniqueConstraint("tipo", "chave", "versao", "variante", name="uq_score_texto_cache_variante"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    tipo = Column(String(30), nullable=False)      # interpretacao, convite
+    chave = Column(String(255), nullable=False)    # perfil|pilar_forte|pilar_toxico
+    versao = Column(String(20), nullable=False)    # hash do prompt + modelo
+    variante = Column(Integer, nullable=False, default=0)
+    texto = Column(Text, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expira_em = Column(DateTime, nullable=True)
+
+
+class ScoreHistograma(Base):
+    """
+    Quantas sessões concluídas tiveram cada valor de cada pilar e do total,
+    por faixa de renda (app.services.percentis). Atualizada na mesma
+    transação que conclui a sessão.
+    """
+
+    __tablename__ = "score_histogramas"
+    __table_args__ = (
+        UniqueConstraint("segmento", "metrica", "valor", name="uq_score_histogramas_valor"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    segmento = Column(String(50), nullable=False)  # renda_faixa do usuário; "" = todos
+    metrica = Column(String(30), nullable=False)   # pilar (tempo, familia...) ou "total"
+    valor = Column(Integer, nullable=False)
+    contagem = Column(Integer, nullable=False, default=0)
+
+
+class ExportacaoMarca(Base):
+    """Até onde cada exportação incremental já foi (app.services.exportacao)."""
+
+    __tablename__ = "exportacao_marcas"
+
+    nome = Column(String(50), primary_key=True)  # ex.: "crm", "bi"
+    marca = Column(DateTime, nullable=False)     # maior updated_at que a última exportação concluída levou
+    linhas = Column(Integer, nullable=False, default=0)  # linhas que ela levou
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class WebhookMensagem(Base):
+    """Mensagens do webhook já processadas, para ignorar reentregas (app.services.idempotencia)."""
+
+    __tablename__ = "webhook_mensagens"
+    __table_args__ = (
+        UniqueConstraint("message_id", name="uq_webhook_mensagens_message_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    message_id = Column(String(128), nullable=False)  # id da mensagem no provedor (wamid...)
+    whatsapp_number = Column(String(50), nullable=True)
+    resposta = Column(Text, nullable=True)  # devolvida de novo em cada reentrega
+
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # compactação por idade
+
+
+class WebhookStatus(Base):
+    """
+    Status de entrega das mensagens enviadas (sent, delivered, read,
+    failed), como chegam no webhook. Só recebe INSERT em lote
+    (app.services.status_entrega); ninguém atualiza nem consulta no caminho
+    do webhook.
+    """
+
+    __tablename__ = "webhook_status"
+
+    id = Column(Integer, primary_key=True)
+    message_id = Column(String(128), nullable=True)  # id da mensagem que enviamos (wamid...)
+    whatsapp_number = Column(String(50), nullable=True)  # recipient_id
+    status = Column(String(20), nullable=False)
+    erro = Column(Text, nullable=True)  # errors[] do status failed, como veio
+    ocorrido_em = Column(DateTime, nullable=True)  # timestamp do provedor
+
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # compactação por idade
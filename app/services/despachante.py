@@ -0,0 +1,235 @@
+# app/services/despachante.py
+"""
+Ordem das mensagens por número.
+
+A máquina de estados lê estado_atual, muda e grava sem lock: duas
+mensagens do mesmo número processadas ao mesmo tempo podem cair as duas
+em PERGUNTA_n. Aqui cada número tem a sua fila, consumida por uma única
+tarefa: criada na primeira mensagem e descartada quando esvazia. As
+mensagens de um usuário são aplicadas uma por vez, na ordem de chegada,
+e usuários diferentes nunca esperam um pelo outro (nem pela resposta da
+Graph API que o outro está enviando).
+
+As filas só ordenam dentro do processo. Com vários processos web em
+PostgreSQL, ORDEM_LOCK_BANCO=true segura também um advisory lock por
+número durante o processamento. Os locks usam um pool de conexões
+próprio, então nunca disputam conexão com as sessões do webhook.
+
+Um envelope da Meta com mensagens de vários números (executar_lote)
+ocupa a fila de cada um deles: uma barreira entra em todas as filas
+envolvidas de uma vez, e o lote roda quando todas chegaram a ela. Como
+as barreiras entram sem await no meio, dois lotes ficam na mesma ordem
+em todas as filas e não há espera circular.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+import contextvars
+import hashlib
+import time
+from typing import Awaitable, Callable, Optional
+import weakref
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import metrics
+from app.config import settings
+from app.db import ASYNC_DATABASE_URL
+
+
+def chave_lock(numero: str) -> int:
+    """Chave bigint do advisory lock (com sinal, como o PostgreSQL espera)."""
+    return int.from_bytes(hashlib.blake2b(numero.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+# ------------------------------------------------------------
+#   ADVISORY LOCK (vários processos web)
+# ------------------------------------------------------------
+_engine_locks = None
+
+
+def _get_engine_locks():
+    global _engine_locks
+    if _engine_locks is None:
+        if not ASYNC_DATABASE_URL.startswith("postgresql"):
+            raise RuntimeError("ORDEM_LOCK_BANCO=true exige PostgreSQL")
+        # uma conexão por número em processamento, no máximo o pool do webhook
+        _engine_locks = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=settings.db_pool_tamanho,
+            max_overflow=settings.db_pool_extra,
+            pool_pre_ping=settings.db_pool_pre_ping,
+        )
+    return _engine_locks
+
+
+@asynccontextmanager
+async def locks_dos_numeros(numeros):
+    if not settings.ordem_lock_banco:
+        yield
+        return
+    # sempre na mesma ordem: dois lotes com números em comum não se travam
+    chaves = sorted({chave_lock(n) for n in numeros})
+    async with _get_engine_locks().connect() as conn:
+        # autocommit: o lock é da conexão, sem transação aberta durante o processamento
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        obtidas = []
+        try:
+            for chave in chaves:
+                await conn.execute(text("SELECT pg_advisory_lock(:chave)"), {"chave": chave})
+                obtidas.append(chave)
+            yield
+        finally:
+            for chave in reversed(obtidas):
+                await conn.execute(text("SELECT pg_advisory_unlock(:chave)"), {"chave": chave})
+
+
+# ------------------------------------------------------------
+#   FILAS POR NÚMERO
+# ------------------------------------------------------------
+class Despachante:
+    def __init__(self, ativo: bool = True):
+        self.ativo = ativo
+        self._por_loop = weakref.WeakKeyDictionary()
+        self._pendentes = 0
+
+    def _estado(self) -> dict:
+        loop = asyncio.get_running_loop()
+        estado = self._por_loop.get(loop)
+        if estado is None:
+            estado = self._por_loop[loop] = {"filas": {}, "tarefas": set()}
+        return estado
+
+    def _enfileirar(self, estado, numero: str, item):
+        filas = estado["filas"]
+        fila = filas.get(numero)
+        if fila is None:
+            fila = filas[numero] = asyncio.Queue()
+            tarefa = asyncio.create_task(self._consumir(filas, numero, fila))
+            estado["tarefas"].add(tarefa)
+            tarefa.add_done_callback(estado["tarefas"].discard)
+        fila.put_nowait(item)
+        self._pendentes += 1
+
+    async def executar(self, numero: str, trabalho: Callable[[], Awaitable]):
+        """Roda `trabalho` na fila do número, depois das mensagens anteriores dele."""
+        return await self.executar_lote([numero], trabalho)
+
+    async def executar_lote(self, numeros, trabalho: Callable[[], Awaitable]):
+        """
+        Roda `trabalho` uma vez só, com a fila de todos os números presa:
+        depois das mensagens anteriores de cada um e antes das seguintes.
+        """
+        async def com_locks():
+            async with locks_dos_numeros(numeros):
+                return await trabalho()
+
+        if not self.ativo:
+            return await com_locks()
+
+        # o trabalho roda na tarefa da fila: leva junto o contexto de quem
+        # pediu (contextvars: rastro da requisição, estado das métricas)
+        contexto = contextvars.copy_context()
+
+        async def no_contexto():
+            return await contexto.run(asyncio.ensure_future, com_locks())
+
+        estado = self._estado()
+        distintos = sorted(set(numeros))
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        enfileirado_em = time.perf_counter()
+        if len(distintos) == 1:
+            self._enfileirar(estado, distintos[0], (no_contexto, futuro, enfileirado_em))
+        else:
+            barreira = _Barreira(len(distintos), no_contexto, futuro)
+            for numero in distintos:
+                self._enfileirar(estado, numero, (barreira.chegar, loop.create_future(), enfileirado_em))
+        metrics.definir("despachante_fila_tamanho", self._pendentes)
+        metrics.definir("despachante_numeros_ativos", len(estado["filas"]))
+        return await futuro
+
+    async def _consumir(self, filas: dict, numero: str, fila: asyncio.Queue):
+        # a tarefa nasce com um item na fila e termina quando ela esvazia; o
+        # teste e a remoção não têm await no meio, então um item novo ou cai
+        # nesta fila antes do teste ou numa fila nova depois da remoção
+        try:
+            while True:
+                trabalho, futuro, enfileirado_em = fila.get_nowait()
+                self._pendentes -= 1
+                metrics.observar("despachante_espera_segundos", time.perf_counter() - enfileirado_em)
+                try:
+                    resultado = await trabalho()
+                except Exception as e:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                else:
+                    if not futuro.done():
+                        futuro.set_result(resultado)
+                if fila.empty():
+                    return
+        finally:
+            if filas.get(numero) is fila:
+                del filas[numero]
+            self._pendentes -= fila.qsize()
+
+    def tamanho_filas(self) -> int:
+        return self._pendentes
+
+    async def fechar(self):
+        estado = self._por_loop.pop(asyncio.get_running_loop(), None)
+        if estado is not None:
+            for tarefa in list(estado["tarefas"]):
+                tarefa.cancel()
+
+
+class _Barreira:
+    """
+    Junta as filas de um lote: cada fila que chega fica parada; a última
+    roda o trabalho e solta as outras.
+    """
+
+    def __init__(self, filas: int, trabalho, futuro):
+        self.faltam = filas
+        self.trabalho = trabalho
+        self.futuro = futuro
+        self.liberada = asyncio.Event()
+
+    async def chegar(self):
+        self.faltam -= 1
+        if self.faltam > 0:
+            await self.liberada.wait()
+            return
+        try:
+            resultado = await self.trabalho()
+        except Exception as e:
+            if not self.futuro.done():
+                self.futuro.set_exception(e)
+        else:
+            if not self.futuro.done():
+                self.futuro.set_result(resultado)
+        finally:
+            self.liberada.set()
+
+
+# ------------------------------------------------------------
+#   INSTÂNCIA COMPARTILHADA
+# ------------------------------------------------------------
+_despachante: Optional[Despachante] = None
+
+
+def get_despachante() -> Despachante:
+    global _despachante
+    if _despachante is None:
+        _despachante = Despachante(settings.ordem_por_numero)
+    return _despachante
+
+
+async def fechar_despachante():
+    global _despachante, _engine_locks
+    if _despachante is not None:
+        await _despachante.fechar()
+        _despachante = None
+    if _engine_locks is not None:
+        await _engine_locks.dispose()
+        _engine_locks = None
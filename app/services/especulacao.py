@@ -0,0 +1,177 @@
+# app/services/especulacao.py
+"""
+Pré-cálculo especulativo do relatório.
+
+A cada resposta, calcula o mínimo e o máximo que cada pilar ainda pode
+atingir (perguntas em aberto valem de 1 a 5). Quando perfil, pilar forte e
+pilar tóxico não podem mais mudar, seja qual for o resto das respostas,
+um job de baixa prioridade já gera os textos da IA para essa combinação.
+Na pergunta 30 eles saem do cache, sem esperar a OpenAI.
+
+O gráfico e a lista de pilares dependem das somas exatas, então só são
+desenhados na finalização.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import metrics
+from app.config import settings
+from app.models import ScoreSession
+from app.services.questionario import PILARES, VERSAO_LEGADO, get_questionario, questionario_da_sessao
+from app.services.respostas import respostas_da_sessao
+
+
+# ------------------------------------------------------------
+#   LIMITES POR PILAR
+# ------------------------------------------------------------
+def limites_pilares(respostas: dict, pilar_map: dict, pilares, escala=(1, 5)) -> dict:
+    """respostas: {numero_pergunta: valor}. Devolve {pilar: (minimo, maximo)}."""
+    resposta_min, resposta_max = escala
+    limites = {p: [0, 0] for p in pilares}
+    for n, pilar in pilar_map.items():
+        valor = respostas.get(n)
+        if valor is None:
+            limites[pilar][0] += resposta_min
+            limites[pilar][1] += resposta_max
+        else:
+            limites[pilar][0] += valor
+            limites[pilar][1] += valor
+    return {p: tuple(v) for p, v in limites.items()}
+
+
+def _forte_decidido(limites: dict, pilares):
+    # max() devolve o primeiro em caso de empate: a ordem dos pilares desempata
+    for i, a in enumerate(pilares):
+        min_a = limites[a][0]
+        if all(
+            min_a > limites[b][1] or (min_a == limites[b][1] and i < j)
+            for j, b in enumerate(pilares) if b != a
+        ):
+            return a
+    return None
+
+
+def _toxico_decidido(limites: dict, pilares):
+    for i, a in enumerate(pilares):
+        max_a = limites[a][1]
+        if all(
+            max_a < limites[b][0] or (max_a == limites[b][0] and i < j)
+            for j, b in enumerate(pilares) if b != a
+        ):
+            return a
+    return None
+
+
+def resultado_decidido(respostas: dict, questionario=None):
+    """(perfil, pilar_forte, pilar_toxico) se já estiver garantido, senão None."""
+    questionario = questionario or get_questionario(VERSAO_LEGADO)
+    limites = limites_pilares(respostas, questionario.pilar_map, PILARES, questionario.escala)
+
+    perfil_min = questionario.determinar_perfil(sum(v[0] for v in limites.values()))
+    perfil_max = questionario.determinar_perfil(sum(v[1] for v in limites.values()))
+    if perfil_min != perfil_max:
+        return None
+
+    forte = _forte_decidido(limites, PILARES)
+    toxico = _toxico_decidido(limites, PILARES)
+    if forte is None or toxico is None:
+        return None
+    return perfil_min, forte, toxico
+
+
+# ------------------------------------------------------------
+#   INTEGRAÇÃO COM A CONVERSA E A FILA
+# ------------------------------------------------------------
+def _chave(resultado) -> str:
+    return "|".join(resultado)
+
+
+def resultado_a_especular(session, n: int):
+    """
+    Resultado que a resposta da pergunta n acabou de decidir, se a sessão
+    ainda não especulou; senão None. Aceita ScoreSession ou o estado em
+    cache da conversa (mesmos atributos).
+    """
+    if not settings.especulacao_ativa or session.especulacao_chave is not None:
+        return None
+    questionario = questionario_da_sessao(session)
+    if n < settings.especulacao_a_partir_pergunta or n >= questionario.num_perguntas:
+        return None
+
+    # a resposta atual já está na coluna compacta (registrar_resposta)
+    return resultado_decidido(respostas_da_sessao(session), questionario)
+
+
+def verificar_especulacao(db: Session, session: ScoreSession, n: int):
+    """
+    Chamado a cada resposta (n = pergunta que acabou de ser respondida).
+    Enfileira a especulação uma única vez por sessão, quando o resultado
+    fica decidido. Não faz commit.
+    """
+    resultado = resultado_a_especular(session, n)
+    if resultado is None:
+        return
+
+    # import tardio: jobs importa whatsapp_logic, que importa este módulo
+    from app.services.jobs import enfileirar_job
+
+    session.especulacao_chave = _chave(resultado)
+    session.especulado_em = datetime.utcnow()
+    enfileirar_job(db, session, "especular_relatorio")
+    metrics.incrementar("especulacao_iniciada_total", pergunta=str(n))
+
+
+def executar_especulacao(session: ScoreSession):
+    """Corpo do job: gera (ou encontra no cache) os textos da combinação prevista."""
+    from app.services.gpt_logic import montar_textos_relatorio
+    from app.services.loop_async import rodar
+
+    perfil, forte, toxico = session.especulacao_chave.split("|")
+    rodar(montar_textos_relatorio(perfil, forte, toxico))
+
+
+def registrar_resultado(session: ScoreSession, perfil, pilar_forte, pilar_toxico):
+    """Na finalização: contabiliza se a especulação (se houve) acertou."""
+    if session.especulacao_chave is None:
+        metrics.incrementar("especulacao_sem_previsao_total")
+    elif session.especulacao_chave == _chave((perfil, pilar_forte, pilar_toxico)):
+        metrics.incrementar("especulacao_acerto_total")
+    else:
+        metrics.incrementar("especulacao_erro_total")
+
+
+def estatisticas(db: Session) -> dict:
+    """
+    Acerto e desperdício a partir do banco (vale para todos os processos).
+    Desperdício = especulação de sessão que terminou em outra combinação ou
+    que ficou parada mais que ESPECULACAO_ABANDONO_HORAS sem concluir.
+    """
+    especulada = ScoreSession.especulacao_chave.isnot(None)
+    concluida = ScoreSession.status == "concluida"
+    chave_final = (
+        ScoreSession.perfil_nome + "|" + ScoreSession.pilar_dominante + "|" + ScoreSession.pilar_toxico
+    )
+    limite_abandono = datetime.utcnow() - timedelta(hours=settings.especulacao_abandono_horas)
+
+    def contar(*filtros):
+        return db.query(func.count(ScoreSession.id)).filter(*filtros).scalar()
+
+    especuladas = contar(especulada)
+    concluidas = contar(concluida)
+    acertos = contar(especulada, concluida, ScoreSession.especulacao_chave == chave_final)
+    erros = contar(especulada, concluida, ScoreSession.especulacao_chave != chave_final)
+    abandonadas = contar(especulada, ScoreSession.status != "concluida", ScoreSession.updated_at < limite_abandono)
+
+    return {
+        "especuladas": especuladas,
+        "concluidas": concluidas,
+        "acertos": acertos,
+        "erros": erros,
+        "abandonadas": abandonadas,
+        # fração das sessões concluídas que já tinham os textos prontos
+        "taxa_acerto": acertos / concluidas if concluidas else 0.0,
+        # fração das especulações que não serviram para nada
+        "taxa_desperdicio": (erros + abandonadas) / especuladas if especuladas else 0.0,
+    }
@@ -0,0 +1,374 @@
+# app/services/estado_conversa.py
+"""
+Estado da conversa em cache, com escrita adiada (write-behind).
+
+Durante as 30 perguntas cada toque de 1 a 5 só muda três campos da sessão
+(estado_atual, respostas, soma_pilares). Com a sessão no cache o webhook
+responde sem ir ao banco: o estado muda em memória, fica marcado como
+sujo e o flusher (app.services.flusher) grava os sujos em lote (várias
+respostas da mesma sessão viram um UPDATE só).
+
+Política de durabilidade: só respostas de pergunta passam pelo cache.
+Qualquer outra transição (nome, Instagram, renda, pergunta 30, especulação,
+pedido de reenvio) segue pelo banco, e antes dela o estado daquele número
+é gravado e sai do cache. Um crash perde no máximo as respostas do último
+ESTADO_FLUSH_INTERVALO_SEGUNDOS.
+
+Os ids das mensagens aplicadas no cache (app.services.idempotencia) vão
+no estado e entram em webhook_mensagens na mesma transação do UPDATE:
+estado gravado sem o id deixaria uma reentrega ser aplicada de novo.
+
+Cada estado leva o instante da última alteração, gravado em updated_at.
+O UPDATE só vale se o banco não tiver algo mais novo, então uma gravação
+atrasada (outro flusher, outro processo) nunca volta a conversa para trás.
+
+Backends (ESTADO_BACKEND):
+
+- "memoria": dict do processo (padrão). Serve com um processo web só ou
+  com roteamento fixo por número.
+- "redis": compartilhado entre processos, via redis-py (ou o fake de
+  benchmarks/stub_redis.py). A ociosidade vira TTL da chave.
+"""
+from abc import ABC, abstractmethod
+import copy
+from datetime import datetime
+import json
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import bindparam, or_, update
+
+from app import metrics
+from app.config import settings
+from app.db import SessionLocal
+from app.models import ScoreSession
+from app.services import idempotencia
+
+
+class EstadoConversa:
+    """
+    O pedaço da sessão que as perguntas alteram. Os nomes dos atributos
+    são os mesmos da ScoreSession, então registrar_resposta e a
+    especulação funcionam com os dois.
+    """
+
+    __slots__ = ("numero", "session_id", "estado_atual", "questionario_versao", "respostas",
+                 "soma_pilares", "especulacao_chave", "alterado_em", "usado_em", "mensagens")
+
+    def __init__(self, numero, session_id, estado_atual, respostas=None, soma_pilares=None,
+                 especulacao_chave=None, alterado_em=None, questionario_versao=None, mensagens=None):
+        self.numero = numero
+        self.session_id = session_id
+        self.estado_atual = estado_atual
+        self.questionario_versao = questionario_versao
+        self.respostas = respostas
+        self.soma_pilares = soma_pilares
+        self.especulacao_chave = especulacao_chave
+        self.alterado_em = alterado_em or datetime.utcnow()
+        self.usado_em = time.monotonic()
+        # [message_id, resposta] aplicadas desde o último flush
+        self.mensagens = mensagens or []
+
+    @classmethod
+    def da_sessao(cls, numero: str, session: ScoreSession) -> "EstadoConversa":
+        return cls(
+            numero=numero,
+            session_id=session.id,
+            estado_atual=session.estado_atual,
+            respostas=session.respostas,
+            soma_pilares=session.soma_pilares,
+            especulacao_chave=session.especulacao_chave,
+            alterado_em=session.updated_at,
+            questionario_versao=session.questionario_versao,
+        )
+
+    def para_json(self) -> str:
+        return json.dumps({
+            "numero": self.numero,
+            "session_id": self.session_id,
+            "estado_atual": self.estado_atual,
+            "respostas": self.respostas.hex() if self.respostas else None,
+            "soma_pilares": self.soma_pilares.hex() if self.soma_pilares else None,
+            "especulacao_chave": self.especulacao_chave,
+            "alterado_em": self.alterado_em.isoformat(),
+            "questionario_versao": self.questionario_versao,
+            "mensagens": self.mensagens,
+        })
+
+    @classmethod
+    def de_json(cls, dados) -> "EstadoConversa":
+        d = json.loads(dados)
+        return cls(
+            numero=d["numero"],
+            session_id=d["session_id"],
+            estado_atual=d["estado_atual"],
+            respostas=bytes.fromhex(d["respostas"]) if d["respostas"] else None,
+            soma_pilares=bytes.fromhex(d["soma_pilares"]) if d["soma_pilares"] else None,
+            especulacao_chave=d["especulacao_chave"],
+            alterado_em=datetime.fromisoformat(d["alterado_em"]),
+            questionario_versao=d.get("questionario_versao"),
+            mensagens=d.get("mensagens"),
+        )
+
+
+class EstadoStore(ABC):
+    """Interface comum dos backends."""
+
+    @abstractmethod
+    def ler(self, numero: str) -> Optional[EstadoConversa]:
+        """Cópia do estado (pode ser alterada à vontade) ou None."""
+
+    @abstractmethod
+    def salvar(self, estado: EstadoConversa, sujo: bool = True):
+        """Guarda o estado; sujo = ainda precisa ir para o banco."""
+
+    @abstractmethod
+    def remover(self, numero: str) -> Optional[EstadoConversa]:
+        """Tira o número do cache e devolve o último estado, se havia."""
+
+    @abstractmethod
+    def retirar_sujos(self, limite: int) -> list:
+        """Até `limite` estados sujos, já marcados como limpos."""
+
+    def marcar_sujos(self, estados):
+        """Devolve à fila estados cuja gravação falhou (sem apagar um mais novo)."""
+        for estado in estados:
+            atual = self.ler(estado.numero)
+            if atual is None:
+                self.salvar(estado, sujo=True)
+                continue
+            # os ids que não foram gravados voltam junto com o estado mais novo
+            atual.mensagens = estado.mensagens + [m for m in atual.mensagens if m not in estado.mensagens]
+            self.salvar(atual, sujo=True)
+
+    def retirar_ociosos(self, ocioso_segundos: float) -> list:
+        """Tira do cache e devolve os estados parados há mais que o limite."""
+        return []
+
+    def __len__(self):
+        """Itens guardados no processo (0 quando o cache é externo)."""
+        return 0
+
+
+# ------------------------------------------------------------
+#   MEMÓRIA DO PROCESSO
+# ------------------------------------------------------------
+class EstadoStoreMemoria(EstadoStore):
+    def __init__(self):
+        self._itens = {}  # numero -> EstadoConversa
+        self._sujos = set()
+        self._lock = threading.Lock()
+
+    def ler(self, numero):
+        with self._lock:
+            estado = self._itens.get(numero)
+            if estado is None:
+                return None
+            estado.usado_em = time.monotonic()
+            return copy.copy(estado)
+
+    def salvar(self, estado, sujo=True):
+        estado.usado_em = time.monotonic()
+        with self._lock:
+            self._itens[estado.numero] = estado
+            if sujo:
+                self._sujos.add(estado.numero)
+
+    def remover(self, numero):
+        with self._lock:
+            self._sujos.discard(numero)
+            return self._itens.pop(numero, None)
+
+    def retirar_sujos(self, limite):
+        with self._lock:
+            numeros = [self._sujos.pop() for _ in range(min(limite, len(self._sujos)))]
+            copias = []
+            for n in numeros:
+                if n in self._itens:
+                    copias.append(copy.copy(self._itens[n]))
+                    # os ids vão com a cópia; o que fica guarda só os próximos
+                    self._itens[n].mensagens = []
+            return copias
+
+    def retirar_ociosos(self, ocioso_segundos):
+        limite = time.monotonic() - ocioso_segundos
+        with self._lock:
+            numeros = [n for n, e in self._itens.items() if e.usado_em < limite]
+            for n in numeros:
+                self._sujos.discard(n)
+            return [self._itens.pop(n) for n in numeros]
+
+    def __len__(self):
+        return len(self._itens)
+
+
+# ------------------------------------------------------------
+#   REDIS
+# ------------------------------------------------------------
+class EstadoStoreRedis(EstadoStore):
+    """
+    Uma chave por número (JSON, com TTL = ociosidade) e um SET com os
+    números sujos. `cliente` pode ser injetado; sem ele, cria um com redis-py.
+
+    Os ids de mensagens ficam no JSON depois do flush (limpar exigiria
+    reescrever a chave concorrendo com o webhook); o INSERT deles ignora
+    os repetidos e a lista acaba com a sessão saindo do cache (no máximo
+    uma por pergunta).
+    """
+
+    def __init__(self, url: str, prefixo: str = "", ocioso_segundos: float = 1800.0, cliente=None):
+        self.prefixo = prefixo
+        self.ttl = max(int(ocioso_segundos), 1)
+        if cliente is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("ESTADO_BACKEND=redis exige o pacote redis (requirements-extras.txt)") from e
+            cliente = redis.Redis.from_url(url)
+        self.cliente = cliente
+        self._chave_sujos = f"{prefixo}sujos"
+
+    def _chave(self, numero):
+        return f"{self.prefixo}{numero}"
+
+    def ler(self, numero):
+        # leitura também conta como uso: renova o TTL
+        dados = self.cliente.getex(self._chave(numero), ex=self.ttl)
+        return EstadoConversa.de_json(dados) if dados is not None else None
+
+    def salvar(self, estado, sujo=True):
+        self.cliente.set(self._chave(estado.numero), estado.para_json(), ex=self.ttl)
+        if sujo:
+            self.cliente.sadd(self._chave_sujos, estado.numero)
+
+    def remover(self, numero):
+        # ler e apagar numa transação (MULTI): um salvar de outro processo
+        # não cai entre os dois e some
+        with self.cliente.pipeline(transaction=True) as pipe:
+            pipe.getdel(self._chave(numero))
+            pipe.srem(self._chave_sujos, numero)
+            dados, _ = pipe.execute()
+        return EstadoConversa.de_json(dados) if dados is not None else None
+
+    def retirar_sujos(self, limite):
+        numeros = self.cliente.spop(self._chave_sujos, limite) or []
+        if not numeros:
+            return []
+        valores = self.cliente.mget([self._chave(_texto(n)) for n in numeros])
+        # chave expirada: o estado já foi gravado em algum flush anterior
+        return [EstadoConversa.de_json(v) for v in valores if v is not None]
+
+
+def _texto(valor) -> str:
+    return valor.decode() if isinstance(valor, bytes) else valor
+
+
+# ------------------------------------------------------------
+#   GRAVAÇÃO NO BANCO
+# ------------------------------------------------------------
+_UPDATE = (
+    update(ScoreSession.__table__)
+    .where(
+        ScoreSession.id == bindparam("b_id"),
+        ScoreSession.status == "em_andamento",
+        # nunca sobrescreve algo mais novo (flush atrasado, caminho do banco)
+        or_(ScoreSession.updated_at.is_(None), ScoreSession.updated_at <= bindparam("b_alterado_em")),
+    )
+    .values(
+        estado_atual=bindparam("b_estado_atual"),
+        respostas=bindparam("b_respostas"),
+        soma_pilares=bindparam("b_soma_pilares"),
+        updated_at=bindparam("b_alterado_em"),
+    )
+)
+
+
+def gravar_estados(db, estados, commit: bool = True) -> int:
+    """
+    Um UPDATE em lote (executemany) para todos os estados, mais os ids
+    das mensagens deles. Com commit=False a gravação entra na transação
+    de quem chama.
+    """
+    if not estados:
+        return 0
+    inicio = time.perf_counter()
+    db.execute(_UPDATE, [
+        {
+            "b_id": e.session_id,
+            "b_estado_atual": e.estado_atual,
+            "b_respostas": e.respostas,
+            "b_soma_pilares": e.soma_pilares,
+            "b_alterado_em": e.alterado_em,
+        }
+        for e in estados
+    ])
+    # ids das mensagens que levaram a esses estados, na mesma transação
+    idempotencia.gravar(db, [
+        idempotencia.linha(message_id, e.numero, resposta) for e in estados for message_id, resposta in e.mensagens
+    ])
+    if commit:
+        db.commit()
+    metrics.observar("estado_flush_segundos", time.perf_counter() - inicio)
+    metrics.incrementar("estado_flush_sessoes_total", len(estados))
+    return len(estados)
+
+
+def _gravar_ou_devolver(db, store, estados) -> int:
+    try:
+        return gravar_estados(db, estados)
+    except Exception:
+        db.rollback()
+        store.marcar_sujos(estados)
+        raise
+
+
+def descarregar(store: EstadoStore = None, lote: int = None) -> int:
+    """Grava todos os estados sujos e despeja os ociosos. Devolve quantos gravou."""
+    store = store or get_estado_store()
+    lote = lote or settings.estado_flush_lote
+    gravados = 0
+
+    db = SessionLocal()
+    try:
+        # ociosos saem do cache gravados, sujos ou não (gravar de novo é inofensivo)
+        ociosos = store.retirar_ociosos(settings.estado_ocioso_segundos)
+        for i in range(0, len(ociosos), lote):
+            gravados += _gravar_ou_devolver(db, store, ociosos[i:i + lote])
+        while True:
+            estados = store.retirar_sujos(lote)
+            if not estados:
+                break
+            gravados += _gravar_ou_devolver(db, store, estados)
+    finally:
+        db.close()
+
+    metrics.definir("estado_cache_itens", len(store))
+    return gravados
+
+
+# ------------------------------------------------------------
+#   INSTÂNCIA COMPARTILHADA
+# ------------------------------------------------------------
+_store: Optional[EstadoStore] = None
+_store_lock = threading.Lock()
+
+
+def criar_estado_store() -> EstadoStore:
+    if settings.estado_backend == "redis":
+        return EstadoStoreRedis(
+            url=settings.estado_redis_url,
+            prefixo=settings.estado_redis_prefixo,
+            ocioso_segundos=settings.estado_ocioso_segundos,
+        )
+    if settings.estado_backend == "memoria":
+        return EstadoStoreMemoria()
+    raise ValueError(f"ESTADO_BACKEND desconhecido: {settings.estado_backend}")
+
+
+def get_estado_store() -> EstadoStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = criar_estado_store()
+        return _store
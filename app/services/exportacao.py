@@ -0,0 +1,244 @@
+# app/services/exportacao.py
+"""
+Exportação em massa das sessões concluídas para CRM/BI.
+
+Uma linha por sessão: contato do usuário, resultado, as colunas de
+score_pillars, renda_qualificada e as respostas abertas. As linhas vêm
+do banco por cursor no servidor (stream_results + yield_per) e cada lote
+é escrito e devolvido como bytes antes do próximo ser lido: a memória
+não cresce com o tamanho da exportação.
+
+Formatos: "csv", "ndjson" e "parquet" (um row group por lote; exige o
+pacote pyarrow, de requirements-extras.txt).
+
+Exportação incremental: com um nome ("crm", "bi"...), só vão as sessões
+(ou usuários) alterados depois da marca gravada em exportacao_marcas. A
+marca nova é o maior updated_at (da sessão ou do usuário) entre as linhas
+exportadas, e não o relógio: uma linha gravada depois da leitura nunca
+fica para trás. A leitura volta exportacao_sobreposicao_segundos antes
+da marca, para pegar a transação que carimbou updated_at antes mas só
+fez commit depois da exportação anterior; essas linhas repetem (o
+destino deduplica por session_id). A marca só é gravada quando a última
+linha sai; se cair no meio, a próxima repete o trecho.
+"""
+import csv
+from datetime import datetime, timedelta
+import io
+import json
+import logging
+from typing import Iterator, Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import ExportacaoMarca, ScoreOpenAnswers, ScorePillars, ScoreSession, User
+from app.services.questionario import PILARES
+
+logger = logging.getLogger(__name__)
+
+# (nome da coluna, expressão, tipo) na ordem da saída
+COLUNAS = (
+    ("session_id", ScoreSession.id, "int"),
+    ("whatsapp_number", User.whatsapp_number, "str"),
+    ("nome", User.nome, "str"),
+    ("instagram", User.instagram, "str"),
+    ("renda_faixa", User.renda_faixa, "str"),
+    ("renda_qualificada", ScoreSession.renda_qualificada, "bool"),
+    ("questionario_versao", ScoreSession.questionario_versao, "str"),
+    ("score_total", ScoreSession.score_total, "int"),
+    ("perfil", ScoreSession.perfil_nome, "str"),
+    ("pilar_dominante", ScoreSession.pilar_dominante, "str"),
+    ("pilar_toxico", ScoreSession.pilar_toxico, "str"),
+    *((pilar, getattr(ScorePillars, pilar), "int") for pilar in PILARES),
+    ("motivo_compra", ScoreOpenAnswers.motivo_compra, "str"),
+    ("ganho_buscado", ScoreOpenAnswers.ganho_buscado, "str"),
+    ("maior_desafio", ScoreOpenAnswers.maior_desafio, "str"),
+    ("iniciada_em", ScoreSession.created_at, "datetime"),
+    ("concluida_em", ScoreSession.completed_at, "datetime"),
+    ("atualizada_em", ScoreSession.updated_at, "datetime"),
+)
+NOMES = tuple(nome for nome, _, _ in COLUNAS)
+_ATUALIZADA = NOMES.index("atualizada_em")
+
+TIPOS_CONTEUDO = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def verificar_formato(formato: str):
+    """ValueError para formato desconhecido, RuntimeError se faltar dependência."""
+    if formato not in TIPOS_CONTEUDO:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    if formato == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("Exportação em parquet exige o pacote pyarrow (requirements-extras.txt)") from e
+
+
+# ------------------------------------------------------------
+#   LEITURA
+# ------------------------------------------------------------
+def consulta(desde: Optional[datetime] = None, extras: tuple = ()):
+    """As colunas de COLUNAS e, depois delas, as de `extras`."""
+    stmt = (
+        select(*(expr for _, expr, _ in COLUNAS), *extras)
+        .join(User, User.id == ScoreSession.user_id)
+        .outerjoin(ScorePillars, ScorePillars.score_session_id == ScoreSession.id)
+        .outerjoin(ScoreOpenAnswers, ScoreOpenAnswers.score_session_id == ScoreSession.id)
+        .where(ScoreSession.status == "concluida")
+        .order_by(ScoreSession.id)
+    )
+    if desde is not None:
+        # contato do usuário também conta como alteração da linha
+        stmt = stmt.where(or_(ScoreSession.updated_at > desde, User.updated_at > desde))
+    return stmt
+
+
+def lotes(db: Session, desde: Optional[datetime] = None, lote: int = None, extras: tuple = ()) -> Iterator[list]:
+    """Lotes de tuplas (na ordem de COLUNAS, mais `extras`) lidos por cursor no servidor."""
+    lote = lote or settings.exportacao_lote
+    resultado = db.execute(consulta(desde, extras).execution_options(stream_results=True, yield_per=lote))
+    try:
+        for partes in resultado.partitions():
+            yield [tuple(linha) for linha in partes]
+    finally:
+        resultado.close()
+
+
+# ------------------------------------------------------------
+#   ESCRITA (um bloco de bytes por lote)
+# ------------------------------------------------------------
+def _csv(lotes_linhas) -> Iterator[bytes]:
+    buf = io.StringIO()
+    escritor = csv.writer(buf)
+    escritor.writerow(NOMES)
+    for linhas in lotes_linhas:
+        escritor.writerows(
+            tuple(v.isoformat() if isinstance(v, datetime) else v for v in linha) for linha in linhas
+        )
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _padrao_json(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"{type(valor).__name__} não serializável")
+
+
+def _ndjson(lotes_linhas) -> Iterator[bytes]:
+    for linhas in lotes_linhas:
+        yield "".join(
+            json.dumps(dict(zip(NOMES, linha)), ensure_ascii=False, default=_padrao_json) + "\n"
+            for linha in linhas
+        ).encode("utf-8")
+
+
+class _Vazao(io.RawIOBase):
+    """Arquivo só de escrita que entrega o que recebeu a cada esvaziar()."""
+
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self._posicao
+
+    def esvaziar(self) -> bytes:
+        dados, self._partes = b"".join(self._partes), []
+        return dados
+
+
+def _parquet(lotes_linhas) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos = {"int": pa.int64(), "str": pa.string(), "bool": pa.bool_(), "datetime": pa.timestamp("us")}
+    schema = pa.schema([(nome, tipos[tipo]) for nome, _, tipo in COLUNAS])
+    vazao = _Vazao()
+    with pq.ParquetWriter(vazao, schema, compression="zstd") as escritor:
+        for linhas in lotes_linhas:
+            colunas = list(zip(*linhas)) if linhas else [()] * len(NOMES)
+            escritor.write_table(pa.Table.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(colunas, schema)],
+                schema=schema,
+            ))
+            yield vazao.esvaziar()
+    # rodapé com os metadados dos row groups
+    yield vazao.esvaziar()
+
+
+_ESCRITORES = {"csv": _csv, "ndjson": _ndjson, "parquet": _parquet}
+
+
+# ------------------------------------------------------------
+#   EXPORTAÇÃO
+# ------------------------------------------------------------
+def ler_marca(db: Session, nome: str) -> Optional[datetime]:
+    marca = db.get(ExportacaoMarca, nome)
+    return marca.marca if marca is not None else None
+
+
+def gravar_marca(db: Session, nome: str, marca: datetime, linhas: int):
+    registro = db.get(ExportacaoMarca, nome)
+    if registro is None:
+        registro = ExportacaoMarca(nome=nome)
+        db.add(registro)
+    registro.marca = marca
+    registro.linhas = linhas
+    db.commit()
+
+
+def exportar(
+    db: Session,
+    formato: str,
+    desde: Optional[datetime] = None,
+    incremental: Optional[str] = None,
+    lote: int = None,
+) -> Iterator[bytes]:
+    """
+    Blocos de bytes do arquivo, na ordem. Com `incremental`, `desde` vem
+    da marca gravada com esse nome e a marca avança no fim.
+    """
+    verificar_formato(formato)
+    marca = None
+    if incremental:
+        marca = ler_marca(db, incremental)
+        if marca is not None:
+            desde = marca - timedelta(seconds=settings.exportacao_sobreposicao_segundos)
+
+    total = 0
+
+    def contar():
+        nonlocal total, marca
+        # updated_at do usuário vem no fim de cada linha só para a marca
+        for linhas in lotes(db, desde, lote, extras=(User.updated_at,)):
+            total += len(linhas)
+            for linha in linhas:
+                for quando in (linha[_ATUALIZADA], linha[-1]):
+                    if quando is not None and (marca is None or quando > marca):
+                        marca = quando
+            yield [linha[:-1] for linha in linhas]
+
+    for bloco in _ESCRITORES[formato](contar()):
+        if bloco:
+            yield bloco
+
+    logger.info("Exportação %s: %s linha(s) desde %s", formato, total, desde)
+    if incremental and marca is not None:
+        gravar_marca(db, incremental, marca, total)
@@ -0,0 +1,73 @@
+# app/services/flusher.py
+"""
+Thread do processo web que grava em lote o que o webhook deixou em
+memória e faz a limpeza periódica:
+
+- estado das conversas em cache (app.services.estado_conversa)
+- compactação dos ids de mensagens já processadas (app.services.idempotencia)
+- status de entrega (app.services.status_entrega), mais a compactação
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_thread: Optional[threading.Thread] = None
+_parar = threading.Event()
+
+
+def _tarefas():
+    # import tardio: os módulos das tarefas importam o app inteiro
+    from app.services import estado_conversa, idempotencia, status_entrega
+
+    # (nome, intervalo, função, roda também no desligamento)
+    return [
+        ("estado da conversa", settings.estado_flush_intervalo_segundos, estado_conversa.descarregar, True),
+        ("compactação dos ids", settings.idempotencia_compactar_intervalo_segundos, idempotencia.compactar, False),
+        ("status de entrega", settings.estado_flush_intervalo_segundos, status_entrega.descarregar, True),
+        ("compactação dos status", settings.idempotencia_compactar_intervalo_segundos, status_entrega.compactar, False),
+    ]
+
+
+def _rodar(nome, funcao):
+    try:
+        funcao()
+    except Exception:
+        logger.exception("Flusher: falha em %s", nome)
+
+
+def _loop(tarefas):
+    proxima = {nome: time.monotonic() + intervalo for nome, intervalo, _, _ in tarefas}
+    passo = min(intervalo for _, intervalo, _, _ in tarefas)
+    while not _parar.wait(passo):
+        agora = time.monotonic()
+        for nome, intervalo, funcao, _ in tarefas:
+            if agora >= proxima[nome]:
+                _rodar(nome, funcao)
+                proxima[nome] = agora + intervalo
+
+
+def iniciar_flusher():
+    global _thread
+    if _thread is not None:
+        return
+    _parar.clear()
+    _thread = threading.Thread(target=_loop, args=(_tarefas(),), name="flusher", daemon=True)
+    _thread.start()
+
+
+def parar_flusher():
+    """Para a thread e grava o que estiver pendente (shutdown)."""
+    global _thread
+    if _thread is None:
+        return
+    _parar.set()
+    _thread.join()
+    _thread = None
+    for nome, _, funcao, no_desligamento in _tarefas():
+        if no_desligamento:
+            _rodar(nome, funcao)
@@ -1,5 +1,16 @@
+import asyncio
+import hashlib
+import logging
 import os
-from openai import OpenAI
+import threading
+import time
+
+from app import metrics
+from app.config import settings
+from app.services.llm_cache import buscar_texto, guardar_texto
+from app.services.textos_padrao import interpretacao_padrao, convite_padrao
+
+logger = logging.getLogger(__name__)
 
 
 def get_client():
@@ -7,21 +18,39 @@ def get_client():
     if not api_key:
         # Isso ajuda a diagnosticar rápido se tiver algo errado com o .env
         raise RuntimeError("OPENAI_API_KEY não encontrada no ambiente. Verifique seu arquivo .env.")
+    # import tardio: o SDK leva ~0,25 s para importar e só o worker chama a IA
+    from openai import OpenAI
+
     return OpenAI(api_key=api_key)
 
 
+# Cliente async único: criado uma vez, mantém as conexões abertas entre chamadas
+_async_client = None
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY não encontrada no ambiente. Verifique seu arquivo .env.")
+        from openai import AsyncOpenAI
+
+        # o deadline de cada chamada é controlado aqui, não pelos retries do SDK
+        _async_client = AsyncOpenAI(api_key=api_key, max_retries=0)
+    return _async_client
+
+
 def get_model():
     return os.getenv("OPENAI_MODEL", "gpt-5.1-mini")
 
 
 # ------------------------------------------------------------
-#   Monta interpretação combinando perfil + pilar forte + pilar tóxico
+#   PROMPTS
 # ------------------------------------------------------------
-def montar_interpretacao_combinada(perfil, pilar_forte, pilar_toxico):
-    client = get_client()
-    model = get_model()
+SYSTEM_INTERPRETACAO = "Você é Fernando Tessaro, versão maximizada pela IA, especialista em Solucionismo e riqueza integral."
 
-    prompt = f"""
+PROMPT_INTERPRETACAO = """
 Você é um especialista em desempenho humano, liderança, psicologia aplicada e leitura estratégica.
 Combine estes elementos em uma interpretação precisa, profunda e elegante:
 
@@ -44,29 +73,9 @@ Depois conecte o pilar forte.
 Finalize com a leitura crítica do pilar tóxico.
 """
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {
-                "role": "system",
-                "content": "Você é Fernando Tessaro, versão maximizada pela IA, especialista em Solucionismo e riqueza integral."
-            },
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.7,
-    )
-
-    return response.choices[0].message.content.strip()
-
-
-# ------------------------------------------------------------
-#   Convite para Sessão Solucionista baseado no pilar tóxico
-# ------------------------------------------------------------
-def montar_convite_sessao(perfil, pilar_toxico):
-    client = get_client()
-    model = get_model()
+SYSTEM_CONVITE = "Você é Fernando Tessaro, especialista em Solucionismo, falando com um empresário de alta renda."
 
-    prompt = f"""
+PROMPT_CONVITE = """
 Crie um convite curto e poderoso para uma Sessão Solucionista™ baseado no pilar tóxico.
 
 Perfil: {perfil}
@@ -81,16 +90,350 @@ O convite deve:
 - máximo de 4 linhas
 """
 
+
+def versao_prompt(tipo):
+    """
+    Identifica a versão do prompt (texto + modelo). Qualquer mudança no
+    prompt gera outra versão e invalida o cache dos textos antigos.
+    """
+    if tipo == "interpretacao":
+        base = SYSTEM_INTERPRETACAO + PROMPT_INTERPRETACAO + "0.7"
+    else:
+        base = SYSTEM_CONVITE + PROMPT_CONVITE + "0.6"
+    return hashlib.sha1((base + get_model()).encode("utf-8")).hexdigest()[:12]
+
+
+# ------------------------------------------------------------
+#   Chamadas diretas à OpenAI (sem cache)
+# ------------------------------------------------------------
+def gerar_interpretacao_combinada(perfil, pilar_forte, pilar_toxico):
+    client = get_client()
+    model = get_model()
+
+    prompt = PROMPT_INTERPRETACAO.format(
+        perfil=perfil, pilar_forte=pilar_forte, pilar_toxico=pilar_toxico
+    )
+
     response = client.chat.completions.create(
         model=model,
         messages=[
-            {
-                "role": "system",
-                "content": "Você é Fernando Tessaro, especialista em Solucionismo, falando com um empresário de alta renda."
-            },
+            {"role": "system", "content": SYSTEM_INTERPRETACAO},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.7,
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+async def gerar_interpretacao_combinada_async(perfil, pilar_forte, pilar_toxico):
+    prompt = PROMPT_INTERPRETACAO.format(
+        perfil=perfil, pilar_forte=pilar_forte, pilar_toxico=pilar_toxico
+    )
+
+    response = await get_async_client().chat.completions.create(
+        model=get_model(),
+        messages=[
+            {"role": "system", "content": SYSTEM_INTERPRETACAO},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.7,
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+def gerar_convite_sessao(perfil, pilar_toxico):
+    client = get_client()
+    model = get_model()
+
+    prompt = PROMPT_CONVITE.format(perfil=perfil, pilar_toxico=pilar_toxico)
+
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_CONVITE},
             {"role": "user", "content": prompt},
         ],
         temperature=0.6,
     )
 
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+    return response.choices[0].message.content.strip()
+
+
+async def stream_interpretacao_combinada(perfil, pilar_forte, pilar_toxico):
+    """Mesmo prompt da interpretação, lido como stream de pedaços de texto."""
+    prompt = PROMPT_INTERPRETACAO.format(
+        perfil=perfil, pilar_forte=pilar_forte, pilar_toxico=pilar_toxico
+    )
+
+    stream = await get_async_client().chat.completions.create(
+        model=get_model(),
+        messages=[
+            {"role": "system", "content": SYSTEM_INTERPRETACAO},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.7,
+        stream=True,
+    )
+
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def gerar_convite_sessao_async(perfil, pilar_toxico):
+    prompt = PROMPT_CONVITE.format(perfil=perfil, pilar_toxico=pilar_toxico)
+
+    response = await get_async_client().chat.completions.create(
+        model=get_model(),
+        messages=[
+            {"role": "system", "content": SYSTEM_CONVITE},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.6,
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+# ------------------------------------------------------------
+#   Circuit breaker da OpenAI
+# ------------------------------------------------------------
+class CircuitBreaker:
+    """
+    Depois de N falhas seguidas, abre por alguns segundos e ninguém chama a
+    OpenAI (vai direto para o texto padrão). Passado esse tempo, deixa uma
+    chamada de teste passar; se ela der certo, fecha de novo.
+    """
+
+    def __init__(self, falhas_para_abrir, segundos_aberto):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.segundos_aberto = segundos_aberto
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self._lock = threading.Lock()
+
+    def permite(self):
+        with self._lock:
+            if self.falhas < self.falhas_para_abrir:
+                return True
+            if time.monotonic() >= self.aberto_ate:
+                # meio-aberto: libera uma tentativa e reabre se falhar
+                self.aberto_ate = time.monotonic() + self.segundos_aberto
+                return True
+            return False
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas = 0
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.falhas >= self.falhas_para_abrir:
+                self.aberto_ate = time.monotonic() + self.segundos_aberto
+
+
+breaker = CircuitBreaker(settings.llm_breaker_falhas, settings.llm_breaker_segundos)
+
+
+def _registrar_latencia(tipo, inicio, resultado):
+    duracao = time.perf_counter() - inicio
+    metrics.observar("llm_latencia_segundos", duracao, chamada=tipo, resultado=resultado)
+    # também como etapa do relatório (estado da conversa e rastro)
+    metrics.registrar_etapa(f"llm_{tipo}", duracao)
+
+
+async def _texto_com_deadline(tipo, chave, gerar, fallback, deadline):
+    """Cache -> OpenAI com deadline -> texto padrão. Registra a latência por chamada."""
+    inicio = time.perf_counter()
+    versao = versao_prompt(tipo)
+
+    texto = await asyncio.to_thread(buscar_texto, tipo, chave, versao)
+    if texto is not None:
+        _registrar_latencia(tipo, inicio, "cache")
+        return texto
+
+    resultado = "fallback"
+    if breaker.permite():
+        try:
+            texto = await asyncio.wait_for(gerar(), timeout=deadline)
+        except asyncio.TimeoutError:
+            resultado = "timeout"
+            breaker.falha()
+        except Exception:
+            resultado = "erro"
+            breaker.falha()
+            logger.exception("Falha na OpenAI (%s)", tipo)
+        else:
+            resultado = "ok"
+            breaker.sucesso()
+            await asyncio.to_thread(guardar_texto, tipo, chave, versao, texto)
+
+    _registrar_latencia(tipo, inicio, resultado)
+    if resultado != "ok":
+        # texto padrão não vai para o cache: a próxima sessão tenta a IA de novo
+        texto = fallback()
+    return texto
+
+
+def _separar_paragrafos(texto):
+    return [p.strip() for p in texto.split("\n\n") if p.strip()]
+
+
+async def _entregar(ao_paragrafo, fila: asyncio.Queue):
+    """
+    Manda os parágrafos da fila, em ordem, até receber None. Roda fora do
+    deadline da IA, e falha no envio (Graph API) não conta no breaker da
+    OpenAI: depois da primeira, os parágrafos seguintes vão só para o PDF.
+    """
+    falhou = False
+    while True:
+        paragrafo = await fila.get()
+        if paragrafo is None:
+            return
+        if falhou:
+            continue
+        try:
+            await ao_paragrafo(paragrafo)
+        except Exception:
+            falhou = True
+            metrics.incrementar("llm_paragrafo_envio_falhou_total")
+            logger.exception("Falha ao enviar parágrafo da interpretação")
+
+
+async def _interpretacao_em_paragrafos(perfil, pilar_forte, pilar_toxico, ao_paragrafo):
+    """
+    Lê a interpretação como stream e entrega a `ao_paragrafo` cada
+    parágrafo completo. Devolve o texto para o PDF.
+
+    Se o stream não termina (deadline, erro, breaker), o PDF leva os
+    parágrafos que chegaram, os mesmos que o usuário recebeu; sem nenhum,
+    vai o texto padrão (no PDF e na conversa).
+    """
+    tipo = "interpretacao"
+    chave = (perfil, pilar_forte, pilar_toxico)
+    versao = versao_prompt(tipo)
+    inicio = time.perf_counter()
+
+    fila = asyncio.Queue()
+    entrega = asyncio.create_task(_entregar(ao_paragrafo, fila))
+    try:
+        texto = await asyncio.to_thread(buscar_texto, tipo, chave, versao)
+        if texto is not None:
+            _registrar_latencia(tipo, inicio, "cache")
+            for paragrafo in _separar_paragrafos(texto):
+                fila.put_nowait(paragrafo)
+            return texto
+
+        recebidos = []
+
+        def receber(paragrafo):
+            recebidos.append(paragrafo)
+            fila.put_nowait(paragrafo)
+
+        async def consumir():
+            buffer = ""
+            async for pedaco in stream_interpretacao_combinada(perfil, pilar_forte, pilar_toxico):
+                if not recebidos and not buffer:
+                    metrics.observar("llm_primeiro_token_segundos", time.perf_counter() - inicio, chamada=tipo)
+                buffer += pedaco
+                while "\n\n" in buffer:
+                    paragrafo, buffer = buffer.split("\n\n", 1)
+                    if paragrafo.strip():
+                        receber(paragrafo.strip())
+            if buffer.strip():
+                receber(buffer.strip())
+
+        resultado = "fallback"
+        if breaker.permite():
+            try:
+                await asyncio.wait_for(consumir(), timeout=settings.llm_deadline_interpretacao_segundos)
+            except asyncio.TimeoutError:
+                resultado = "timeout"
+                breaker.falha()
+            except Exception:
+                resultado = "erro"
+                breaker.falha()
+                logger.exception("Falha no stream da OpenAI (%s)", tipo)
+            else:
+                resultado = "ok"
+                breaker.sucesso()
+
+        _registrar_latencia(tipo, inicio, resultado)
+
+        if resultado == "ok" and recebidos:
+            texto = "\n\n".join(recebidos)
+            await asyncio.to_thread(guardar_texto, tipo, chave, versao, texto)
+            return texto
+
+        metrics.incrementar("llm_stream_incompleto_total", paragrafos_enviados=str(len(recebidos)))
+        if recebidos:
+            # texto incompleto não vai para o cache
+            return "\n\n".join(recebidos)
+        texto = interpretacao_padrao(perfil, pilar_forte, pilar_toxico)
+        fila.put_nowait(texto)
+        return texto
+    finally:
+        # o job só segue (PDF) depois que a conversa recebeu a leitura
+        fila.put_nowait(None)
+        await entrega
+
+
+async def montar_convite(perfil, pilar_toxico):
+    return await _texto_com_deadline(
+        "convite",
+        (perfil, pilar_toxico),
+        lambda: gerar_convite_sessao_async(perfil, pilar_toxico),
+        lambda: convite_padrao(perfil, pilar_toxico),
+        settings.llm_deadline_convite_segundos,
+    )
+
+
+async def montar_textos_relatorio(perfil, pilar_forte, pilar_toxico, ao_paragrafo=None):
+    """
+    Gera interpretação e convite ao mesmo tempo. Devolve (interpretacao, convite).
+
+    Com `ao_paragrafo` (corrotina), a interpretação vem em streaming e cada
+    parágrafo é entregue assim que fica completo.
+    """
+    if ao_paragrafo is None:
+        interpretacao = _texto_com_deadline(
+            "interpretacao",
+            (perfil, pilar_forte, pilar_toxico),
+            lambda: gerar_interpretacao_combinada_async(perfil, pilar_forte, pilar_toxico),
+            lambda: interpretacao_padrao(perfil, pilar_forte, pilar_toxico),
+            settings.llm_deadline_interpretacao_segundos,
+        )
+    else:
+        interpretacao = _interpretacao_em_paragrafos(perfil, pilar_forte, pilar_toxico, ao_paragrafo)
+
+    return await asyncio.gather(interpretacao, montar_convite(perfil, pilar_toxico))
+
+
+# ------------------------------------------------------------
+#   Espaço completo de chaves, para pré-aquecer o cache
+# ------------------------------------------------------------
+def tarefas_aquecimento(perfis, pilares):
+    """
+    Gera (tipo, chave, versao, gerar) para todas as combinações possíveis.
+    pilar_forte e pilar_toxico podem coincidir (todas as somas iguais).
+    """
+    versao_interp = versao_prompt("interpretacao")
+    versao_convite = versao_prompt("convite")
+    for perfil in perfis:
+        for pilar_toxico in pilares:
+            yield (
+                "convite",
+                (perfil, pilar_toxico),
+                versao_convite,
+                lambda p=perfil, t=pilar_toxico: gerar_convite_sessao(p, t),
+            )
+            for pilar_forte in pilares:
+                yield (
+                    "interpretacao",
+                    (perfil, pilar_forte, pilar_toxico),
+                    versao_interp,
+                    lambda p=perfil, f=pilar_forte, t=pilar_toxico: gerar_interpretacao_combinada(p, f, t),
+                )
@@ -0,0 +1,217 @@
+# app/services/idempotencia.py
+"""
+Deduplicação das reentregas do webhook.
+
+O provedor reentrega a mesma mensagem (mesmo id) quando não recebe o 200
+a tempo. Sem isso, um "5" repetido vira a resposta da pergunta seguinte.
+Cada id processado guarda a resposta enviada; a reentrega recebe essa
+resposta de volta e nada é aplicado de novo.
+
+Camadas, na ordem da consulta:
+
+1. ids em processamento neste processo: a reentrega espera a original
+2. LRU em memória com TTL
+3. tabela webhook_mensagens
+
+O id entra na tabela (ON CONFLICT DO NOTHING) na mesma transação que
+grava a mudança de estado da mensagem: no caminho do banco, junto com a
+transição; no cache da conversa, junto com o flush do estado
+(app.services.estado_conversa). Um crash nunca deixa a mudança gravada
+sem o id. O LRU é só um atalho de leitura. A compactação apaga da tabela
+o que passou de IDEMPOTENCIA_TTL_DIAS.
+"""
+import asyncio
+from datetime import datetime, timedelta
+import logging
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics
+from app.config import settings
+from app.db import SessionLocal, insert_upsert
+from app.models import WebhookMensagem
+from app.services.lru import LRU
+
+logger = logging.getLogger(__name__)
+
+_memoria = LRU(settings.idempotencia_memoria_itens, settings.idempotencia_memoria_ttl_segundos)
+_em_andamento = {}  # message_id -> Future com a resposta
+
+
+async def _consultar_banco(db: AsyncSession, message_id: str) -> Optional[str]:
+    resultado = await db.execute(
+        select(WebhookMensagem.resposta).filter_by(message_id=message_id)
+    )
+    return resultado.scalar()
+
+
+async def _consultar_banco_varios(db: AsyncSession, message_ids: list) -> dict:
+    resultado = await db.execute(
+        select(WebhookMensagem.message_id, WebhookMensagem.resposta)
+        .where(WebhookMensagem.message_id.in_(message_ids))
+    )
+    return {message_id: resposta for message_id, resposta in resultado if resposta is not None}
+
+
+async def processar_uma_vez(
+    db: AsyncSession,
+    message_id: Optional[str],
+    processar: Callable[[], Awaitable[str]],
+) -> str:
+    """
+    Roda `processar` (que aplica e responde a mensagem e grava o id com
+    gravar()) só na primeira entrega do id. Nas reentregas devolve a
+    resposta guardada. Sem id (provedor que não manda), processa sempre.
+    """
+    if not message_id:
+        return await processar()
+
+    resposta = _memoria.get(message_id)
+    if resposta is not None:
+        metrics.incrementar("webhook_duplicadas_total", origem="memoria")
+        return resposta
+
+    original = _em_andamento.get(message_id)
+    if original is not None:
+        metrics.incrementar("webhook_duplicadas_total", origem="em_andamento")
+        resposta = await asyncio.shield(original)
+        if resposta is not None:
+            return resposta
+        # a original falhou: esta entrega tenta de novo
+        return await processar_uma_vez(db, message_id, processar)
+
+    futuro = asyncio.get_running_loop().create_future()
+    _em_andamento[message_id] = futuro
+    resposta = None
+    try:
+        resposta = await _consultar_banco(db, message_id)
+        if resposta is not None:
+            metrics.incrementar("webhook_duplicadas_total", origem="banco")
+            _memoria.put(message_id, resposta)
+            return resposta
+
+        resposta = await processar()
+        _memoria.put(message_id, resposta)
+        return resposta
+    finally:
+        del _em_andamento[message_id]
+        futuro.set_result(resposta)
+
+
+async def processar_lote_uma_vez(
+    db: AsyncSession,
+    mensagens: list,
+    processar: Callable[[list], Awaitable[list]],
+) -> list:
+    """
+    Versão em lote de processar_uma_vez, para os envelopes com várias
+    mensagens. `mensagens` têm .message_id e .numero; `processar` recebe
+    só as novas, grava os ids delas e devolve as respostas na mesma ordem
+    (None para as que falharam). As já vistas saem do LRU ou de uma
+    consulta só ao banco para o lote inteiro.
+    """
+    respostas = [None] * len(mensagens)
+    primeira = {}     # message_id -> índice da primeira ocorrência no lote
+    repetidas = []    # (índice, índice da primeira) para o mesmo id duas vezes no envelope
+    esperando = []    # (índice, futuro) para ids em processamento em outra entrega
+    candidatas = []
+    novas = []
+    for i, m in enumerate(mensagens):
+        if not m.message_id:
+            novas.append(i)
+        elif m.message_id in primeira:
+            repetidas.append((i, primeira[m.message_id]))
+        else:
+            primeira[m.message_id] = i
+            resposta = _memoria.get(m.message_id)
+            if resposta is not None:
+                metrics.incrementar("webhook_duplicadas_total", origem="memoria")
+                respostas[i] = resposta
+            elif m.message_id in _em_andamento:
+                metrics.incrementar("webhook_duplicadas_total", origem="em_andamento")
+                esperando.append((i, _em_andamento[m.message_id]))
+            else:
+                candidatas.append(i)
+
+    loop = asyncio.get_running_loop()
+    futuros = {}
+    for i in candidatas:
+        futuros[i] = _em_andamento[mensagens[i].message_id] = loop.create_future()
+    try:
+        if candidatas:
+            no_banco = await _consultar_banco_varios(db, [mensagens[i].message_id for i in candidatas])
+            for i in candidatas:
+                resposta = no_banco.get(mensagens[i].message_id)
+                if resposta is None:
+                    novas.append(i)
+                    continue
+                metrics.incrementar("webhook_duplicadas_total", origem="banco")
+                _memoria.put(mensagens[i].message_id, resposta)
+                respostas[i] = resposta
+
+        novas.sort()
+        if novas:
+            processadas = await processar([mensagens[i] for i in novas])
+            for i, resposta in zip(novas, processadas):
+                respostas[i] = resposta
+                if resposta is not None and mensagens[i].message_id:
+                    _memoria.put(mensagens[i].message_id, resposta)
+    finally:
+        for i, futuro in futuros.items():
+            del _em_andamento[mensagens[i].message_id]
+            futuro.set_result(respostas[i])
+
+    for i, original in esperando:
+        respostas[i] = await asyncio.shield(original)
+        if respostas[i] is None:
+            # a original falhou: esta entrega tenta de novo
+            respostas[i] = (await processar_lote_uma_vez(db, [mensagens[i]], processar))[0]
+    for i, anterior in repetidas:
+        metrics.incrementar("webhook_duplicadas_total", origem="lote")
+        respostas[i] = respostas[anterior]
+    return respostas
+
+
+def linha(message_id: str, numero: str, resposta: str) -> dict:
+    return {
+        "message_id": message_id,
+        "whatsapp_number": numero,
+        "resposta": resposta,
+        "created_at": datetime.utcnow(),
+    }
+
+
+# ------------------------------------------------------------
+#   GRAVAÇÃO E COMPACTAÇÃO
+# ------------------------------------------------------------
+def gravar(db, linhas: list):
+    """
+    INSERT dos ids processados. Não faz commit: entra na transação que
+    aplica a mudança de estado das mensagens.
+    """
+    if not linhas:
+        return
+    insert = insert_upsert(db.get_bind().dialect.name)
+    # reentrega que chegou em outro processo pode já ter gravado o mesmo id
+    db.execute(insert(WebhookMensagem).on_conflict_do_nothing(index_elements=["message_id"]), linhas)
+
+
+def compactar(ttl_dias: int = None) -> int:
+    """Apaga ids mais velhos que o TTL. Devolve quantos apagou."""
+    ttl_dias = settings.idempotencia_ttl_dias if ttl_dias is None else ttl_dias
+    limite = datetime.utcnow() - timedelta(days=ttl_dias)
+    db = SessionLocal()
+    try:
+        apagados = (
+            db.query(WebhookMensagem)
+            .filter(WebhookMensagem.created_at < limite)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+    finally:
+        db.close()
+    if apagados:
+        logger.info("Idempotência: %s id(s) antigos apagados", apagados)
+    return apagados
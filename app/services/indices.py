@@ -0,0 +1,99 @@
+# app/services/indices.py
+"""
+Índices do caminho quente (usuário e sessão em andamento) e de
+score_pillars.score_session_id (re-score em lote) em bancos que já
+existiam antes deles. O create_all só cria índices junto com tabelas
+novas; aqui eles entram em tabelas existentes (app.services.migracoes
+chama criar_indices na subida quando algum falta).
+
+Os índices únicos não sobem com dados duplicados, então antes:
+
+- usuários com o mesmo número viram um só (o mais antigo fica, recebe as
+  sessões dos outros e os dados que faltarem)
+- sessões em andamento a mais de um usuário viram "abandonada", menos a
+  mais recente
+"""
+import logging
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from app.models import ScorePillars, ScoreSession, User
+
+logger = logging.getLogger(__name__)
+
+# índice antigo (não único) substituído por uq_users_whatsapp_number
+INDICES_ANTIGOS = ("ix_users_whatsapp_number",)
+
+# tabelas cujos índices (de models) criar_indices garante
+TABELAS = (User.__table__, ScoreSession.__table__, ScorePillars.__table__)
+
+
+def deduplicar_usuarios(db: Session) -> int:
+    """Junta usuários com o mesmo whatsapp_number. Devolve quantos apagou."""
+    repetidos = (
+        db.query(User.whatsapp_number)
+        .group_by(User.whatsapp_number)
+        .having(func.count(User.id) > 1)
+        .all()
+    )
+    apagados = 0
+    for (numero,) in repetidos:
+        fica, *sobram = db.query(User).filter_by(whatsapp_number=numero).order_by(User.id).all()
+        # dados que faltam no que fica vêm do mais recente que tiver
+        for campo in ("nome", "instagram", "renda_faixa"):
+            if getattr(fica, campo) is None:
+                valores = [getattr(u, campo) for u in reversed(sobram) if getattr(u, campo) is not None]
+                if valores:
+                    setattr(fica, campo, valores[0])
+
+        ids = [u.id for u in sobram]
+        db.query(ScoreSession).filter(ScoreSession.user_id.in_(ids)).update(
+            {ScoreSession.user_id: fica.id}, synchronize_session=False
+        )
+        db.query(User).filter(User.id.in_(ids)).delete(synchronize_session=False)
+        apagados += len(ids)
+    db.commit()
+    return apagados
+
+
+def deduplicar_sessoes_abertas(db: Session) -> int:
+    """Deixa uma sessão em andamento por usuário. Devolve quantas abandonou."""
+    usuarios = (
+        db.query(ScoreSession.user_id)
+        .filter(ScoreSession.status == "em_andamento")
+        .group_by(ScoreSession.user_id)
+        .having(func.count(ScoreSession.id) > 1)
+        .all()
+    )
+    abandonadas = 0
+    for (user_id,) in usuarios:
+        _, *velhas = (
+            db.query(ScoreSession.id)
+            .filter_by(user_id=user_id, status="em_andamento")
+            .order_by(ScoreSession.updated_at.desc(), ScoreSession.id.desc())
+            .all()
+        )
+        ids = [sid for (sid,) in velhas]
+        db.query(ScoreSession).filter(ScoreSession.id.in_(ids)).update(
+            {ScoreSession.status: "abandonada"}, synchronize_session=False
+        )
+        abandonadas += len(ids)
+    db.commit()
+    return abandonadas
+
+
+def criar_indices(engine, db: Session) -> dict:
+    """Deduplica e cria os índices que faltarem (pode rodar mais de uma vez)."""
+    resultado = {
+        "usuarios_apagados": deduplicar_usuarios(db),
+        "sessoes_abandonadas": deduplicar_sessoes_abertas(db),
+    }
+    with engine.begin() as conn:
+        for nome in INDICES_ANTIGOS:
+            conn.execute(text(f"DROP INDEX IF EXISTS {nome}"))
+        for tabela in TABELAS:
+            for indice in tabela.indexes:
+                indice.create(conn, checkfirst=True)
+                logger.info("Índice %s ok", indice.name)
+    return resultado
@@ -0,0 +1,217 @@
+# app/services/jobs.py
+from datetime import datetime, timedelta
+import logging
+import threading
+import traceback
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app import metrics
+from app.config import settings
+from app.db import SessionLocal, engine
+from app.models import ScoreJob, ScoreSession
+
+logger = logging.getLogger(__name__)
+
+# Jobs que refletem no relatorio_status da sessão (especulação não reflete)
+TIPOS_RELATORIO = ("finalizar_score", "reenviar_relatorio")
+
+# Especulação é opcional: sai depois dos relatórios e não tem retry
+PRIORIDADE_TIPO = {"especular_relatorio": 10}
+MAX_TENTATIVAS_TIPO = {"especular_relatorio": 1}
+
+
+# ------------------------------------------------------------
+#   ENFILEIRAR
+# ------------------------------------------------------------
+def enfileirar_job(db: Session, session: ScoreSession, tipo: str) -> ScoreJob:
+    """
+    Registra um job para a sessão.
+    Não faz commit: quem chama comita junto com a própria alteração,
+    assim o estado da conversa e o job entram na mesma transação.
+    """
+    job = ScoreJob(
+        score_session_id=session.id,
+        tipo=tipo,
+        prioridade=PRIORIDADE_TIPO.get(tipo, 0),
+        status="pendente",
+        max_tentativas=MAX_TENTATIVAS_TIPO.get(tipo, settings.job_max_tentativas),
+        disponivel_em=datetime.utcnow(),
+    )
+    db.add(job)
+    if tipo in TIPOS_RELATORIO:
+        session.relatorio_status = "pendente"
+    return job
+
+
+def enfileirar_finalizacao(db: Session, session: ScoreSession) -> ScoreJob:
+    return enfileirar_job(db, session, "finalizar_score")
+
+
+def enfileirar_reenvio(db: Session, session: ScoreSession) -> ScoreJob:
+    return enfileirar_job(db, session, "reenviar_relatorio")
+
+
+# ------------------------------------------------------------
+#   RESERVAR / CONCLUIR / FALHAR
+# ------------------------------------------------------------
+def reservar_proximo_job(db: Session):
+    """
+    Pega o próximo job pendente e marca como executando.
+    O UPDATE condicional (status='pendente') garante que só um worker
+    fica com o job, tanto no Postgres quanto no sqlite.
+    """
+    agora = datetime.utcnow()
+    candidatos = (
+        db.query(ScoreJob.id)
+        .filter(ScoreJob.status == "pendente", ScoreJob.disponivel_em <= agora)
+        .order_by(ScoreJob.prioridade, ScoreJob.disponivel_em, ScoreJob.id)
+        .limit(5)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+    for (job_id,) in candidatos:
+        result = db.execute(
+            update(ScoreJob)
+            .where(ScoreJob.id == job_id, ScoreJob.status == "pendente")
+            .values(
+                status="executando",
+                iniciado_em=agora,
+                tentativas=ScoreJob.tentativas + 1,
+            )
+        )
+        if result.rowcount == 1:
+            db.commit()
+            return db.get(ScoreJob, job_id)
+
+    db.commit()
+    return None
+
+
+def calcular_backoff(tentativas: int) -> float:
+    atraso = settings.job_backoff_base_segundos * (2 ** max(tentativas - 1, 0))
+    return min(atraso, settings.job_backoff_max_segundos)
+
+
+def _atualizar_status_relatorio(job: ScoreJob, status: str):
+    if job.tipo in TIPOS_RELATORIO:
+        job.session.relatorio_status = status
+
+
+def concluir_job(db: Session, job: ScoreJob):
+    job.status = "concluido"
+    job.erro = None
+    _atualizar_status_relatorio(job, "pronto")
+    db.commit()
+
+
+def falhar_job(db: Session, job: ScoreJob, erro: str):
+    job.erro = erro
+    if job.tentativas >= job.max_tentativas:
+        job.status = "falhou"
+        _atualizar_status_relatorio(job, "falhou")
+    else:
+        job.status = "pendente"
+        job.disponivel_em = datetime.utcnow() + timedelta(
+            seconds=calcular_backoff(job.tentativas)
+        )
+        _atualizar_status_relatorio(job, "pendente")
+    db.commit()
+
+
+# ------------------------------------------------------------
+#   RECUPERAÇÃO APÓS CRASH
+# ------------------------------------------------------------
+def _renovar_lease(job_id: int, parar: threading.Event):
+    """
+    Enquanto o job roda, iniciado_em avança a cada terço do lease: só
+    fica "velho" o job de um worker que morreu, e ele volta para a fila
+    em até um lease (não no tempo do job mais longo).
+    """
+    while not parar.wait(settings.job_lease_segundos / 3):
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    update(ScoreJob)
+                    .where(ScoreJob.id == job_id, ScoreJob.status == "executando")
+                    .values(iniciado_em=datetime.utcnow())
+                )
+        except Exception:
+            logger.exception("Falha ao renovar o lease do job %s", job_id)
+
+
+def recuperar_jobs_orfaos(db: Session, lease_segundos: float = None) -> int:
+    """
+    Jobs que ficaram "executando" além do lease pertencem a um worker
+    que morreu no meio do caminho: voltam para a fila.
+    """
+    lease = settings.job_lease_segundos if lease_segundos is None else lease_segundos
+    limite = datetime.utcnow() - timedelta(seconds=lease)
+    result = db.execute(
+        update(ScoreJob)
+        .where(ScoreJob.status == "executando", ScoreJob.iniciado_em < limite)
+        .values(status="pendente", disponivel_em=datetime.utcnow())
+    )
+    db.commit()
+    if result.rowcount:
+        logger.warning("%s job(s) órfão(s) devolvido(s) para a fila", result.rowcount)
+    return result.rowcount
+
+
+# ------------------------------------------------------------
+#   EXECUÇÃO
+# ------------------------------------------------------------
+def executar_job(db: Session, job: ScoreJob):
+    # import tardio: whatsapp_logic importa este módulo
+    from app.services.whatsapp_logic import avisar_falha_relatorio, finalizar_score, reenviar_relatorio
+    from app.services.especulacao import executar_especulacao
+
+    session = job.session
+    _atualizar_status_relatorio(job, "processando")
+    db.commit()
+
+    parar = threading.Event()
+    threading.Thread(target=_renovar_lease, args=(job.id, parar), name=f"lease-{job.id}", daemon=True).start()
+    try:
+        user = session.user
+        # etapas do job (IA, PDF, envio) levam o estado da sessão
+        with metrics.no_estado(session.estado_atual):
+            if job.tipo == "finalizar_score":
+                finalizar_score(db, user, session, user.whatsapp_number)
+            elif job.tipo == "reenviar_relatorio":
+                reenviar_relatorio(db, session, user.whatsapp_number)
+            elif job.tipo == "especular_relatorio":
+                executar_especulacao(session)
+            else:
+                raise ValueError(f"Tipo de job desconhecido: {job.tipo}")
+    except Exception:
+        parar.set()
+        db.rollback()
+        logger.exception("Falha no job %s (tentativa %s)", job.id, job.tentativas)
+        falhar_job(db, job, traceback.format_exc(limit=5))
+        if job.status == "falhou" and job.tipo == "finalizar_score":
+            # sem mais retries: o usuário fica sabendo e pode pedir de novo (_finalizando)
+            try:
+                avisar_falha_relatorio(session.user.whatsapp_number)
+            except Exception:
+                logger.exception("Falha ao avisar %s sobre o relatório", session.user.whatsapp_number)
+        return False
+
+    parar.set()
+    concluir_job(db, job)
+    return True
+
+
+def processar_proximo_job() -> bool:
+    """Executa um job da fila. Retorna False se a fila estava vazia."""
+    db = SessionLocal()
+    try:
+        job = reservar_proximo_job(db)
+        if job is None:
+            return False
+        executar_job(db, job)
+        return True
+    finally:
+        db.close()
@@ -0,0 +1,175 @@
+# app/services/llm_cache.py
+"""
+Cache em duas camadas para os textos gerados pela IA.
+
+1. LRU em memória (por processo), com TTL curto
+2. tabela score_texto_cache no banco, compartilhada entre processos
+
+Cada chave guarda até N variantes; a leitura sorteia uma delas para que os
+textos continuem variando entre usuários. A versão do prompt faz parte da
+chave, então mudar o prompt invalida o cache sem precisar apagar nada.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import logging
+import random
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.db import SessionLocal
+from app.models import ScoreTextoCache
+from app.services.lru import LRU
+
+logger = logging.getLogger(__name__)
+
+# camada 1: LRU em memória do processo
+_memoria = LRU(settings.llm_cache_memoria_itens, settings.llm_cache_memoria_ttl_segundos)
+
+
+def _chave_str(chave) -> str:
+    return "|".join(chave)
+
+
+# ------------------------------------------------------------
+#   CAMADA DO BANCO
+# ------------------------------------------------------------
+def _carregar_variantes(tipo, chave, versao):
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(ScoreTextoCache.texto)
+            .filter(
+                ScoreTextoCache.tipo == tipo,
+                ScoreTextoCache.chave == chave,
+                ScoreTextoCache.versao == versao,
+                (ScoreTextoCache.expira_em.is_(None)) | (ScoreTextoCache.expira_em > datetime.utcnow()),
+            )
+            .all()
+        )
+        return [texto for (texto,) in rows]
+    finally:
+        db.close()
+
+
+def _contar_variantes(db, tipo, chave, versao) -> int:
+    return (
+        db.query(func.count(ScoreTextoCache.id))
+        .filter(
+            ScoreTextoCache.tipo == tipo,
+            ScoreTextoCache.chave == chave,
+            ScoreTextoCache.versao == versao,
+            (ScoreTextoCache.expira_em.is_(None)) | (ScoreTextoCache.expira_em > datetime.utcnow()),
+        )
+        .scalar()
+    )
+
+
+def salvar_variante(tipo, chave, versao, texto):
+    db = SessionLocal()
+    try:
+        # variantes expiradas são substituídas, não acumuladas
+        db.query(ScoreTextoCache).filter(
+            ScoreTextoCache.tipo == tipo,
+            ScoreTextoCache.chave == chave,
+            ScoreTextoCache.versao == versao,
+            ScoreTextoCache.expira_em <= datetime.utcnow(),
+        ).delete(synchronize_session=False)
+
+        proxima = db.query(func.coalesce(func.max(ScoreTextoCache.variante) + 1, 0)).filter(
+            ScoreTextoCache.tipo == tipo,
+            ScoreTextoCache.chave == chave,
+            ScoreTextoCache.versao == versao,
+        ).scalar()
+
+        db.add(ScoreTextoCache(
+            tipo=tipo,
+            chave=chave,
+            versao=versao,
+            variante=proxima,
+            texto=texto,
+            expira_em=datetime.utcnow() + timedelta(days=settings.llm_cache_ttl_dias),
+        ))
+        db.commit()
+    except IntegrityError:
+        # outro processo gravou a mesma variante ao mesmo tempo; tudo bem
+        db.rollback()
+    finally:
+        db.close()
+
+
+# ------------------------------------------------------------
+#   LEITURA
+# ------------------------------------------------------------
+def buscar_texto(tipo, chave, versao):
+    """Sorteia uma variante em cache (memória, depois banco). None se não houver."""
+    chave = _chave_str(chave)
+    k = (tipo, chave, versao)
+
+    variantes = _memoria.get(k)
+    if variantes is None:
+        variantes = _carregar_variantes(tipo, chave, versao)
+        if variantes:
+            _memoria.put(k, variantes)
+
+    return random.choice(variantes) if variantes else None
+
+
+def guardar_texto(tipo, chave, versao, texto):
+    chave = _chave_str(chave)
+    salvar_variante(tipo, chave, versao, texto)
+    # a próxima leitura recarrega todas as variantes do banco (guardar só
+    # [texto] serviria uma variante única até o TTL da memória vencer)
+    _memoria.remover((tipo, chave, versao))
+
+
+# ------------------------------------------------------------
+#   PRÉ-AQUECIMENTO E LIMPEZA
+# ------------------------------------------------------------
+def aquecer(tarefas, variantes: int = None, concorrencia: int = 4) -> int:
+    """
+    Completa até `variantes` textos por chave. `tarefas` vem de
+    gpt_logic.tarefas_aquecimento. Devolve quantos textos foram gerados.
+    """
+    variantes = settings.llm_cache_variantes if variantes is None else variantes
+
+    pendentes = []
+    db = SessionLocal()
+    try:
+        for tipo, chave, versao, gerar in tarefas:
+            chave = _chave_str(chave)
+            faltam = variantes - _contar_variantes(db, tipo, chave, versao)
+            pendentes.extend([(tipo, chave, versao, gerar)] * max(faltam, 0))
+    finally:
+        db.close()
+
+    def _gerar(tarefa):
+        tipo, chave, versao, gerar = tarefa
+        salvar_variante(tipo, chave, versao, gerar())
+
+    logger.info("Gerando %s texto(s) para o cache", len(pendentes))
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        list(pool.map(_gerar, pendentes))
+
+    _memoria.limpar()
+    return len(pendentes)
+
+
+def limpar_obsoletos(versoes_atuais: dict) -> int:
+    """Apaga textos expirados ou de versões de prompt que não existem mais."""
+    db = SessionLocal()
+    try:
+        apagados = 0
+        for tipo, versao in versoes_atuais.items():
+            apagados += db.query(ScoreTextoCache).filter(
+                ScoreTextoCache.tipo == tipo,
+                ScoreTextoCache.versao != versao,
+            ).delete(synchronize_session=False)
+        apagados += db.query(ScoreTextoCache).filter(
+            ScoreTextoCache.expira_em <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return apagados
+    finally:
+        db.close()
@@ -0,0 +1,27 @@
+# app/services/loop_async.py
+"""
+Event loop de fundo para o código sync (worker) usar clientes async.
+
+Os clientes async (OpenAI, Graph API) ficam presos ao loop em que foram
+criados. Um único loop de vida longa, numa thread daemon, deixa o worker
+reaproveitar as conexões entre jobs em vez de abrir um loop por chamada.
+"""
+import asyncio
+import threading
+
+_loop = None
+_lock = threading.Lock()
+
+
+def _get_loop():
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="loop-async", daemon=True).start()
+        return _loop
+
+
+def rodar(coro, timeout=None):
+    """Executa a corrotina no loop de fundo e espera o resultado."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result(timeout)
@@ -0,0 +1,47 @@
+# app/services/lru.py
+"""
+LRU em memória com TTL, thread-safe. Usado como primeira camada na frente
+do banco (textos da IA em llm_cache, mensagens já processadas em
+idempotencia).
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRU:
+    def __init__(self, max_itens: int, ttl_segundos: float):
+        self.max_itens = max_itens
+        self.ttl = ttl_segundos
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira, valor = item
+            if expira < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def put(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def remover(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
@@ -0,0 +1,98 @@
+# app/services/migracoes.py
+"""
+Colunas novas em tabelas que já existiam. O create_all só cria as
+tabelas que faltam; numa tabela existente ele não mexe, e o código novo
+quebra com "no such column". Aqui cada coluna de COLUNAS entra com
+ALTER TABLE ... ADD COLUMN se ainda não existir (pode rodar mais de uma
+vez e em vários processos ao mesmo tempo).
+
+Depois das colunas, os índices de app.services.indices: se algum faltar
+(os únicos são o alvo do INSERT ... ON CONFLICT do webhook), roda o
+criar_indices, que antes junta usuários e sessões em andamento
+duplicados. Com os índices já criados é só uma consulta ao catálogo.
+
+Roda logo depois do create_all na subida do servidor, do worker e da CLI.
+Toda coluna nova em tabela antiga entra em COLUNAS, sempre anulável (as
+linhas antigas ficam sem valor).
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app.models import ScoreSession
+from app.services import indices
+
+logger = logging.getLogger(__name__)
+
+_sessao = ScoreSession.__table__.c
+
+# na ordem em que entraram
+COLUNAS = (
+    _sessao.relatorio_status,  # fila de jobs do relatório
+    _sessao.media_id,  # PDF reaproveitado no endpoint de mídia
+    _sessao.media_expira_em,
+    _sessao.interpretacao_enviada,  # progresso da interpretação em streaming
+    _sessao.especulacao_chave,  # textos pré-calculados antes da pergunta 30
+    _sessao.especulado_em,
+    _sessao.pdf_hash,  # PDF no armazenamento por conteúdo
+    _sessao.respostas,  # respostas empacotadas (compactar-respostas preenche as antigas)
+    _sessao.soma_pilares,
+    _sessao.questionario_versao,  # versão do questionário da sessão
+)
+
+
+def _existentes(engine, tabela: str) -> set:
+    return {c["name"] for c in inspect(engine).get_columns(tabela)}
+
+
+def indices_faltando(engine) -> list:
+    """Nomes dos índices de indices.TABELAS que ainda não existem no banco."""
+    faltando = []
+    for tabela in indices.TABELAS:
+        existentes = {i["name"] for i in inspect(engine).get_indexes(tabela.name)}
+        faltando += [i.name for i in tabela.indexes if i.name not in existentes]
+    return faltando
+
+
+def migrar(engine) -> list:
+    """
+    Adiciona as colunas e cria os índices que faltarem. Devolve o que
+    adicionou ("coluna tabela.coluna", "índice nome").
+    """
+    adicionadas = []
+    existentes = {}
+    postgres = engine.dialect.name == "postgresql"
+    for coluna in COLUNAS:
+        tabela = coluna.table.name
+        if tabela not in existentes:
+            existentes[tabela] = _existentes(engine, tabela)
+        if coluna.name in existentes[tabela]:
+            continue
+
+        tipo = coluna.type.compile(dialect=engine.dialect)
+        se_faltar = "IF NOT EXISTS " if postgres else ""
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {se_faltar}{coluna.name} {tipo}"))
+        except DBAPIError:
+            # outro processo subindo ao mesmo tempo pode ter adicionado antes
+            if coluna.name not in _existentes(engine, tabela):
+                raise
+            continue
+        existentes[tabela].add(coluna.name)
+        adicionadas.append(f"coluna {tabela}.{coluna.name}")
+        logger.info("Coluna %s.%s adicionada", tabela, coluna.name)
+
+    faltando = indices_faltando(engine)
+    if faltando:
+        logger.info("Índices faltando: %s; deduplicando e criando", ", ".join(faltando))
+        with Session(engine) as db:
+            resultado = indices.criar_indices(engine, db)
+        logger.info(
+            "%s usuário(s) duplicado(s) unificado(s), %s sessão(ões) em andamento abandonada(s)",
+            resultado["usuarios_apagados"], resultado["sessoes_abandonadas"],
+        )
+        adicionadas += [f"índice {nome}" for nome in faltando]
+    return adicionadas
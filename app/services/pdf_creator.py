@@ -1,28 +1,151 @@
 # app/services/pdf_creator.py
 
-import os
 import io
 import math
 from datetime import datetime
+from functools import lru_cache
 
+from reportlab import rl_config
+from reportlab.lib.colors import HexColor
 from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfgen import canvas
+from reportlab.pdfgen.pathobject import PDFPathObject
 from reportlab.lib.utils import ImageReader
 from textwrap import wrap
 
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from app import metrics
+from app.config import settings
+from app.services.pdf_template import (
+    FONTES,
+    MARGEM_X,
+    PAGINAS,
+    Campo,
+    Espaco,
+    ListaPilares,
+    Pagina,
+    Paragrafo,
+    Radar,
+    Secao,
+    Titulo,
+    preencher,
+)
+
+
+# streams só com Flate (binário): o ASCII85 por cima aumenta o PDF em ~25%
+# e custa CPU, e o arquivo nunca trafega por canal de 7 bits
+rl_config.useA85 = 0
 
 
-BASE_PATH = os.path.dirname(os.path.abspath(__file__))
-REPORTS_PATH = os.path.join(BASE_PATH, "..", "reports")
+# ------------------------------------------------------------
+#  GRÁFICO RADAR VETORIAL (reportlab puro)
+# ------------------------------------------------------------
+RADAR_COR = HexColor("#1f77b4")
+RADAR_COR_GRADE = HexColor("#b0b0b0")
+RADAR_ESCALA_MAX = 15          # padrão (v1: 3 perguntas x nota 5); vem de Questionario.pilar_max
+RADAR_ANEIS = 5                # anéis da grade, igualmente espaçados até o máximo
+
+
+@lru_cache(maxsize=None)
+def _angulos_unitarios(num_vars: int):
+    """(cos, sin) de cada eixo, a partir das 3h e no sentido anti-horário (igual ao matplotlib)."""
+    return tuple(
+        (math.cos(2 * math.pi * n / num_vars), math.sin(2 * math.pi * n / num_vars))
+        for n in range(num_vars)
+    )
+
+
+@lru_cache(maxsize=None)
+def _grade_radar(num_vars: int, tamanho):
+    """Anéis e raios do radar como um caminho só, com origem em (0, 0) (não depende do canvas)."""
+    eixos = _angulos_unitarios(num_vars)
+    cx = cy = tamanho / 2
+    raio = tamanho / 2 - 35  # espaço para os rótulos
+
+    path = PDFPathObject()
+    for anel in range(1, RADAR_ANEIS + 1):
+        path.circle(cx, cy, raio * anel / RADAR_ANEIS)
+    for cos_a, sin_a in eixos:
+        path.moveTo(cx, cy)
+        path.lineTo(cx + raio * cos_a, cy + raio * sin_a)
+    return path
+
+
+@lru_cache(maxsize=None)
+def _rotulos_radar(labels, tamanho):
+    """(x, y, texto) de cada rótulo, já alinhado (sem medir texto a cada relatório)."""
+    eixos = _angulos_unitarios(len(labels))
+    cx = cy = tamanho / 2
+    raio = tamanho / 2 - 35
+    rotulos = []
+    for (cos_a, sin_a), lbl in zip(eixos, labels):
+        texto = lbl.replace("_", " ").capitalize()
+        largura = stringWidth(texto, "Helvetica", 7)
+        lx = cx + (raio + 8) * cos_a
+        ly = cy + (raio + 8) * sin_a - 2.5
+        if cos_a > 0.1:
+            rotulos.append((lx, ly, texto))
+        elif cos_a < -0.1:
+            rotulos.append((lx - largura, ly, texto))
+        else:
+            rotulos.append((lx - largura / 2, ly + 4 * sin_a, texto))
+    return tuple(rotulos)
+
+
+def _desenhar_grade_radar(c, labels, tamanho):
+    """Anéis, raios e rótulos (parte fixa para um mesmo conjunto de pilares), com origem em (0, 0)."""
+    c.saveState()
+    c.setStrokeColor(RADAR_COR_GRADE)
+    c.setLineWidth(0.4)
+    c.drawPath(_grade_radar(len(labels), tamanho), stroke=1, fill=0)
+
+    c.setFillColor(HexColor("#000000"))
+    c.setFont("Helvetica", 7)
+    for x, y, texto in _rotulos_radar(tuple(labels), tamanho):
+        c.drawString(x, y, texto)
+    c.restoreState()
+
+
+def _desenhar_poligono_radar(c, values, tamanho, escala_max=RADAR_ESCALA_MAX):
+    eixos = _angulos_unitarios(len(values))
+    cx = cy = tamanho / 2
+    raio = tamanho / 2 - 35
+
+    path = c.beginPath()
+    for i, ((cos_a, sin_a), valor) in enumerate(zip(eixos, values)):
+        r = raio * min(valor, escala_max) / escala_max
+        if i == 0:
+            path.moveTo(cx + r * cos_a, cy + r * sin_a)
+        else:
+            path.lineTo(cx + r * cos_a, cy + r * sin_a)
+    path.close()
+
+    c.saveState()
+    c.setStrokeColor(RADAR_COR)
+    c.setFillColor(RADAR_COR)
+    c.setFillAlpha(0.25)
+    c.setLineWidth(1.5)
+    c.drawPath(path, stroke=1, fill=1)
+    c.restoreState()
+
+
+def desenhar_radar(c, pilares: dict, x, y, tamanho, escala_max=RADAR_ESCALA_MAX):
+    """Desenha o radar como caminhos vetoriais no canvas, no quadrado (x, y, tamanho)."""
+    c.saveState()
+    c.translate(x, y)
+    _desenhar_grade_radar(c, tuple(pilares.keys()), tamanho)
+    _desenhar_poligono_radar(c, list(pilares.values()), tamanho, escala_max)
+    c.restoreState()
 
 
 # ------------------------------------------------------------
-#  GERA O GRÁFICO RADAR
+#  GERA O GRÁFICO RADAR (matplotlib, opcional)
 # ------------------------------------------------------------
-def gerar_grafico_radar(pilares: dict) -> io.BytesIO:
+def gerar_grafico_radar(pilares: dict, escala_max=RADAR_ESCALA_MAX) -> io.BytesIO:
+    # import tardio: matplotlib é pesado e só é usado com PDF_RADAR=matplotlib.
+    # Figure direto (sem pyplot) não usa estado global: seguro em threads.
+    from matplotlib.figure import Figure
+
     labels = list(pilares.keys())
     values = list(pilares.values())
 
@@ -32,7 +155,8 @@ def gerar_grafico_radar(pilares: dict) -> io.BytesIO:
     angles += angles[:1]
     values += values[:1]
 
-    fig, ax = plt.subplots(figsize=(5, 5), subplot_kw=dict(polar=True))
+    fig = Figure(figsize=(5, 5))
+    ax = fig.add_subplot(polar=True)
 
     ax.plot(angles, values, linewidth=2)
     ax.fill(angles, values, alpha=0.25)
@@ -43,134 +167,190 @@ def gerar_grafico_radar(pilares: dict) -> io.BytesIO:
         fontsize=7,
     )
 
+    ax.set_ylim(0, escala_max)
     ax.grid(True)
     ax.set_yticklabels([])
 
     buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format="png", dpi=150)
-    plt.close(fig)
+    fig.tight_layout()
+    fig.savefig(buf, format="png", dpi=150)
     buf.seek(0)
     return buf
 
 
 # ------------------------------------------------------------
-#  FUNÇÃO PARA QUEBRA DE LINHA
+#  GERA O PDF COMPLETO
 # ------------------------------------------------------------
-def _draw_wrapped_text(c, text, x, y, max_chars=95, leading=14):
-    if not text:
-        return y
-    lines = wrap(text, max_chars)
-    for line in lines:
-        c.drawString(x, y, line)
-        y -= leading
-    return y
+def preparar_radar(pilares: dict, escala_max=RADAR_ESCALA_MAX):
+    """
+    Pré-renderiza o radar (PNG) quando o motor é o matplotlib, para rodar em
+    paralelo com a IA. O radar vetorial é desenhado direto no PDF: None.
+    """
+    if settings.pdf_radar == "matplotlib":
+        with metrics.etapa("radar"):
+            return gerar_grafico_radar(dict(pilares), escala_max).getvalue()
+    return None
 
 
 # ------------------------------------------------------------
-#  GERA O PDF COMPLETO
+#  PARTES FIXAS DO TEMPLATE
 # ------------------------------------------------------------
-def gerar_pdf_relatorio(dados: dict, session_id: int) -> str:
-    if not os.path.exists(REPORTS_PATH):
-        os.makedirs(REPORTS_PATH, exist_ok=True)
+ALTURA = A4[1]
 
-    pdf_path = os.path.join(REPORTS_PATH, f"score_{session_id}.pdf")
 
-    c = canvas.Canvas(pdf_path, pagesize=A4)
-    width, height = A4
+def _desenhar_fixos(c, pagina: Pagina, labels):
+    for t in pagina.fixos:
+        c.setFont(t.fonte, t.tamanho)
+        c.drawString(MARGEM_X, ALTURA - t.topo, t.texto)
+    if labels is not None:
+        c.saveState()
+        c.translate(MARGEM_X, ALTURA - pagina.radar.topo - pagina.radar.tamanho)
+        _desenhar_grade_radar(c, labels, pagina.radar.tamanho)
+        c.restoreState()
 
-    margin_x = 50
-    y = height - 60
 
-    # HEADER — NOME + AUTORIA + DATA
-    c.setFont("Helvetica-Bold", 22)
-    c.drawString(margin_x, y, dados["nome"])
-    y -= 28
+@lru_cache(maxsize=None)
+def _x_campo(campo: Campo) -> float:
+    return MARGEM_X + stringWidth(campo.apos, campo.fonte, campo.tamanho)
 
-    c.setFont("Helvetica", 13)
-    c.drawString(margin_x, y, "Relatório Pessoal do Score de Riqueza™")
-    y -= 18
 
-    data_str = datetime.now().strftime("%d/%m/%Y %H:%M")
-    c.setFont("Helvetica", 10)
-    c.drawString(
-        margin_x,
-        y,
-        f"Método desenvolvido por Fernando Tessaro • Gerado em {data_str}",
-    )
-    y -= 35
-
-    # RESUMO GERAL
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(margin_x, y, "Resumo Geral")
-    y -= 20
-
-    c.setFont("Helvetica", 12)
-    c.drawString(margin_x, y, f"Score Total: {dados['score_total']}")
-    y -= 16
-    c.drawString(margin_x, y, f"Perfil identificado: {dados['perfil']}")
-    y -= 16
-    c.drawString(margin_x, y, f"Pilar mais forte: {dados['pilar_dominante']}")
-    y -= 16
-    c.drawString(margin_x, y, f"Pilar mais vulnerável: {dados['pilar_toxico']}")
-    y -= 30
-
-    # GRÁFICO RADAR
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(margin_x, y, "Distribuição dos Pilares")
-    y -= 20
-
-    radar_buf = gerar_grafico_radar(dados["pilares"])
-    radar_img = ImageReader(radar_buf)
-
-    img_w, img_h = 280, 280
-    img_x = margin_x
-    img_y = y - img_h
-
-    c.drawImage(
-        radar_img,
-        img_x,
-        img_y,
-        width=img_w,
-        height=img_h,
-        mask="auto",
-        preserveAspectRatio=True,
+# ------------------------------------------------------------
+#  PARTES DINÂMICAS
+# ------------------------------------------------------------
+def _desenhar_radar_dados(c, radar: Radar, dados):
+    x, y = MARGEM_X, ALTURA - radar.topo - radar.tamanho
+
+    if settings.pdf_radar == "matplotlib":
+        # o gráfico pode vir pronto (renderizado em paralelo com a IA)
+        if dados.get("radar_png"):
+            radar_buf = io.BytesIO(dados["radar_png"])
+        else:
+            radar_buf = gerar_grafico_radar(dados["pilares"], dados["pilar_max"])
+        c.drawImage(
+            ImageReader(radar_buf),
+            x,
+            y,
+            width=radar.tamanho,
+            height=radar.tamanho,
+            mask="auto",
+            preserveAspectRatio=True,
+        )
+        return
+
+    # a grade e os rótulos já vieram com as partes fixas da página
+    c.saveState()
+    c.translate(x, y)
+    _desenhar_poligono_radar(c, list(dados["pilares"].values()), radar.tamanho, dados["pilar_max"])
+    c.restoreState()
+
+
+def _desenhar_fluxo(c, blocos, dados, topo) -> float:
+    """Desenha os blocos em sequência e devolve onde o fluxo terminou (medido do topo)."""
+    for bloco in blocos:
+        if isinstance(bloco, Espaco):
+            topo += bloco.pontos
+
+        elif isinstance(bloco, ListaPilares):
+            texto = c.beginText(MARGEM_X, ALTURA - topo)
+            texto.setFont(bloco.fonte, bloco.tamanho, bloco.entrelinha)
+            for nome_pilar, valor in dados["pilares"].items():
+                label = nome_pilar.replace("_", " ").capitalize()
+                top = dados["percentis"].get(nome_pilar)
+                texto.textLine(f"{label}: {valor}" + (f"   (top {top}%)" if top else ""))
+            c.drawText(texto)
+            topo += bloco.entrelinha * len(dados["pilares"])
+
+        elif isinstance(bloco, Titulo):
+            # texto fixo, mas em posição variável: desenhado por relatório
+            c.setFont(bloco.fonte, bloco.tamanho)
+            c.drawString(MARGEM_X, ALTURA - topo, bloco.texto)
+
+        elif isinstance(bloco, Paragrafo):
+            linhas = wrap(dados[bloco.campo] or "", bloco.max_chars)
+            texto = c.beginText(MARGEM_X, ALTURA - topo)
+            texto.setFont(bloco.fonte, bloco.tamanho, bloco.entrelinha)
+            for linha in linhas:
+                texto.textLine(linha)
+            c.drawText(texto)
+            topo += bloco.entrelinha * len(linhas)
+
+        elif isinstance(bloco, Secao):
+            if dados.get(bloco.condicao, True):
+                topo = _desenhar_fluxo(c, bloco.blocos, dados, topo)
+
+        else:
+            raise ValueError(f"Bloco de layout desconhecido: {bloco!r}")
+    return topo
+
+
+def gerar_pdf_bytes(dados: dict) -> bytes:
+    """
+    Monta o PDF em memória seguindo o layout de pdf_template. `dados` é um
+    dict simples (vai para o pool de processos); o PNG do radar
+    pré-renderizado pode vir em dados["radar_png"].
+    Mesmos dados (incluindo dados["gerado_em"]) geram os mesmos bytes, o
+    que deixa o relatorio_store deduplicar re-renderizações.
+    """
+    buf = io.BytesIO()
+    # invariant: sem data de criação nem ID aleatório nos metadados do PDF
+    c = canvas.Canvas(buf, pagesize=A4, invariant=1, pageCompression=1)
+
+    dados = dict(
+        dados,
+        gerado_em=dados.get("gerado_em") or datetime.now(),
+        # relatório sem amostra suficiente (ou de antes dos percentis) sai sem eles
+        percentis=dados.get("percentis") or {},
+        percentis_base=dados.get("percentis_base") or "",
+        # eixo do radar: maior soma possível de um pilar no questionário da sessão
+        pilar_max=dados.get("pilar_max") or RADAR_ESCALA_MAX,
     )
-    y = img_y - 20
-
-    # Lista dos pilares
-    c.setFont("Helvetica", 11)
-    for nome_pilar, valor in dados["pilares"].items():
-        label = nome_pilar.replace("_", " ").capitalize()
-        c.drawString(margin_x, y, f"{label}: {valor}")
-        y -= 14
-
-    y -= 20
-
-    if y < 150:
-        c.showPage()
-        y = height - 60
+    vetorial = settings.pdf_radar != "matplotlib"
 
-    # INTERPRETAÇÃO COMBINADA (perfil + pilar forte + pilar tóxico)
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(margin_x, y, "Leitura do seu momento")
-    y -= 20
+    for pagina in PAGINAS:
+        # a grade do radar vetorial só depende dos nomes dos pilares (os anéis
+        # são frações do máximo da escala)
+        labels = tuple(dados["pilares"]) if pagina.radar and vetorial else None
+        _desenhar_fixos(c, pagina, labels)
 
-    c.setFont("Helvetica", 11)
-    y = _draw_wrapped_text(c, dados["interpretacao"], margin_x, y)
+        for campo in pagina.campos:
+            c.setFont(campo.fonte, campo.tamanho)
+            c.drawString(_x_campo(campo), ALTURA - campo.topo, preencher(campo.modelo, dados))
 
-    y -= 25
+        if pagina.radar:
+            _desenhar_radar_dados(c, pagina.radar, dados)
 
-    # CONVITE ESTRATÉGICO — SOMENTE SE RENDA QUALIFICADA
-    if dados.get("renda_qualificada", True):
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(margin_x, y, "Convite estratégico")
-        y -= 20
-
-        c.setFont("Helvetica", 11)
-        y = _draw_wrapped_text(c, dados["convite_sessao"], margin_x, y)
+        _desenhar_fluxo(c, pagina.fluxo, dados, pagina.topo)
+        c.showPage()
 
-    c.showPage()
     c.save()
+    return buf.getvalue()
+
 
-    return pdf_path
\ No newline at end of file
+# ------------------------------------------------------------
+#  AQUECIMENTO (processos do pool de renderização)
+# ------------------------------------------------------------
+def aquecer_renderizador():
+    """
+    Paga uma vez, na subida do processo, o custo de imports, fontes,
+    constantes de layout e partes fixas do template: o primeiro relatório
+    real já sai no tempo normal.
+    """
+    from reportlab.pdfbase import pdfmetrics
+
+    for fonte in FONTES:
+        pdfmetrics.getFont(fonte)
+    _angulos_unitarios(10)
+    if settings.pdf_radar == "matplotlib":
+        from matplotlib.figure import Figure  # noqa: F401
+
+    gerar_pdf_bytes({
+        "nome": "-",
+        "score_total": 0,
+        "perfil": "-",
+        "pilar_dominante": "-",
+        "pilar_toxico": "-",
+        "pilares": {f"p{i}": 3 for i in range(10)},
+        "interpretacao": "-",
+        "convite_sessao": "-",
+        "renda_qualificada": True,
+    })
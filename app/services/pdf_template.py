@@ -0,0 +1,100 @@
+# app/services/pdf_template.py
+"""
+Layout declarativo do relatório em PDF.
+
+Cada página tem quatro partes:
+
+- fixos: textos iguais em todo relatório, desenhados antes dos campos
+  (mais a grade do radar, se houver: caminho e posição dos rótulos
+  calculados uma vez por processo).
+- campos: modelos jinja2 preenchidos com os dados do usuário. `apos` é o
+  rótulo fixo que vem antes na mesma linha (o campo começa onde ele acaba).
+- radar: posição do gráfico (grade fixa, polígono por relatório).
+- fluxo: blocos desenhados em sequência a partir de `topo` (lista de
+  pilares, textos da IA), na ordem em que aparecem.
+
+Coordenadas verticais são medidas do topo da página, em pontos.
+"""
+from collections import namedtuple
+
+from jinja2 import Environment, StrictUndefined
+
+MARGEM_X = 50
+
+Texto = namedtuple("Texto", "fonte tamanho topo texto")
+Campo = namedtuple("Campo", "fonte tamanho topo modelo apos", defaults=("",))
+Radar = namedtuple("Radar", "topo tamanho")
+ListaPilares = namedtuple("ListaPilares", "fonte tamanho entrelinha")
+Titulo = namedtuple("Titulo", "fonte tamanho texto")
+Paragrafo = namedtuple("Paragrafo", "fonte tamanho campo max_chars entrelinha", defaults=(95, 14))
+Espaco = namedtuple("Espaco", "pontos")
+# só desenha os blocos internos quando dados[condicao] é verdadeiro
+Secao = namedtuple("Secao", "condicao blocos")
+Pagina = namedtuple("Pagina", "fixos campos radar topo fluxo")
+
+
+PAGINAS = (
+    Pagina(
+        fixos=(
+            Texto("Helvetica", 13, 88, "Relatório Pessoal do Score de Riqueza™"),
+            Texto("Helvetica", 10, 106, "Método desenvolvido por Fernando Tessaro • Gerado em "),
+            Texto("Helvetica-Bold", 14, 141, "Resumo Geral"),
+            Texto("Helvetica", 12, 161, "Score Total: "),
+            Texto("Helvetica", 12, 177, "Perfil identificado: "),
+            Texto("Helvetica", 12, 193, "Pilar mais forte: "),
+            Texto("Helvetica", 12, 209, "Pilar mais vulnerável: "),
+            Texto("Helvetica-Bold", 14, 239, "Distribuição dos Pilares"),
+        ),
+        campos=(
+            Campo("Helvetica-Bold", 22, 60, "{{ nome }}"),
+            Campo("Helvetica", 10, 106, "{{ gerado_em.strftime('%d/%m/%Y %H:%M') }}",
+                  apos="Método desenvolvido por Fernando Tessaro • Gerado em "),
+            Campo("Helvetica", 12, 161,
+                  "{{ score_total }}{% if percentis.get('total') %} • top {{ percentis.total }}% "
+                  "{{ percentis_base }}{% endif %}",
+                  apos="Score Total: "),
+            Campo("Helvetica", 12, 177, "{{ perfil }}", apos="Perfil identificado: "),
+            Campo("Helvetica", 12, 193, "{{ pilar_dominante }}", apos="Pilar mais forte: "),
+            Campo("Helvetica", 12, 209, "{{ pilar_toxico }}", apos="Pilar mais vulnerável: "),
+        ),
+        radar=Radar(topo=259, tamanho=280),
+        topo=559,
+        fluxo=(
+            ListaPilares("Helvetica", 11, entrelinha=14),
+        ),
+    ),
+    Pagina(
+        fixos=(
+            Texto("Helvetica-Bold", 14, 60, "Leitura do seu momento"),
+        ),
+        campos=(),
+        radar=None,
+        topo=80,
+        fluxo=(
+            Paragrafo("Helvetica", 11, "interpretacao"),
+            Espaco(25),
+            Secao("renda_qualificada", (
+                Titulo("Helvetica-Bold", 14, "Convite estratégico"),
+                Espaco(20),
+                Paragrafo("Helvetica", 11, "convite_sessao"),
+            )),
+        ),
+    ),
+)
+
+# fontes usadas no layout, registradas sempre nesta ordem em cada PDF
+FONTES = ("Helvetica", "Helvetica-Bold")
+
+
+# ------------------------------------------------------------
+#   MODELOS DOS CAMPOS (compilados uma vez)
+# ------------------------------------------------------------
+_jinja = Environment(autoescape=False, undefined=StrictUndefined)
+_modelos = {}
+
+
+def preencher(modelo: str, dados: dict) -> str:
+    compilado = _modelos.get(modelo)
+    if compilado is None:
+        compilado = _modelos[modelo] = _jinja.from_string(modelo)
+    return compilado.render(dados)
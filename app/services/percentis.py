@@ -0,0 +1,154 @@
+# app/services/percentis.py
+"""
+Posição de cada usuário em relação aos outros, por pilar e no total.
+
+Os valores possíveis são poucos (3 a 15 por pilar, 30 a 150 no total),
+então a tabela score_histogramas guarda o histograma exato de cada
+métrica: uma linha por (segmento, métrica, valor) com a contagem. O
+segmento é a faixa de renda do usuário; "" junta todo mundo.
+
+- registrar(): na finalização, +1 em cada métrica (segmento da renda e
+  geral), no mesmo commit que conclui a sessão
+- percentis / para_relatorio(): leem o histograma do segmento (algumas
+  centenas de linhas, não importa quantas sessões existam)
+- reconstruir(): refaz tudo a partir de score_pillars e score_sessions
+  (depois do re-score ou para popular um banco antigo)
+"""
+from collections import Counter
+import logging
+import math
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.db import insert_upsert
+from app.models import ScoreHistograma, ScorePillars, ScoreSession, User
+from app.services.questionario import PILARES
+
+logger = logging.getLogger(__name__)
+
+SEGMENTO_TODOS = ""
+METRICA_TOTAL = "total"
+METRICAS = PILARES + (METRICA_TOTAL,)
+
+
+def _segmentos(renda_faixa) -> list:
+    return [SEGMENTO_TODOS, renda_faixa] if renda_faixa else [SEGMENTO_TODOS]
+
+
+# ------------------------------------------------------------
+#   ATUALIZAÇÃO
+# ------------------------------------------------------------
+def registrar(db: Session, renda_faixa, soma: dict, total: int):
+    """+1 no valor de cada pilar e do total. Não faz commit: entra na transação de quem conclui a sessão."""
+    valores = [(pilar, soma[pilar]) for pilar in PILARES] + [(METRICA_TOTAL, total)]
+    linhas = [
+        {"segmento": segmento, "metrica": metrica, "valor": valor, "contagem": 1}
+        for segmento in _segmentos(renda_faixa)
+        for metrica, valor in valores
+    ]
+    upsert = insert_upsert(db.get_bind().dialect.name)(ScoreHistograma).values(linhas)
+    db.execute(upsert.on_conflict_do_update(
+        index_elements=["segmento", "metrica", "valor"],
+        set_={"contagem": ScoreHistograma.contagem + 1},
+    ))
+
+
+def reconstruir(db: Session) -> int:
+    """Apaga e recalcula os histogramas de todas as sessões concluídas. Devolve quantas entraram."""
+    contagens = Counter()
+    concluida = ScoreSession.status == "concluida"
+
+    for pilar in PILARES:
+        coluna = getattr(ScorePillars, pilar)
+        linhas = db.execute(
+            select(User.renda_faixa, coluna, func.count())
+            .select_from(ScorePillars)
+            .join(ScoreSession, ScoreSession.id == ScorePillars.score_session_id)
+            .join(User, User.id == ScoreSession.user_id)
+            .where(concluida, coluna.isnot(None))
+            .group_by(User.renda_faixa, coluna)
+        )
+        for renda_faixa, valor, n in linhas:
+            for segmento in _segmentos(renda_faixa):
+                contagens[segmento, pilar, valor] += n
+
+    sessoes = 0
+    linhas = db.execute(
+        select(User.renda_faixa, ScoreSession.score_total, func.count())
+        .join(User, User.id == ScoreSession.user_id)
+        .where(concluida, ScoreSession.score_total.isnot(None))
+        .group_by(User.renda_faixa, ScoreSession.score_total)
+    )
+    for renda_faixa, valor, n in linhas:
+        sessoes += n
+        for segmento in _segmentos(renda_faixa):
+            contagens[segmento, METRICA_TOTAL, valor] += n
+
+    db.execute(delete(ScoreHistograma))
+    if contagens:
+        db.execute(insert(ScoreHistograma), [
+            {"segmento": segmento, "metrica": metrica, "valor": valor, "contagem": n}
+            for (segmento, metrica, valor), n in contagens.items()
+        ])
+    db.commit()
+    logger.info("Percentis reconstruídos: %s sessões, %s linhas", sessoes, len(contagens))
+    return sessoes
+
+
+# ------------------------------------------------------------
+#   CONSULTA
+# ------------------------------------------------------------
+def histogramas(db: Session, segmento: str = SEGMENTO_TODOS) -> dict:
+    """{métrica: {valor: contagem}} do segmento."""
+    resultado = {metrica: {} for metrica in METRICAS}
+    linhas = db.execute(
+        select(ScoreHistograma.metrica, ScoreHistograma.valor, ScoreHistograma.contagem)
+        .where(ScoreHistograma.segmento == segmento)
+    )
+    for metrica, valor, contagem in linhas:
+        resultado.setdefault(metrica, {})[valor] = contagem
+    return resultado
+
+
+def posicao(histograma: dict, valor: int) -> dict:
+    """
+    Onde `valor` fica no histograma: `top` é a fatia (em %) com valor
+    igual ou maior ("top 12%"), `percentil` conta metade dos empates.
+    """
+    sessoes = sum(histograma.values())
+    if not sessoes:
+        return {"sessoes": 0, "top": None, "percentil": None}
+    acima = sum(n for v, n in histograma.items() if v > valor)
+    iguais = histograma.get(valor, 0)
+    abaixo = sessoes - acima - iguais
+    return {
+        "sessoes": sessoes,
+        "top": 100.0 * (acima + iguais) / sessoes,
+        "percentil": 100.0 * (abaixo + iguais / 2) / sessoes,
+    }
+
+
+def para_relatorio(db: Session, renda_faixa, soma: dict, total: int) -> dict:
+    """
+    "Top X%" de cada pilar e do total, para o PDF. Compara com a mesma
+    faixa de renda quando ela tem sessões suficientes; senão, com todos.
+    Sem amostra mínima em nenhum dos dois, o relatório sai sem percentis.
+    """
+    minimo = settings.percentis_amostra_minima
+    for segmento, base in ((renda_faixa, "na sua faixa de renda"), (SEGMENTO_TODOS, "entre todos os participantes")):
+        if segmento is None:
+            continue
+        por_metrica = histogramas(db, segmento)
+        if sum(por_metrica[METRICA_TOTAL].values()) < minimo:
+            continue
+        valores = dict(soma, **{METRICA_TOTAL: total})
+        return {
+            "percentis": {
+                metrica: max(1, math.ceil(posicao(por_metrica[metrica], valores[metrica])["top"] or 100))
+                for metrica in METRICAS
+            },
+            "percentis_base": base,
+        }
+    return {"percentis": {}, "percentis_base": ""}
@@ -0,0 +1,146 @@
+# app/services/precarga.py
+"""
+Pré-aquecimento depois da subida.
+
+O processo web sobe só com o que o webhook precisa (FastAPI, SQLAlchemy,
+máquina de estados); IA (openai) e render (reportlab, matplotlib) são
+importados tarde, nos caminhos que usam, e esses caminhos rodam no
+worker. O que sobra de custo na primeira mensagem é conexão: pool do
+banco, cliente HTTP da Graph API (httpcore/h2 são importados na criação)
+e o que PRECARGA_MODULOS listar.
+
+Com PRECARGA_ATIVA, o startup agenda precarregar() para depois de
+PRECARGA_ATRASO_SEGUNDOS: o /health já responde e o aquecimento corre
+em segundo plano, com os imports em thread para não segurar o event
+loop. Falha numa etapa só vira log: o caminho normal faz o mesmo
+trabalho sob demanda.
+
+O worker chama precarregar_sync() numa thread ao subir, com os módulos
+dos relatórios.
+"""
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from typing import Optional
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# o que os jobs de relatório importam tarde (o SDK da IA); reportlab e
+# app.services.pdf_creator já vêm com app.worker
+MODULOS_WORKER = (
+    "app.services.gpt_logic",
+    "openai",
+)
+
+_tarefa: Optional[asyncio.Task] = None
+
+
+def _modulos_configurados() -> list:
+    return [m.strip() for m in (settings.precarga_modulos or "").split(",") if m.strip()]
+
+
+def _importar(modulo: str) -> float:
+    inicio = time.perf_counter()
+    importlib.import_module(modulo)
+    duracao = time.perf_counter() - inicio
+    metrics.observar("precarga_segundos", duracao, etapa=modulo)
+    return duracao
+
+
+# ------------------------------------------------------------
+#   PROCESSO WEB
+# ------------------------------------------------------------
+async def _aquecer_banco():
+    # import tardio: app.db cria os engines na importação
+    from sqlalchemy import text
+    from app.db import async_engine
+
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def _aquecer_whatsapp():
+    from app.services.whatsapp_client import get_whatsapp_client
+
+    # o transporte do httpx (httpcore, h2) é importado na criação do
+    # cliente: importa antes numa thread para não parar o event loop
+    modulos = ["httpcore", "h2.connection"] if settings.whatsapp_http2 else ["httpcore"]
+    for modulo in modulos:
+        await asyncio.to_thread(importlib.import_module, modulo)
+    # cria o AsyncClient deste loop; conexão só no primeiro envio
+    get_whatsapp_client().ahttp
+
+
+async def precarregar(modulos=None):
+    """Aquece banco, cliente da Graph API e módulos. Devolve {etapa: segundos}."""
+    tempos = {}
+    etapas = [("banco", _aquecer_banco), ("whatsapp", _aquecer_whatsapp)]
+    for etapa, aquecer in etapas:
+        inicio = time.perf_counter()
+        try:
+            await aquecer()
+        except Exception:
+            logger.warning("Pré-carga: falha ao aquecer %s", etapa, exc_info=True)
+            continue
+        tempos[etapa] = time.perf_counter() - inicio
+        metrics.observar("precarga_segundos", tempos[etapa], etapa=etapa)
+
+    for modulo in _modulos_configurados() if modulos is None else modulos:
+        try:
+            tempos[modulo] = await asyncio.to_thread(_importar, modulo)
+        except Exception:
+            logger.warning("Pré-carga: falha ao importar %s", modulo, exc_info=True)
+
+    logger.info("Pré-carga concluída em %.0f ms (%s)",
+                sum(tempos.values()) * 1000, ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in tempos.items()))
+    return tempos
+
+
+async def _precarregar_depois(atraso: float):
+    await asyncio.sleep(atraso)
+    await precarregar()
+
+
+def iniciar_precarga():
+    """Chamada no startup (dentro do event loop): agenda a pré-carga e volta."""
+    global _tarefa
+    if not settings.precarga_ativa or _tarefa is not None:
+        return
+    _tarefa = asyncio.get_running_loop().create_task(
+        _precarregar_depois(settings.precarga_atraso_segundos)
+    )
+
+
+async def parar_precarga():
+    global _tarefa
+    tarefa, _tarefa = _tarefa, None
+    if tarefa is not None and not tarefa.done():
+        tarefa.cancel()
+        try:
+            await tarefa
+        except asyncio.CancelledError:
+            pass
+
+
+# ------------------------------------------------------------
+#   WORKER
+# ------------------------------------------------------------
+def precarregar_sync(modulos=MODULOS_WORKER) -> dict:
+    tempos = {}
+    for modulo in list(modulos) + _modulos_configurados():
+        try:
+            tempos[modulo] = _importar(modulo)
+        except Exception:
+            logger.warning("Pré-carga: falha ao importar %s", modulo, exc_info=True)
+    logger.info("Pré-carga do worker: %s", ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in tempos.items()))
+    return tempos
+
+
+def iniciar_precarga_worker():
+    if settings.precarga_ativa:
+        threading.Thread(target=precarregar_sync, name="precarga", daemon=True).start()
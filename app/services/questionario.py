@@ -0,0 +1,254 @@
+# app/services/questionario.py
+"""
+Questionário do Score compilado numa tabela de passos.
+
+Cada versão é um JSON em app/questionarios/ (e em QUESTIONARIOS_DIR, se
+configurado): perguntas com o pilar de cada uma, escala das respostas e
+nota mínima de cada perfil. As definições são lidas e compiladas uma vez
+por processo. Cada estado da conversa vira um Passo com índice inteiro,
+textos já renderizados, respostas aceitas (texto -> valor) e pilar da
+pergunta. A máquina de estados (app.services.whatsapp_logic) acha o passo
+com um dict e despacha pelo tipo, sem cadeia de ifs nem parse do nome
+do estado.
+
+Versões convivem: a sessão guarda a versão em que começou
+(score_sessions.questionario_versao) e termina nela; as novas começam
+em QUESTIONARIO_VERSAO. Sessões de antes da coluna são da v1.
+
+Pilares e nomes de perfil são fixos (colunas de score_pillars, prompts
+da IA, PDF). Uma versão escolhe as perguntas, o pilar de cada uma, a
+escala e os cortes dos perfis.
+"""
+import glob
+import json
+import os
+import threading
+from typing import Optional
+
+from app.config import settings
+
+# ordem das somas em score_sessions.soma_pilares
+PILARES = (
+    "tempo",
+    "familia",
+    "decisao",
+    "dinheiro",
+    "fe_principios",
+    "legado",
+    "energia_saude",
+    "networking",
+    "aprendizado",
+    "risco_medo",
+)
+
+PERFIS = (
+    "Realizador Visionário",
+    "Construtor Consistente",
+    "Operador em Evolução",
+    "Sobrecarregado em Recuperação",
+)
+
+FAIXAS_RENDA = (
+    "Até R$ 5.000",
+    "R$ 5.001–10.000",
+    "R$ 10.001–20.000",
+    "R$ 20.001–50.000",
+    "R$ 50.001–100.000",
+    "Acima de R$ 100.000",
+)
+
+MAX_PERGUNTAS = 30  # bytes de score_sessions.respostas
+VERSAO_LEGADO = "v1"
+DIR_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "questionarios")
+
+# tipos de passo (índices da tabela de ações da máquina de estados)
+INICIO, NOME, INSTAGRAM, RENDA, PERGUNTA, FINALIZANDO = range(6)
+
+
+class Passo:
+    __slots__ = ("indice", "estado", "tipo", "pergunta", "indice_pilar", "validas",
+                 "invalida", "resposta", "proximo", "ultima")
+
+    def __init__(self, estado, tipo, resposta, proximo=None, validas=None, invalida=None,
+                 pergunta=0, indice_pilar=-1, ultima=False):
+        self.indice = -1
+        self.estado = estado
+        self.tipo = tipo
+        self.pergunta = pergunta          # número da pergunta (1..N), 0 fora delas
+        self.indice_pilar = indice_pilar  # posição do pilar em PILARES
+        self.validas = validas            # {texto: valor}; None = aceita qualquer texto
+        self.invalida = invalida          # resposta para texto fora de validas
+        self.resposta = resposta          # resposta depois de uma mensagem válida
+        self.proximo = proximo            # estado seguinte
+        self.ultima = ultima              # pergunta que encerra o questionário
+
+
+class Questionario:
+    def __init__(self, versao, passos, perguntas, escala, perfis, descricao=""):
+        self.versao = versao
+        self.descricao = descricao
+        self.passos = passos
+        self.indice = {}
+        for i, passo in enumerate(passos):
+            passo.indice = i
+            self.indice[passo.estado] = i
+        self.num_perguntas = len(perguntas)
+        self.pilar_map = {n: pilar for n, (pilar, _) in enumerate(perguntas, start=1)}
+        # índice do pilar de cada pergunta, na posição n - 1
+        self.indice_pilar = tuple(PILARES.index(pilar) for pilar, _ in perguntas)
+        self.escala = escala
+        # maior soma possível de um pilar (eixo do radar no PDF)
+        self.pilar_max = escala[1] * max(self.indice_pilar.count(i) for i in set(self.indice_pilar))
+        self.perfis = perfis  # ((nota mínima, nome), ...) do maior corte para o menor
+
+    def passo(self, estado: str) -> Optional[Passo]:
+        i = self.indice.get(estado)
+        return None if i is None else self.passos[i]
+
+    def determinar_perfil(self, score: int) -> str:
+        for minimo, nome in self.perfis:
+            if score >= minimo:
+                return nome
+        return self.perfis[-1][1]
+
+
+# ------------------------------------------------------------
+#   COMPILAÇÃO
+# ------------------------------------------------------------
+def _texto_pergunta(n, total, escala, legenda, texto):
+    return (
+        f"Pergunta {n}/{total}:\n\n"
+        f"Responda de {escala[0]} a {escala[1]}:\n"
+        f"{legenda}\n\n"
+        f"{texto}"
+    )
+
+
+def compilar(definicao: dict) -> Questionario:
+    """Valida a definição (dict do JSON) e monta a tabela de passos."""
+    versao = definicao.get("versao")
+    if not versao:
+        raise ValueError("Questionário sem versão")
+
+    perguntas = [(p["pilar"], p["texto"]) for p in definicao.get("perguntas") or []]
+    if not 1 <= len(perguntas) <= MAX_PERGUNTAS:
+        raise ValueError(f"Questionário {versao}: precisa de 1 a {MAX_PERGUNTAS} perguntas")
+    desconhecidos = {pilar for pilar, _ in perguntas} - set(PILARES)
+    if desconhecidos:
+        raise ValueError(f"Questionário {versao}: pilares desconhecidos {sorted(desconhecidos)}")
+    por_pilar = {pilar: sum(1 for p, _ in perguntas if p == pilar) for pilar in PILARES}
+    sem_pergunta = [pilar for pilar, total in por_pilar.items() if not total]
+    if sem_pergunta:
+        raise ValueError(f"Questionário {versao}: pilares sem pergunta {sem_pergunta}")
+
+    dados_escala = definicao.get("escala") or {}
+    escala = (int(dados_escala.get("minimo", 1)), int(dados_escala.get("maximo", 5)))
+    if not 1 <= escala[0] < escala[1] <= 9:
+        raise ValueError(f"Questionário {versao}: escala deve ir de 1 a 9 (um dígito)")
+    # somas em um byte por pilar
+    if escala[1] * max(por_pilar.values()) > 255:
+        raise ValueError(f"Questionário {versao}: soma de um pilar não cabe em um byte")
+    legenda = dados_escala.get("legenda", "")
+
+    perfis = tuple(sorted(
+        ((int(p["minimo"]), p["nome"]) for p in definicao.get("perfis") or []),
+        reverse=True,
+    ))
+    if not perfis or any(nome not in PERFIS for _, nome in perfis):
+        raise ValueError(f"Questionário {versao}: perfis devem ser nomes de {PERFIS}")
+
+    total = len(perguntas)
+    validas = {str(v): v for v in range(escala[0], escala[1] + 1)}
+    invalida = f"Responda com um número de {escala[0]} a {escala[1]}."
+    textos = [
+        _texto_pergunta(n, total, escala, legenda, texto)
+        for n, (_, texto) in enumerate(perguntas, start=1)
+    ]
+
+    passos = [
+        Passo("COLETAR_NOME", INICIO, "Vamos começar. Qual é o seu nome completo?", "AGUARDANDO_NOME"),
+        # {nome} é preenchido na hora
+        Passo("AGUARDANDO_NOME", NOME, "Certo, {nome}. Qual é o seu @ do Instagram?", "COLETAR_INSTAGRAM"),
+        Passo(
+            "COLETAR_INSTAGRAM", INSTAGRAM,
+            "Agora me diga sua renda mensal:\n\n"
+            + "".join(f"{i}. {faixa}\n" for i, faixa in enumerate(FAIXAS_RENDA, start=1))
+            + "\nResponda apenas com o número.",
+            "COLETAR_RENDA",
+        ),
+        Passo(
+            "COLETAR_RENDA", RENDA,
+            f"Vamos iniciar as {total} perguntas do Score de Riqueza.\n"
+            f"Responda sempre com números de {escala[0]} a {escala[1]}.\n\n"
+            + textos[0],
+            "PERGUNTA_1",
+            validas={str(i): faixa for i, faixa in enumerate(FAIXAS_RENDA, start=1)},
+            invalida=f"Responda com um número de 1 a {len(FAIXAS_RENDA)}.",
+        ),
+    ]
+    for n, (pilar, _) in enumerate(perguntas, start=1):
+        ultima = n == total
+        passos.append(Passo(
+            f"PERGUNTA_{n}", PERGUNTA,
+            (
+                "Recebi todas as suas respostas! Estou calculando seu Score de Riqueza "
+                "e em instantes envio seu relatório."
+            ) if ultima else textos[n],
+            "FINALIZANDO" if ultima else f"PERGUNTA_{n + 1}",
+            validas=validas,
+            invalida=invalida,
+            pergunta=n,
+            indice_pilar=PILARES.index(pilar),
+            ultima=ultima,
+        ))
+    passos.append(Passo("FINALIZANDO", FINALIZANDO, "Seu relatório está sendo preparado. Já já ele chega por aqui."))
+
+    return Questionario(versao, passos, perguntas, escala, perfis, definicao.get("descricao", ""))
+
+
+# ------------------------------------------------------------
+#   VERSÕES CARREGADAS
+# ------------------------------------------------------------
+_compilados = {}
+_carregar_lock = threading.Lock()
+
+
+def _diretorios():
+    diretorios = [DIR_PADRAO]
+    if settings.questionarios_dir:
+        diretorios.append(settings.questionarios_dir)
+    return diretorios
+
+
+def carregar(diretorios=None) -> dict:
+    """Lê e compila todos os JSON dos diretórios. {versão: Questionario}."""
+    compilados = {}
+    for diretorio in diretorios or _diretorios():
+        for caminho in sorted(glob.glob(os.path.join(diretorio, "*.json"))):
+            with open(caminho, encoding="utf-8") as f:
+                questionario = compilar(json.load(f))
+            if questionario.versao in compilados:
+                raise ValueError(f"Questionário {questionario.versao} definido duas vezes ({caminho})")
+            compilados[questionario.versao] = questionario
+    return compilados
+
+
+def questionarios() -> dict:
+    if not _compilados:
+        with _carregar_lock:
+            if not _compilados:
+                _compilados.update(carregar())
+    return _compilados
+
+
+def get_questionario(versao: str = None) -> Questionario:
+    versao = versao or settings.questionario_versao
+    questionario = _compilados.get(versao) or questionarios().get(versao)
+    if questionario is None:
+        raise LookupError(f"Questionário {versao} não encontrado em {_diretorios()}")
+    return questionario
+
+
+def questionario_da_sessao(session) -> Questionario:
+    """Aceita ScoreSession ou o estado em cache da conversa."""
+    return get_questionario(session.questionario_versao or VERSAO_LEGADO)
@@ -0,0 +1,314 @@
+# app/services/relatorio_store.py
+"""
+Armazenamento dos PDFs por conteúdo.
+
+A chave de cada relatório é o sha256 dos bytes: o mesmo PDF renderizado
+de novo cai na mesma chave e não ocupa espaço duas vezes. O backend é
+plugável (RELATORIOS_BACKEND):
+
+- "local": diretório no disco (padrão, app/reports)
+- "s3": qualquer storage compatível com S3 (AWS, MinIO, R2...), via boto3
+
+Os dois expõem a mesma interface, incluindo leitura por intervalo de
+bytes (Range no download) e despejo por idade e tamanho total.
+"""
+from abc import ABC, abstractmethod
+from datetime import timedelta
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Iterator, Optional
+
+from app import metrics
+from app.config import settings
+
+BLOCO_LEITURA = 64 * 1024
+_CHAVE_VALIDA = re.compile(r"^[0-9a-f]{64}$")
+
+
+def chave_do_conteudo(dados: bytes) -> str:
+    return hashlib.sha256(dados).hexdigest()
+
+
+def chave_valida(chave: str) -> bool:
+    return bool(_CHAVE_VALIDA.match(chave or ""))
+
+
+class RelatorioStore(ABC):
+    """Interface comum. Subclasses implementam o acesso ao backend."""
+
+    def salvar(self, dados: bytes) -> str:
+        """Guarda o PDF (se ainda não existir) e devolve a chave."""
+        chave = chave_do_conteudo(dados)
+        if self._existe(chave):
+            metrics.incrementar("relatorio_store_dedup_total")
+            self._tocar(chave)
+        else:
+            self._gravar(chave, dados)
+        return chave
+
+    @abstractmethod
+    def ler(self, chave: str) -> Optional[bytes]:
+        """Bytes do relatório, ou None se a chave não existir."""
+
+    @abstractmethod
+    def tamanho(self, chave: str) -> Optional[int]:
+        """Tamanho em bytes, ou None se a chave não existir."""
+
+    @abstractmethod
+    def iterar(self, chave: str, inicio: int = 0, fim: Optional[int] = None) -> Iterator[bytes]:
+        """Blocos do intervalo [inicio, fim] (fim inclusivo, como no Range do HTTP)."""
+
+    @abstractmethod
+    def apagar(self, chave: str):
+        """Apaga o relatório (sem erro se já não existir)."""
+
+    @abstractmethod
+    def listar(self) -> Iterator[tuple]:
+        """(chave, tamanho, modificado_em em epoch) de cada relatório."""
+
+    def _existe(self, chave: str) -> bool:
+        return self.tamanho(chave) is not None
+
+    @abstractmethod
+    def _gravar(self, chave: str, dados: bytes):
+        """Grava os bytes na chave, sem deixar objeto pela metade visível."""
+
+    @abstractmethod
+    def _tocar(self, chave: str):
+        """Renova a idade de um relatório reaproveitado (não entra no despejo)."""
+
+    # --------------------------------------------------------
+    #   DESPEJO
+    # --------------------------------------------------------
+    def despejar(self, max_bytes: Optional[int] = None, max_idade: Optional[timedelta] = None) -> int:
+        """
+        Apaga relatórios mais velhos que max_idade e, se o total ainda
+        passar de max_bytes, os mais antigos até caber. Devolve quantos apagou.
+        """
+        itens = sorted(self.listar(), key=lambda item: item[2])
+        limite = time.time() - max_idade.total_seconds() if max_idade else None
+        total = sum(tamanho for _, tamanho, _ in itens)
+
+        apagados = 0
+        for chave, tamanho, modificado_em in itens:
+            velho = limite is not None and modificado_em < limite
+            cheio = max_bytes is not None and total > max_bytes
+            if not (velho or cheio):
+                break
+            self.apagar(chave)
+            total -= tamanho
+            apagados += 1
+
+        metrics.incrementar("relatorio_store_despejados_total", apagados)
+        return apagados
+
+
+# ------------------------------------------------------------
+#   DISCO LOCAL
+# ------------------------------------------------------------
+class RelatorioStoreLocal(RelatorioStore):
+    def __init__(self, raiz: str):
+        self.raiz = os.path.abspath(raiz)
+
+    def _caminho(self, chave: str) -> str:
+        # dois níveis para não acumular milhares de arquivos num diretório só
+        return os.path.join(self.raiz, chave[:2], f"{chave}.pdf")
+
+    def _gravar(self, chave: str, dados: bytes):
+        caminho = self._caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        # grava num temporário e renomeia: quem lê nunca vê arquivo pela metade
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(dados)
+            os.replace(tmp, caminho)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def _tocar(self, chave: str):
+        try:
+            os.utime(self._caminho(chave))
+        except FileNotFoundError:
+            pass
+
+    def ler(self, chave: str) -> Optional[bytes]:
+        try:
+            with open(self._caminho(chave), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def tamanho(self, chave: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._caminho(chave))
+        except FileNotFoundError:
+            return None
+
+    def iterar(self, chave: str, inicio: int = 0, fim: Optional[int] = None) -> Iterator[bytes]:
+        with open(self._caminho(chave), "rb") as f:
+            f.seek(inicio)
+            restante = None if fim is None else fim - inicio + 1
+            while restante is None or restante > 0:
+                bloco = f.read(BLOCO_LEITURA if restante is None else min(BLOCO_LEITURA, restante))
+                if not bloco:
+                    break
+                if restante is not None:
+                    restante -= len(bloco)
+                yield bloco
+
+    def apagar(self, chave: str):
+        try:
+            os.unlink(self._caminho(chave))
+        except FileNotFoundError:
+            pass
+
+    def listar(self) -> Iterator[tuple]:
+        if not os.path.isdir(self.raiz):
+            return
+        for prefixo in os.listdir(self.raiz):
+            pasta = os.path.join(self.raiz, prefixo)
+            if len(prefixo) != 2 or not os.path.isdir(pasta):
+                continue
+            for nome in os.listdir(pasta):
+                chave = nome[:-4]
+                if not nome.endswith(".pdf") or not chave_valida(chave):
+                    continue
+                try:
+                    st = os.stat(os.path.join(pasta, nome))
+                except FileNotFoundError:
+                    continue
+                yield chave, st.st_size, st.st_mtime
+
+
+# ------------------------------------------------------------
+#   S3 (E COMPATÍVEIS)
+# ------------------------------------------------------------
+class RelatorioStoreS3(RelatorioStore):
+    """
+    Usa a API do boto3 (put/get/head/copy/delete_object, list_objects_v2).
+    `cliente` pode ser injetado; sem ele, cria um com boto3.
+    """
+
+    def __init__(self, bucket: str, prefixo: str = "", cliente=None, endpoint_url: str = None, regiao: str = None):
+        self.bucket = bucket
+        self.prefixo = prefixo
+        if cliente is None:
+            try:
+                import boto3
+            except ImportError as e:
+                raise RuntimeError("RELATORIOS_BACKEND=s3 exige o pacote boto3 (requirements-extras.txt)") from e
+            cliente = boto3.client("s3", endpoint_url=endpoint_url, region_name=regiao)
+        self.cliente = cliente
+
+    def _objeto(self, chave: str) -> str:
+        return f"{self.prefixo}{chave}.pdf"
+
+    @staticmethod
+    def _nao_encontrado(e: Exception) -> bool:
+        resposta = getattr(e, "response", None) or {}
+        codigo = str(resposta.get("Error", {}).get("Code", ""))
+        return codigo in ("404", "NoSuchKey", "NotFound")
+
+    def _gravar(self, chave: str, dados: bytes):
+        self.cliente.put_object(
+            Bucket=self.bucket,
+            Key=self._objeto(chave),
+            Body=dados,
+            ContentType="application/pdf",
+        )
+
+    def _tocar(self, chave: str):
+        # cópia do objeto sobre ele mesmo renova o LastModified; o S3 só
+        # aceita a cópia no lugar quando os metadados são substituídos
+        objeto = self._objeto(chave)
+        try:
+            self.cliente.copy_object(
+                Bucket=self.bucket,
+                Key=objeto,
+                CopySource={"Bucket": self.bucket, "Key": objeto},
+                MetadataDirective="REPLACE",
+                Metadata={"tocado-em": str(int(time.time()))},
+                ContentType="application/pdf",
+            )
+        except Exception as e:
+            # despejado entre a verificação e a cópia: o próximo salvar grava de novo
+            if not self._nao_encontrado(e):
+                raise
+
+    def ler(self, chave: str) -> Optional[bytes]:
+        try:
+            resposta = self.cliente.get_object(Bucket=self.bucket, Key=self._objeto(chave))
+        except Exception as e:
+            if self._nao_encontrado(e):
+                return None
+            raise
+        return resposta["Body"].read()
+
+    def tamanho(self, chave: str) -> Optional[int]:
+        try:
+            resposta = self.cliente.head_object(Bucket=self.bucket, Key=self._objeto(chave))
+        except Exception as e:
+            if self._nao_encontrado(e):
+                return None
+            raise
+        return resposta["ContentLength"]
+
+    def iterar(self, chave: str, inicio: int = 0, fim: Optional[int] = None) -> Iterator[bytes]:
+        kwargs = {}
+        if inicio or fim is not None:
+            kwargs["Range"] = f"bytes={inicio}-{'' if fim is None else fim}"
+        resposta = self.cliente.get_object(Bucket=self.bucket, Key=self._objeto(chave), **kwargs)
+        yield from resposta["Body"].iter_chunks(BLOCO_LEITURA)
+
+    def apagar(self, chave: str):
+        self.cliente.delete_object(Bucket=self.bucket, Key=self._objeto(chave))
+
+    def listar(self) -> Iterator[tuple]:
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefixo}
+        while True:
+            resposta = self.cliente.list_objects_v2(**kwargs)
+            for obj in resposta.get("Contents", []):
+                chave = obj["Key"][len(self.prefixo):].removesuffix(".pdf")
+                if chave_valida(chave):
+                    yield chave, obj["Size"], obj["LastModified"].timestamp()
+            if not resposta.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = resposta["NextContinuationToken"]
+
+
+# ------------------------------------------------------------
+#   INSTÂNCIA COMPARTILHADA
+# ------------------------------------------------------------
+_store: Optional[RelatorioStore] = None
+_store_lock = threading.Lock()
+
+RAIZ_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "reports")
+
+
+def criar_relatorio_store() -> RelatorioStore:
+    if settings.relatorios_backend == "s3":
+        return RelatorioStoreS3(
+            bucket=settings.relatorios_s3_bucket,
+            prefixo=settings.relatorios_s3_prefixo,
+            endpoint_url=settings.relatorios_s3_endpoint_url,
+            regiao=settings.relatorios_s3_regiao,
+        )
+    if settings.relatorios_backend == "local":
+        return RelatorioStoreLocal(settings.relatorios_dir or RAIZ_PADRAO)
+    raise ValueError(f"RELATORIOS_BACKEND desconhecido: {settings.relatorios_backend}")
+
+
+def get_relatorio_store() -> RelatorioStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = criar_relatorio_store()
+        return _store
+
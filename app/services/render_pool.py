@@ -0,0 +1,121 @@
+# app/services/render_pool.py
+"""
+Pool de processos para renderizar os PDFs.
+
+Cada processo importa reportlab (e matplotlib, se for o motor do radar),
+carrega as fontes e calcula as constantes de layout uma vez, na subida.
+Os jobs entram como dict simples e voltam como bytes do PDF. Processos são
+reciclados depois de N relatórios para conter crescimento de memória.
+"""
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+import logging
+import multiprocessing
+import threading
+import time
+
+from app import metrics
+from app.config import settings
+from app.services.pdf_creator import aquecer_renderizador, gerar_pdf_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class RenderTimeout(RuntimeError):
+    pass
+
+
+class RenderPool:
+    def __init__(self, processos: int, jobs_por_processo: int, timeout: float):
+        self.processos = processos
+        self.jobs_por_processo = jobs_por_processo or None
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        self._na_fila = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: processo limpo (sem conexões de banco herdadas) e
+                # exigido pelo max_tasks_per_child
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processos,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=aquecer_renderizador,
+                    max_tasks_per_child=self.jobs_por_processo,
+                )
+            return self._pool
+
+    def _descartar_pool(self):
+        """Mata os processos do pool atual (job travado) e começa outro."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        for processo in list((getattr(pool, "_processes", None) or {}).values()):
+            processo.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fila(self, delta: int):
+        with self._lock:
+            self._na_fila += delta
+            metrics.definir("render_fila", self._na_fila)
+
+    def renderizar(self, dados: dict) -> bytes:
+        inicio = time.perf_counter()
+        self._fila(+1)
+        try:
+            futuro = self._get_pool().submit(gerar_pdf_bytes, dados)
+            try:
+                pdf = futuro.result(timeout=self.timeout)
+            except FuturesTimeout:
+                metrics.incrementar("render_timeout_total")
+                logger.error("Renderização passou de %ss; reciclando o pool", self.timeout)
+                self._descartar_pool()
+                raise RenderTimeout(f"Renderização do PDF passou de {self.timeout}s")
+        finally:
+            self._fila(-1)
+        metrics.observar("render_latencia_segundos", time.perf_counter() - inicio)
+        return pdf
+
+    def fechar(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+_render_pool = None
+_render_lock = threading.Lock()
+
+
+def get_render_pool() -> RenderPool:
+    global _render_pool
+    with _render_lock:
+        if _render_pool is None:
+            _render_pool = RenderPool(
+                processos=settings.pdf_pool_processos,
+                jobs_por_processo=settings.pdf_pool_jobs_por_processo,
+                timeout=settings.pdf_pool_timeout_segundos,
+            )
+        return _render_pool
+
+
+def renderizar_pdf(dados: dict) -> bytes:
+    """Renderiza no pool, ou na própria thread se PDF_POOL_PROCESSOS=0."""
+    # etapa "pdf": espera no pool + render (o radar do pool é desenhado junto)
+    with metrics.etapa("pdf"):
+        if settings.pdf_pool_processos <= 0:
+            inicio = time.perf_counter()
+            pdf = gerar_pdf_bytes(dados)
+            metrics.observar("render_latencia_segundos", time.perf_counter() - inicio)
+            return pdf
+        return get_render_pool().renderizar(dados)
+
+
+def fechar_render_pool():
+    global _render_pool
+    with _render_lock:
+        pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.fechar()
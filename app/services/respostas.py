@@ -0,0 +1,216 @@
+# app/services/respostas.py
+"""
+Respostas do Score guardadas na própria sessão, em formato compacto.
+
+- score_sessions.respostas: 30 bytes, um por pergunta (0 = sem resposta)
+- score_sessions.soma_pilares: 10 bytes, soma corrente de cada pilar na
+  ordem de PILARES, atualizada a cada resposta
+
+O pilar de cada pergunta vem do questionário da sessão
+(app.services.questionario).
+
+A finalização lê as somas direto da sessão, sem carregar linhas de
+score_answers. Sessão que começou antes do deploy (respostas do começo
+só em score_answers) e termina antes do backfill é completada na hora
+por completar_da_tabela. Para as demais sessões antigas existe o
+backfill, e a view
+score_answers (criar_view_compativel) devolve as respostas no formato
+antigo para as consultas de análise que já existem.
+"""
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models import ScoreAnswer, ScoreSession
+from app.services.questionario import (
+    MAX_PERGUNTAS,
+    PILARES,
+    VERSAO_LEGADO,
+    get_questionario,
+    questionario_da_sessao,
+    questionarios,
+)
+
+logger = logging.getLogger(__name__)
+
+TABELA_LEGADO = "score_answers_legado"
+
+
+# ------------------------------------------------------------
+#   EMPACOTAMENTO
+# ------------------------------------------------------------
+def empacotar(respostas: dict) -> bytes:
+    """{pergunta: valor} -> 30 bytes."""
+    vetor = bytearray(MAX_PERGUNTAS)
+    for n, valor in respostas.items():
+        vetor[n - 1] = valor
+    return bytes(vetor)
+
+
+def desempacotar(dados) -> dict:
+    """30 bytes -> {pergunta: valor}, só as perguntas respondidas."""
+    if not dados:
+        return {}
+    return {i + 1: valor for i, valor in enumerate(dados) if valor}
+
+
+def somar(respostas: dict, questionario=None) -> bytes:
+    """Somas por pilar. Sem questionário, o da v1 (linhas antigas)."""
+    indice_pilar = (questionario or get_questionario(VERSAO_LEGADO)).indice_pilar
+    somas = bytearray(len(PILARES))
+    for n, valor in respostas.items():
+        somas[indice_pilar[n - 1]] += valor
+    return bytes(somas)
+
+
+# ------------------------------------------------------------
+#   SESSÃO
+# ------------------------------------------------------------
+def registrar_resposta(session: ScoreSession, n: int, valor: int):
+    """Grava a resposta da pergunta n e atualiza a soma do pilar. Não faz commit."""
+    respostas = bytearray(session.respostas or bytes(MAX_PERGUNTAS))
+    somas = bytearray(session.soma_pilares or bytes(len(PILARES)))
+
+    # mensagem repetida para a mesma pergunta troca o valor, não soma duas vezes
+    i = questionario_da_sessao(session).indice_pilar[n - 1]
+    somas[i] += valor - respostas[n - 1]
+    respostas[n - 1] = valor
+
+    # bytes novos (imutáveis): o SQLAlchemy detecta a alteração
+    session.respostas = bytes(respostas)
+    session.soma_pilares = bytes(somas)
+
+
+def respostas_da_sessao(session: ScoreSession) -> dict:
+    return desempacotar(session.respostas)
+
+
+def somas_da_sessao(session: ScoreSession) -> dict:
+    """{pilar: soma} direto da coluna compacta (O(1), sem consulta)."""
+    somas = session.soma_pilares or bytes(len(PILARES))
+    return dict(zip(PILARES, somas))
+
+
+def _juntar(session: ScoreSession, linhas: dict):
+    """Junta {pergunta: valor} de score_answers na coluna compacta (a compacta tem prioridade)."""
+    respostas = dict(linhas)
+    respostas.update(desempacotar(session.respostas))
+    session.respostas = empacotar(respostas)
+    session.soma_pilares = somar(respostas, questionario_da_sessao(session))
+
+
+def completar_da_tabela(db: Session, session: ScoreSession) -> bool:
+    """
+    Se a coluna compacta não tem todas as perguntas do questionário, junta
+    as linhas de score_answers da sessão (respondidas antes do deploy).
+    Devolve se alterou a sessão. Não faz commit.
+    """
+    if len(desempacotar(session.respostas)) >= questionario_da_sessao(session).num_perguntas:
+        return False
+    linhas = (
+        db.query(ScoreAnswer.question_number, ScoreAnswer.answer_value)
+        .filter(ScoreAnswer.score_session_id == session.id)
+        .order_by(ScoreAnswer.id)
+        .all()
+    )
+    if not linhas:
+        return False
+    _juntar(session, dict(linhas))
+    logger.info("Sessão %s completada com %s linha(s) de score_answers", session.id, len(linhas))
+    return True
+
+
+# ------------------------------------------------------------
+#   MIGRAÇÃO DAS LINHAS ANTIGAS
+# ------------------------------------------------------------
+def backfill(db: Session, lote: int = 500) -> int:
+    """
+    Empacota as linhas de score_answers nas sessões. Respostas que já
+    estão na coluna compacta (sessão que seguiu depois do deploy) têm
+    prioridade sobre as linhas. Devolve quantas sessões foram convertidas.
+    """
+    convertidas = 0
+    ultimo_id = 0
+    while True:
+        ids = [
+            sid for (sid,) in db.query(ScoreAnswer.score_session_id)
+            .filter(ScoreAnswer.score_session_id > ultimo_id)
+            .distinct()
+            .order_by(ScoreAnswer.score_session_id)
+            .limit(lote)
+        ]
+        if not ids:
+            break
+
+        linhas = (
+            db.query(ScoreAnswer.score_session_id, ScoreAnswer.question_number, ScoreAnswer.answer_value)
+            .filter(ScoreAnswer.score_session_id.in_(ids))
+            .order_by(ScoreAnswer.id)
+            .all()
+        )
+        por_sessao = {}
+        for sid, n, valor in linhas:
+            por_sessao.setdefault(sid, {})[n] = valor
+
+        for session in db.query(ScoreSession).filter(ScoreSession.id.in_(ids)):
+            _juntar(session, por_sessao.get(session.id, {}))
+            convertidas += 1
+
+        db.commit()
+        ultimo_id = ids[-1]
+        logger.info("Backfill: %s sessões convertidas (até id %s)", convertidas, ultimo_id)
+
+    return convertidas
+
+
+def _sql_byte(dialeto: str) -> str:
+    if dialeto == "postgresql":
+        return "get_byte(s.respostas, q.question_number - 1)"
+    if dialeto == "sqlite":
+        return "unicode(substr(s.respostas, q.question_number, 1))"
+    raise ValueError(f"View de compatibilidade não suportada em {dialeto}")
+
+
+def criar_view_compativel(engine):
+    """
+    Troca a tabela score_answers por uma view com as mesmas colunas, lida
+    da coluna compacta. A tabela antiga fica como score_answers_legado
+    (apague quando não precisar mais). Rode depois do backfill.
+    O pilar de cada pergunta sai do questionário da sessão; versões
+    criadas depois da view pedem recriá-la (DROP VIEW e rodar de novo).
+    """
+    perguntas = ", ".join(
+        f"('{versao}', {n}, '{pilar}')"
+        for versao, q in sorted(questionarios().items())
+        for n, pilar in sorted(q.pilar_map.items())
+    )
+    byte = _sql_byte(engine.dialect.name)
+
+    view = f"""
+        CREATE VIEW score_answers AS
+        WITH q(versao, question_number, pillar_code) AS (VALUES {perguntas})
+        SELECT
+            s.id * 100 + q.question_number AS id,
+            s.id AS score_session_id,
+            q.question_number AS question_number,
+            q.pillar_code AS pillar_code,
+            {byte} AS answer_value,
+            s.created_at AS created_at
+        FROM score_sessions s
+        JOIN q ON s.respostas IS NOT NULL AND q.versao = COALESCE(s.questionario_versao, '{VERSAO_LEGADO}')
+        WHERE {byte} > 0
+    """
+
+    with engine.begin() as conn:
+        tipo = conn.execute(
+            text("SELECT table_type FROM information_schema.tables WHERE table_name = 'score_answers'")
+            if engine.dialect.name == "postgresql"
+            else text("SELECT type FROM sqlite_master WHERE name = 'score_answers'")
+        ).scalar()
+        if tipo is not None and tipo.lower() == "view":
+            logger.info("score_answers já é uma view")
+            return
+        if tipo is not None:
+            conn.execute(text(f"ALTER TABLE score_answers RENAME TO {TABELA_LEGADO}"))
+        conn.execute(text(view))
@@ -0,0 +1,218 @@
+# app/services/score_lote.py
+"""
+Pontuação vetorizada de muitas sessões de uma vez (NumPy).
+
+As respostas de N sessões viram uma matriz N×30 (uint8, direto dos bytes
+de score_sessions.respostas) e as somas por pilar saem de um produto com
+a matriz indicadora 30×10 do questionário (1 onde a pergunta é do pilar).
+Pilar forte e tóxico são argmax/argmin das somas (empate fica com o
+primeiro em PILARES, como determinar_pilares), e o perfil sai das faixas
+de nota do questionário.
+
+repontuar() aplica isso ao histórico: lê as sessões concluídas em lotes
+por id, recalcula e grava só as linhas que mudaram (depois de mexer nos
+cortes dos perfis ou no pilar das perguntas de uma versão). Os PDFs das
+sessões alteradas podem ser refeitos com regenerar_relatorios().
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from app.models import ScorePillars, ScoreSession
+from app.services.questionario import MAX_PERGUNTAS, PILARES, VERSAO_LEGADO, questionarios
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------------------------------
+#   NÚCLEO
+# ------------------------------------------------------------
+def matriz_pilares(questionario) -> np.ndarray:
+    """30×10: linha n - 1 tem 1 na coluna do pilar da pergunta n."""
+    m = np.zeros((MAX_PERGUNTAS, len(PILARES)), dtype=np.int32)
+    m[np.arange(questionario.num_perguntas), questionario.indice_pilar] = 1
+    return m
+
+
+def matriz_respostas(blobs) -> np.ndarray:
+    """Bytes de score_sessions.respostas (30 cada, 0 = sem resposta) -> N×30 uint8."""
+    dados = b"".join(bytes(b or b"").ljust(MAX_PERGUNTAS, b"\0") for b in blobs)
+    return np.frombuffer(dados, dtype=np.uint8).reshape(-1, MAX_PERGUNTAS)
+
+
+def pontuar(respostas: np.ndarray, questionario) -> dict:
+    """
+    Resultado de todas as linhas de `respostas` (N×30) num questionário:
+    somas (N×10), total, índice do pilar forte e do tóxico em PILARES e
+    índice do perfil em questionario.perfis.
+    """
+    somas = respostas.astype(np.int32) @ matriz_pilares(questionario)
+    total = somas.sum(axis=1)
+    # perfis vão do maior corte para o menor: a posição é quantos cortes a nota não alcança
+    cortes = np.array([minimo for minimo, _ in questionario.perfis], dtype=np.int32)
+    perfil = np.minimum((total[:, None] < cortes[None, :]).sum(axis=1), len(cortes) - 1)
+    return {
+        "somas": somas,
+        "total": total,
+        "forte": somas.argmax(axis=1),
+        "toxico": somas.argmin(axis=1),
+        "perfil": perfil,
+    }
+
+
+# ------------------------------------------------------------
+#   RE-SCORE DO HISTÓRICO
+# ------------------------------------------------------------
+def _indices(valores, posicao: dict) -> np.ndarray:
+    return np.array([posicao.get(v, -1) for v in valores], dtype=np.int64)
+
+
+def _alteracoes(linhas, questionario) -> list:
+    """Linhas de uma mesma versão -> valores novos das que mudaram (comparação vetorizada)."""
+    r = pontuar(matriz_respostas(linha.respostas for linha in linhas), questionario)
+    somas = r["somas"].astype(np.uint8)
+    nomes_perfil = [nome for _, nome in questionario.perfis]
+    pos_pilar = {pilar: i for i, pilar in enumerate(PILARES)}
+
+    somas_atuais = np.frombuffer(
+        b"".join(bytes(linha.soma_pilares or b"").ljust(len(PILARES), b"\0") for linha in linhas),
+        dtype=np.uint8,
+    ).reshape(-1, len(PILARES))
+    mudou = (
+        (somas != somas_atuais).any(axis=1)
+        | (r["total"] != np.array([-1 if l.score_total is None else l.score_total for l in linhas]))
+        | (r["perfil"] != _indices((l.perfil_nome for l in linhas), {n: i for i, n in enumerate(nomes_perfil)}))
+        | (r["forte"] != _indices((l.pilar_dominante for l in linhas), pos_pilar))
+        | (r["toxico"] != _indices((l.pilar_toxico for l in linhas), pos_pilar))
+    )
+    return [
+        {
+            "b_id": linhas[i].id,
+            "score_total": int(r["total"][i]),
+            "perfil_nome": nomes_perfil[r["perfil"][i]],
+            "pilar_dominante": PILARES[r["forte"][i]],
+            "pilar_toxico": PILARES[r["toxico"][i]],
+            "soma_pilares": somas[i].tobytes(),
+        }
+        for i in np.flatnonzero(mudou)
+    ]
+
+
+def _gravar(db: Session, alteradas: list):
+    # executemany por id, sem carregar objetos ORM
+    db.execute(
+        update(ScoreSession.__table__)
+        .where(ScoreSession.__table__.c.id == bindparam("b_id"))
+        .values(
+            score_total=bindparam("score_total"),
+            perfil_nome=bindparam("perfil_nome"),
+            pilar_dominante=bindparam("pilar_dominante"),
+            pilar_toxico=bindparam("pilar_toxico"),
+            soma_pilares=bindparam("soma_pilares"),
+        ),
+        alteradas,
+    )
+    db.execute(
+        update(ScorePillars.__table__)
+        .where(ScorePillars.__table__.c.score_session_id == bindparam("b_id"))
+        .values({pilar: bindparam(f"b_{pilar}") for pilar in PILARES}),
+        [
+            {"b_id": a["b_id"], **{f"b_{pilar}": soma for pilar, soma in zip(PILARES, a["soma_pilares"])}}
+            for a in alteradas
+        ],
+    )
+
+
+def repontuar(db: Session, lote: int = 10_000, simular: bool = False) -> dict:
+    """
+    Recalcula o resultado de todas as sessões concluídas e grava as que
+    mudaram, um lote por transação. Devolve as contagens e os ids
+    alterados (para regenerar os relatórios).
+    """
+    compilados = questionarios()
+    colunas = (
+        ScoreSession.id,
+        ScoreSession.questionario_versao,
+        ScoreSession.respostas,
+        ScoreSession.soma_pilares,
+        ScoreSession.score_total,
+        ScoreSession.perfil_nome,
+        ScoreSession.pilar_dominante,
+        ScoreSession.pilar_toxico,
+    )
+    resultado = {"lidas": 0, "alteradas": 0, "sem_respostas": 0, "versao_desconhecida": 0, "ids": []}
+
+    ultimo_id = 0
+    while True:
+        linhas = db.execute(
+            select(*colunas)
+            .where(ScoreSession.id > ultimo_id, ScoreSession.status == "concluida", ScoreSession.respostas.isnot(None))
+            .order_by(ScoreSession.id)
+            .limit(lote)
+        ).all()
+        if not linhas:
+            break
+        ultimo_id = linhas[-1].id
+        resultado["lidas"] += len(linhas)
+
+        por_versao = {}
+        for linha in linhas:
+            por_versao.setdefault(linha.questionario_versao or VERSAO_LEGADO, []).append(linha)
+
+        alteradas = []
+        for versao, grupo in por_versao.items():
+            questionario = compilados.get(versao)
+            if questionario is None:
+                resultado["versao_desconhecida"] += len(grupo)
+                continue
+            alteradas.extend(_alteracoes(grupo, questionario))
+
+        if alteradas and not simular:
+            _gravar(db, alteradas)
+            db.commit()
+        resultado["alteradas"] += len(alteradas)
+        resultado["ids"].extend(a["b_id"] for a in alteradas)
+        logger.info("Re-score: %s lidas, %s alteradas (até id %s)", resultado["lidas"], resultado["alteradas"], ultimo_id)
+
+    # concluídas antes da coluna compacta: rodar compactar-respostas antes
+    resultado["sem_respostas"] = db.query(func.count(ScoreSession.id)).filter(
+        ScoreSession.status == "concluida", ScoreSession.respostas.is_(None)
+    ).scalar()
+    return resultado
+
+
+# ------------------------------------------------------------
+#   RELATÓRIOS DAS SESSÕES ALTERADAS
+# ------------------------------------------------------------
+def _regenerar(session_id: int):
+    # import tardio: IA e render só entram quando há relatório para refazer
+    from app.db import SessionLocal
+    from app.services.whatsapp_logic import regenerar_relatorio
+
+    db = SessionLocal()
+    try:
+        regenerar_relatorio(db, db.get(ScoreSession, session_id))
+    finally:
+        db.close()
+
+
+def regenerar_relatorios(ids, concorrencia: int = 4) -> dict:
+    """
+    Refaz os PDFs das sessões em paralelo: as threads esperam a IA (I/O) e
+    o render vai para o pool de processos (PDF_POOL_PROCESSOS).
+    """
+    refeitos = falhas = 0
+    with ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="regenerar") as executor:
+        futuros = {executor.submit(_regenerar, sid): sid for sid in ids}
+        for futuro in as_completed(futuros):
+            try:
+                futuro.result()
+            except Exception:
+                falhas += 1
+                logger.exception("Falha ao regenerar o relatório da sessão %s", futuros[futuro])
+            else:
+                refeitos += 1
+    return {"refeitos": refeitos, "falhas": falhas}
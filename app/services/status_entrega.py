@@ -0,0 +1,88 @@
+# app/services/status_entrega.py
+"""
+Status de entrega que a Meta manda no mesmo webhook das mensagens
+(sent, delivered, read, failed). Não passam pela máquina de estados nem
+pela fila do número: o webhook só anota em memória, e o flusher
+(app.services.flusher) grava em lote na tabela webhook_status, que só
+recebe INSERT. A compactação apaga o que passou de STATUS_ENTREGA_TTL_DIAS.
+"""
+from datetime import datetime, timedelta
+import json
+import logging
+import threading
+
+from app import metrics
+from app.config import settings
+from app.db import SessionLocal
+from app.models import WebhookStatus
+
+logger = logging.getLogger(__name__)
+
+_pendentes = []  # linhas ainda não gravadas
+_pendentes_lock = threading.Lock()
+
+
+def _instante(timestamp):
+    try:
+        return datetime.utcfromtimestamp(int(timestamp))
+    except (TypeError, ValueError):
+        return None
+
+
+def anotar(status: list):
+    """Guarda os itens de value.statuses[] do envelope para o próximo flush."""
+    linhas = []
+    for item in status:
+        nome = item.get("status") or "desconhecido"
+        metrics.incrementar("whatsapp_status_total", status=nome)
+        linhas.append({
+            "message_id": item.get("id"),
+            "whatsapp_number": item.get("recipient_id"),
+            "status": nome[:20],
+            "erro": json.dumps(item["errors"], ensure_ascii=False) if item.get("errors") else None,
+            "ocorrido_em": _instante(item.get("timestamp")),
+            "created_at": datetime.utcnow(),
+        })
+    with _pendentes_lock:
+        _pendentes.extend(linhas)
+
+
+def descarregar() -> int:
+    """Grava os status pendentes num INSERT em lote. Devolve quantos."""
+    global _pendentes
+    with _pendentes_lock:
+        linhas, _pendentes = _pendentes, []
+    if not linhas:
+        return 0
+
+    db = SessionLocal()
+    try:
+        db.execute(WebhookStatus.__table__.insert(), linhas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        with _pendentes_lock:
+            _pendentes[:0] = linhas
+        raise
+    finally:
+        db.close()
+    return len(linhas)
+
+
+def compactar(ttl_dias: int = None) -> int:
+    """Apaga status mais velhos que o TTL. Devolve quantos apagou."""
+    ttl_dias = settings.status_entrega_ttl_dias if ttl_dias is None else ttl_dias
+    limite = datetime.utcnow() - timedelta(days=ttl_dias)
+    db = SessionLocal()
+    try:
+        apagados = (
+            db.query(WebhookStatus)
+            .filter(WebhookStatus.created_at < limite)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+    finally:
+        db.close()
+    if apagados:
+        logger.info("Status de entrega: %s linha(s) antigas apagadas", apagados)
+    return apagados
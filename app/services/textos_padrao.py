@@ -0,0 +1,70 @@
+# app/services/textos_padrao.py
+"""
+Textos determinísticos usados quando a IA não responde a tempo
+(deadline estourado, erro upstream ou circuit breaker aberto).
+"""
+
+LEITURA_PERFIL = {
+    "Realizador Visionário": (
+        "Você opera como Realizador Visionário: já construiu estrutura, clareza e "
+        "consistência suficientes para que o crescimento deixe de depender do esforço "
+        "diário e passe a depender da qualidade das suas decisões."
+    ),
+    "Construtor Consistente": (
+        "Você opera como Construtor Consistente: existe base sólida e disciplina, mas "
+        "parte da sua energia ainda está presa em sustentar o que já construiu, em vez "
+        "de multiplicar."
+    ),
+    "Operador em Evolução": (
+        "Você opera como Operador em Evolução: há avanço real, porém boa parte do seu "
+        "resultado ainda depende de você estar presente em tudo, o que limita escala e "
+        "clareza."
+    ),
+    "Sobrecarregado em Recuperação": (
+        "Você está no perfil Sobrecarregado em Recuperação: o volume de demandas está "
+        "consumindo a energia que deveria ir para as decisões que realmente mudam o seu "
+        "futuro."
+    ),
+}
+
+FORCA_PILAR = {
+    "tempo": "Sua força está no Tempo: você protege a agenda e sabe onde colocar atenção.",
+    "familia": "Sua força está na Família: há presença, valores compartilhados e base emocional.",
+    "decisao": "Sua força está na Decisão: você tem foco e coragem para cortar o que drena.",
+    "dinheiro": "Sua força está no Dinheiro: seus recursos circulam e se multiplicam com estratégia.",
+    "fe_principios": "Sua força está em Fé e Princípios: suas escolhas têm direção e coerência.",
+    "legado": "Sua força está no Legado: você transmite sabedoria e prepara quem vem depois.",
+    "energia_saude": "Sua força está em Energia e Saúde: seu corpo sustenta a clareza que você precisa.",
+    "networking": "Sua força está no Networking: você cultiva alianças profundas e gera valor antes de pedir.",
+    "aprendizado": "Sua força está no Aprendizado: você transforma conhecimento em ação rapidamente.",
+    "risco_medo": "Sua força está na gestão de Risco e Medo: você decide com método, mesmo sob pressão.",
+}
+
+RISCO_PILAR = {
+    "tempo": "O ponto crítico é o Tempo: sem blocos protegidos para pensar, o urgente decide por você.",
+    "familia": "O ponto crítico é a Família: a distância do núcleo mais próximo cobra um preço silencioso.",
+    "decisao": "O ponto crítico é a Decisão: frentes demais abertas diluem sua força e atrasam tudo.",
+    "dinheiro": "O ponto crítico é o Dinheiro: recursos parados ou sem sistema limitam sua multiplicação.",
+    "fe_principios": "O ponto crítico são Fé e Princípios: sem um norte claro, cada decisão custa mais energia.",
+    "legado": "O ponto crítico é o Legado: o que você constrói ainda depende demais de você.",
+    "energia_saude": "O ponto crítico é Energia e Saúde: sem base física, a clareza e a presença caem.",
+    "networking": "O ponto crítico é o Networking: poucas alianças estratégicas deixam seu crescimento isolado.",
+    "aprendizado": "O ponto crítico é o Aprendizado: consumir sem aplicar acumula informação, não resultado.",
+    "risco_medo": "O ponto crítico é Risco e Medo: a hesitação diante do incerto está custando oportunidades.",
+}
+
+
+def interpretacao_padrao(perfil, pilar_forte, pilar_toxico):
+    return " ".join((
+        LEITURA_PERFIL.get(perfil, ""),
+        FORCA_PILAR.get(pilar_forte, ""),
+        RISCO_PILAR.get(pilar_toxico, ""),
+    )).strip()
+
+
+def convite_padrao(perfil, pilar_toxico):
+    risco = RISCO_PILAR.get(pilar_toxico, "Existe um ponto sensível drenando sua força.")
+    return (
+        f"{risco} Em uma Sessão Solucionista™ atacamos exatamente esse ponto, com um "
+        "plano objetivo para destravar o seu próximo ciclo."
+    )
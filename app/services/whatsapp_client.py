@@ -0,0 +1,269 @@
+# app/services/whatsapp_client.py
+"""
+Cliente único da Graph API do WhatsApp.
+
+- conexões persistentes (keep-alive, HTTP/2 opcional) reaproveitadas entre envios
+- timeouts limitados
+- retry com backoff + jitter em 429 e 5xx (respeita Retry-After)
+- token bucket por número de telefone (limite de throughput da Meta)
+- fila de prioridade: resposta da próxima pergunta sai antes de relatório
+"""
+import asyncio
+import itertools
+import logging
+import random
+import threading
+import time
+import weakref
+from typing import Optional
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# menor número = sai primeiro
+PRIORIDADE_RESPOSTA = 0
+PRIORIDADE_RELATORIO = 10
+
+
+class WhatsAppAPIError(RuntimeError):
+    def __init__(self, status_code: int, corpo: str):
+        super().__init__(f"Graph API respondeu {status_code}: {corpo[:300]}")
+        self.status_code = status_code
+        self.corpo = corpo
+
+
+# ------------------------------------------------------------
+#   TOKEN BUCKET
+# ------------------------------------------------------------
+class TokenBucket:
+    """
+    Token bucket por reserva: cada chamada consome um token e devolve quanto
+    tempo esperar até ele existir. Funciona igual em código sync e async.
+    """
+
+    def __init__(self, taxa_por_segundo: float, capacidade: float):
+        self.taxa = taxa_por_segundo
+        self.capacidade = capacidade
+        self._tokens = capacidade
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self) -> float:
+        with self._lock:
+            agora = time.monotonic()
+            self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+            self._ultimo = agora
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.taxa
+
+
+def _deve_repetir(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def _atraso_retry(tentativa: int, resposta: Optional[httpx.Response] = None) -> float:
+    if resposta is not None:
+        retry_after = resposta.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.whatsapp_retry_max_segundos)
+    teto = min(settings.whatsapp_retry_max_segundos, settings.whatsapp_retry_base_segundos * (2 ** tentativa))
+    # "equal jitter": metade fixa, metade aleatória
+    return teto / 2 + random.uniform(0, teto / 2)
+
+
+# ------------------------------------------------------------
+#   CLIENTE
+# ------------------------------------------------------------
+class WhatsAppClient:
+    def __init__(
+        self,
+        api_url: str,
+        phone_id: str,
+        token: str,
+        taxa_por_segundo: float = None,
+        http2: bool = None,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.phone_id = phone_id
+        self.token = token
+        self.http2 = settings.whatsapp_http2 if http2 is None else http2
+
+        taxa = settings.whatsapp_msgs_por_segundo if taxa_por_segundo is None else taxa_por_segundo
+        self.bucket = TokenBucket(taxa, capacidade=max(1.0, taxa))
+
+        self._http: Optional[httpx.Client] = None
+        # estado async fica por event loop (web e loop de fundo do worker
+        # podem usar o mesmo cliente sem misturar conexões e filas)
+        self._por_loop = weakref.WeakKeyDictionary()
+        self._seq = itertools.count()
+
+    # --------------------------------------------------------
+    #   conexões (criadas sob demanda e reaproveitadas)
+    # --------------------------------------------------------
+    def _opcoes_http(self) -> dict:
+        return {
+            "base_url": self.api_url,
+            "headers": {"Authorization": f"Bearer {self.token}"},
+            "timeout": httpx.Timeout(settings.whatsapp_timeout_segundos, connect=3.0),
+            "limits": httpx.Limits(
+                max_connections=settings.whatsapp_max_conexoes,
+                max_keepalive_connections=settings.whatsapp_max_conexoes,
+                keepalive_expiry=60.0,
+            ),
+            "http2": self.http2,
+        }
+
+    @property
+    def http(self) -> httpx.Client:
+        if self._http is None:
+            self._http = httpx.Client(**self._opcoes_http())
+        return self._http
+
+    def _estado_loop(self) -> dict:
+        loop = asyncio.get_running_loop()
+        estado = self._por_loop.get(loop)
+        if estado is None:
+            estado = self._por_loop[loop] = {"ahttp": None, "fila": None, "dispatchers": []}
+        return estado
+
+    @property
+    def ahttp(self) -> httpx.AsyncClient:
+        estado = self._estado_loop()
+        if estado["ahttp"] is None:
+            estado["ahttp"] = httpx.AsyncClient(**self._opcoes_http())
+        return estado["ahttp"]
+
+    # --------------------------------------------------------
+    #   POST com retry (sync e async)
+    # --------------------------------------------------------
+    def post(self, caminho: str, **kwargs) -> dict:
+        tentativas = settings.whatsapp_max_tentativas
+        for tentativa in range(tentativas):
+            time.sleep(self.bucket.reservar())
+            try:
+                resposta = self.http.post(caminho, **kwargs)
+            except httpx.TransportError:
+                if tentativa == tentativas - 1:
+                    raise
+                time.sleep(_atraso_retry(tentativa))
+                continue
+            if _deve_repetir(resposta.status_code) and tentativa < tentativas - 1:
+                time.sleep(_atraso_retry(tentativa, resposta))
+                continue
+            return self._checar(resposta)
+
+    async def post_async(self, caminho: str, **kwargs) -> dict:
+        tentativas = settings.whatsapp_max_tentativas
+        for tentativa in range(tentativas):
+            await asyncio.sleep(self.bucket.reservar())
+            try:
+                resposta = await self.ahttp.post(caminho, **kwargs)
+            except httpx.TransportError:
+                if tentativa == tentativas - 1:
+                    raise
+                await asyncio.sleep(_atraso_retry(tentativa))
+                continue
+            if _deve_repetir(resposta.status_code) and tentativa < tentativas - 1:
+                await asyncio.sleep(_atraso_retry(tentativa, resposta))
+                continue
+            return self._checar(resposta)
+
+    @staticmethod
+    def _checar(resposta: httpx.Response) -> dict:
+        if resposta.status_code >= 400:
+            raise WhatsAppAPIError(resposta.status_code, resposta.text)
+        return resposta.json() if resposta.content else {}
+
+    # --------------------------------------------------------
+    #   FILA DE PRIORIDADE (caminho async)
+    # --------------------------------------------------------
+    async def enviar(self, payload: dict, prioridade: int = PRIORIDADE_RESPOSTA) -> dict:
+        """Enfileira uma mensagem e espera o envio. Menor prioridade sai antes."""
+        fila = self._garantir_dispatchers()
+        futuro = asyncio.get_running_loop().create_future()
+        await fila.put((prioridade, next(self._seq), payload, futuro))
+        return await futuro
+
+    def enviar_sync(self, payload: dict) -> dict:
+        """Envio direto, para código sync (worker). Passa pelo mesmo token bucket."""
+        return self.post(f"/{self.phone_id}/messages", json=payload)
+
+    def _garantir_dispatchers(self) -> asyncio.PriorityQueue:
+        estado = self._estado_loop()
+        if estado["fila"] is None:
+            estado["fila"] = asyncio.PriorityQueue()
+            estado["dispatchers"] = [
+                asyncio.create_task(self._dispatcher(estado["fila"]))
+                for _ in range(settings.whatsapp_envios_concorrentes)
+            ]
+        return estado["fila"]
+
+    async def _dispatcher(self, fila: asyncio.PriorityQueue):
+        while True:
+            _, _, payload, futuro = await fila.get()
+            try:
+                resultado = await self.post_async(f"/{self.phone_id}/messages", json=payload)
+            except Exception as e:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            else:
+                if not futuro.done():
+                    futuro.set_result(resultado)
+            finally:
+                fila.task_done()
+
+    def tamanho_fila(self) -> int:
+        return sum(e["fila"].qsize() for e in list(self._por_loop.values()) if e["fila"] is not None)
+
+    async def fechar(self):
+        """Fecha o estado async do loop atual e o cliente sync."""
+        estado = self._por_loop.pop(asyncio.get_running_loop(), None)
+        if estado is not None:
+            for tarefa in estado["dispatchers"]:
+                tarefa.cancel()
+            if estado["ahttp"] is not None:
+                await estado["ahttp"].aclose()
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+
+# ------------------------------------------------------------
+#   PAYLOADS
+# ------------------------------------------------------------
+def payload_texto(to: str, texto: str) -> dict:
+    return {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "text",
+        "text": {"body": texto},
+    }
+
+
+# ------------------------------------------------------------
+#   INSTÂNCIA COMPARTILHADA
+# ------------------------------------------------------------
+_client: Optional[WhatsAppClient] = None
+
+
+def get_whatsapp_client() -> WhatsAppClient:
+    global _client
+    if _client is None:
+        _client = WhatsAppClient(
+            api_url=settings.whatsapp_api_url,
+            phone_id=settings.whatsapp_phone_id,
+            token=settings.whatsapp_token,
+        )
+    return _client
+
+
+async def fechar_whatsapp_client():
+    global _client
+    if _client is not None:
+        await _client.fechar()
+        _client = None
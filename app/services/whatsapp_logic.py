@@ -1,117 +1,149 @@
-import os
-import requests
+import asyncio
+from collections import namedtuple
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, select, text, update
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import metrics
+from app.config import settings
+from app.db import engine, insert_upsert
 from app.models import (
     User,
     ScoreSession,
-    ScoreAnswer,
     ScorePillars,
 )
-from app.services.pdf_creator import gerar_pdf_relatorio
-
-from app.services.gpt_logic import (
-    montar_interpretacao_combinada,
-    montar_convite_sessao,
+from app.services.relatorio_store import get_relatorio_store
+from app.services.jobs import enfileirar_finalizacao, enfileirar_reenvio
+from app.services.especulacao import verificar_especulacao, registrar_resultado, resultado_a_especular
+from app.services.respostas import completar_da_tabela, registrar_resposta, somas_da_sessao
+from app.services.percentis import para_relatorio, registrar as registrar_percentis
+from app.services.questionario import (
+    FAIXAS_RENDA,
+    PERGUNTA,
+    VERSAO_LEGADO,
+    get_questionario,
+    questionario_da_sessao,
+)
+from app.services.estado_conversa import EstadoConversa, get_estado_store, gravar_estados
+from app.services.idempotencia import (
+    gravar as gravar_ids,
+    linha as linha_id,
+    processar_lote_uma_vez,
+    processar_uma_vez,
+)
+from app.services.whatsapp_client import (
+    PRIORIDADE_RESPOSTA,
+    PRIORIDADE_RELATORIO,
+    WhatsAppAPIError,
+    get_whatsapp_client,
+    payload_texto,
 )
+from app.services.loop_async import rodar
 
-WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
-PHONE_ID = os.getenv("WHATSAPP_PHONE_ID")
-API_URL = os.getenv("WHATSAPP_API_URL", "https://graph.facebook.com/v20.0")
+logger = logging.getLogger(__name__)
+
+NOME_ARQUIVO_RELATORIO = "relatorio.pdf"
 
 
 # ------------------------------------------------------------
 #   ENVIAR MENSAGEM NO WHATSAPP (TEXTO)
 # ------------------------------------------------------------
 def enviar_whatsapp_texto(to, texto):
-    url = f"{API_URL}/{PHONE_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": to,
-        "type": "text",
-        "text": {"body": texto},
-    }
-    requests.post(url, json=payload, headers=headers)
+    # caminho sync (worker): vai direto, passando pelo token bucket
+    with metrics.etapa("envio"):
+        return get_whatsapp_client().enviar_sync(payload_texto(to, texto))
+
+
+async def enviar_whatsapp_texto_async(to, texto, prioridade=PRIORIDADE_RESPOSTA):
+    # inclui a espera na fila de prioridade do cliente
+    with metrics.etapa("envio"):
+        return await get_whatsapp_client().enviar(payload_texto(to, texto), prioridade)
 
 
 # ------------------------------------------------------------
 #   ENVIAR PDF NO WHATSAPP
 # ------------------------------------------------------------
-def enviar_whatsapp_documento(to, pdf_path, nome_arquivo="relatorio.pdf"):
-    url = f"{API_URL}/{PHONE_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-    }
+class RelatorioIndisponivel(LookupError):
+    """O PDF da sessão não está mais no relatorio_store (despejado)."""
 
-    with open(pdf_path, "rb") as f:
-        files = {
-            "document": (nome_arquivo, f, "application/pdf")
-        }
-        data = {
-            "messaging_product": "whatsapp",
-            "to": to,
-            "type": "document"
-        }
-        requests.post(
-            url,
+
+def upload_whatsapp_media(pdf_bytes: bytes, nome_arquivo="relatorio.pdf"):
+    """Sobe o PDF (bytes em memória) no endpoint de mídia e devolve o media id."""
+    client = get_whatsapp_client()
+
+    files = {
+        "file": (nome_arquivo, pdf_bytes, "application/pdf")
+    }
+    data = {
+        "messaging_product": "whatsapp",
+        "type": "application/pdf",
+    }
+    with metrics.etapa("upload_midia"):
+        resposta = client.post(
+            f"/{client.phone_id}/media",
             data=data,
             files=files,
-            headers=headers
         )
+    return resposta["id"]
 
 
-# ------------------------------------------------------------
-#   MAPA DE PILARES E PERGUNTAS
-# ------------------------------------------------------------
-PILAR_MAP = {
-    1:"tempo",2:"tempo",3:"tempo",
-    4:"familia",5:"familia",6:"familia",
-    7:"decisao",8:"decisao",9:"decisao",
-    10:"dinheiro",11:"dinheiro",12:"dinheiro",
-    13:"fe_principios",14:"fe_principios",15:"fe_principios",
-    16:"legado",17:"legado",18:"legado",
-    19:"energia_saude",20:"energia_saude",21:"energia_saude",
-    22:"networking",23:"networking",24:"networking",
-    25:"aprendizado",26:"aprendizado",27:"aprendizado",
-    28:"risco_medo",29:"risco_medo",30:"risco_medo",
-}
-
-QUESTION_TEXT = {
-    1: "Minha agenda reflete claramente o que será importante para mim nos próximos 10 anos.",
-    2: "Consigo dizer “não” para oportunidades que não mudam meu futuro.",
-    3: "Tenho blocos consistentes de tempo para pensar e decidir.",
-    4: "Tenho rituais semanais de presença real com minha família.",
-    5: "Meus filhos (ou futuros filhos) aprendem comigo sobre valores e decisões.",
-    6: "Meu cônjuge está integrado ao meu mundo e decisões.",
-    7: "Foco em no máximo 3 grandes frentes pelos próximos anos.",
-    8: "Tenho coragem de encerrar projetos que drenam energia.",
-    9: "Minhas decisões seguem critérios simples e não-negociáveis.",
-    10: "Invisto lucros em pessoas e projetos que multiplicam sem mim.",
-    11: "Dinheiro nunca fica parado — circula de forma estratégica.",
-    12: "Tenho sistemas que multiplicam dinheiro mesmo sem eu trabalhar.",
-    13: "Minhas decisões refletem meus princípios, mesmo quando custam dinheiro.",
-    14: "Tenho propósito claro que guia minha rotina.",
-    15: "Sou o mesmo no trabalho, na família e comigo mesmo.",
-    16: "Discuto abertamente sobre dinheiro e princípios com minha família.",
-    17: "Transmito sabedoria, não apenas recursos.",
-    18: "Preparo sucessores para multiplicar, não apenas manter.",
-    19: "Durmo o suficiente para clareza e presença.",
-    20: "Tenho uma rotina mínima de movimento físico.",
-    21: "Faço escolhas alimentares com intenção.",
-    22: "Tenho uma rede pequena, mas profunda, de confiança.",
-    23: "Invisto tempo em alianças estratégicas.",
-    24: "Gero valor antes de pedir.",
-    25: "Aplico imediatamente o que aprendo.",
-    26: "Não começo algo novo antes de implementar o que já aprendi.",
-    27: "Consumo informação com estratégia.",
-    28: "Decido mesmo sentindo medo.",
-    29: "Penso no longo prazo mesmo em crises.",
-    30: "Avalio riscos com método, não com paralisia.",
-}
+def enviar_whatsapp_documento(to, media_id, nome_arquivo="relatorio.pdf"):
+    with metrics.etapa("envio_documento"):
+        return get_whatsapp_client().enviar_sync({
+            "messaging_product": "whatsapp",
+            "to": to,
+            "type": "document",
+            "document": {"id": media_id, "filename": nome_arquivo},
+        })
+
+
+def garantir_media_relatorio(db: Session, session: ScoreSession, pdf_bytes: bytes = None):
+    """
+    Devolve o media id do relatório da sessão, subindo o PDF só quando
+    ainda não existe id ou ele está perto de expirar. Quem acabou de
+    renderizar passa os bytes; nos reenvios eles vêm do relatorio_store.
+    """
+    margem = timedelta(hours=settings.whatsapp_media_margem_horas)
+    if session.media_id and session.media_expira_em and session.media_expira_em - margem > datetime.utcnow():
+        return session.media_id
+
+    if pdf_bytes is None:
+        pdf_bytes = get_relatorio_store().ler(session.pdf_hash) if session.pdf_hash else None
+        if pdf_bytes is None:
+            raise RelatorioIndisponivel(f"PDF da sessão {session.id} não está no armazenamento")
+
+    session.media_id = upload_whatsapp_media(pdf_bytes, NOME_ARQUIVO_RELATORIO)
+    session.media_expira_em = datetime.utcnow() + timedelta(days=settings.whatsapp_media_validade_dias)
+    db.commit()
+    return session.media_id
+
+
+def enviar_relatorio(db: Session, session: ScoreSession, to, pdf_bytes: bytes = None):
+    media_id = garantir_media_relatorio(db, session, pdf_bytes)
+    try:
+        return enviar_whatsapp_documento(to, media_id, NOME_ARQUIVO_RELATORIO)
+    except WhatsAppAPIError:
+        # id recusado (expirado antes da hora ou apagado): o retry do job sobe de novo
+        session.media_id = None
+        session.media_expira_em = None
+        db.commit()
+        raise
+
+
+def reenviar_relatorio(db: Session, session: ScoreSession, to):
+    try:
+        return enviar_relatorio(db, session, to)
+    except RelatorioIndisponivel:
+        # despejado pela retenção: avisa em vez de deixar o job falhar em loop
+        return enviar_whatsapp_texto(
+            to,
+            "Seu relatório anterior não está mais disponível. "
+            "Envie qualquer mensagem para fazer um novo Score de Riqueza."
+        )
 
 
 # ------------------------------------------------------------
@@ -123,59 +155,164 @@ def extract_message_and_number(body):
     return number, message
 
 
+def extract_message_id(body):
+    return body.get("id") or None
+
+
+# Envelope nativo da Cloud API:
+# {"entry": [{"changes": [{"value": {"messages": [...], "statuses": [...]}}]}]}
+MensagemRecebida = namedtuple("MensagemRecebida", "numero texto message_id timestamp")
+
+
+def eh_envelope_meta(body) -> bool:
+    return isinstance(body, dict) and isinstance(body.get("entry"), list)
+
+
+def _texto_da_mensagem(mensagem) -> str:
+    tipo = mensagem.get("type")
+    if tipo == "text":
+        return mensagem.get("text", {}).get("body") or ""
+    if tipo == "button":
+        # resposta rápida de template
+        return mensagem.get("button", {}).get("text") or ""
+    if tipo == "interactive":
+        interativo = mensagem.get("interactive", {})
+        escolha = interativo.get("button_reply") or interativo.get("list_reply") or {}
+        return escolha.get("title") or escolha.get("id") or ""
+    # mídia, localização etc.: a máquina de estados trata como texto vazio
+    return ""
+
+
+def extrair_envelope_meta(body):
+    """
+    Devolve (mensagens, status) de um envelope da Meta: mensagens como
+    MensagemRecebida, em ordem de timestamp (estável), e os itens de
+    statuses[] como vieram.
+    """
+    mensagens, status = [], []
+    for entry in body.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            for m in value.get("messages") or []:
+                if not m.get("from"):
+                    continue
+                mensagens.append(MensagemRecebida(
+                    numero=m["from"],
+                    texto=_texto_da_mensagem(m).strip(),
+                    message_id=m.get("id") or None,
+                    timestamp=int(m.get("timestamp") or 0),
+                ))
+            status.extend(value.get("statuses") or [])
+    mensagens.sort(key=lambda m: m.timestamp)
+    return mensagens, status
+
+
+# Upserts de um comando só: mensagens simultâneas do mesmo número não
+# criam usuário nem sessão em dobro (índices únicos em app.models). No
+# conflito, o UPDATE sem efeito faz o RETURNING devolver a linha existente.
+# Aceitam vários números/usuários de uma vez (VALUES com várias linhas)
+# para os lotes do envelope da Meta.
+def _upsert_usuarios(dialeto: str, whatsapp_numbers):
+    insert = insert_upsert(dialeto)
+    return (
+        insert(User)
+        .values([{"whatsapp_number": n} for n in whatsapp_numbers])
+        .on_conflict_do_update(index_elements=[User.whatsapp_number], set_={"nome": User.nome})
+        .returning(User)
+    )
+
+
+def _upsert_sessoes(dialeto: str, users):
+    insert = insert_upsert(dialeto)
+    return (
+        insert(ScoreSession)
+        .values([
+            {
+                "user_id": user.id,
+                "status": "em_andamento",
+                "estado_atual": "COLETAR_NOME",
+                "questionario_versao": settings.questionario_versao,
+            }
+            for user in users
+        ])
+        .on_conflict_do_update(
+            index_elements=[ScoreSession.user_id],
+            # literal, igual ao do índice: com parâmetro o PostgreSQL não infere o índice parcial
+            index_where=text("status = 'em_andamento'"),
+            set_={"estado_atual": ScoreSession.estado_atual},
+        )
+        .returning(ScoreSession)
+    )
+
+
+_RECARREGAR = {"populate_existing": True}
+
+
 def get_or_create_user(db: Session, whatsapp_number: str):
-    user = db.query(User).filter_by(whatsapp_number=whatsapp_number).first()
-    if user:
-        return user
-    user = User(whatsapp_number=whatsapp_number)
-    db.add(user)
+    stmt = _upsert_usuarios(db.get_bind().dialect.name, [whatsapp_number])
+    user = db.scalars(stmt, execution_options=_RECARREGAR).one()
     db.commit()
-    db.refresh(user)
     return user
 
 
 def get_or_create_session(db: Session, user: User):
-    session = db.query(ScoreSession).filter_by(
-        user_id=user.id,
-        status="em_andamento"
-    ).first()
-    if session:
-        return session
-    session = ScoreSession(
-        user_id=user.id,
-        estado_atual="COLETAR_NOME"
-    )
-    db.add(session)
+    stmt = _upsert_sessoes(db.get_bind().dialect.name, [user])
+    session = db.scalars(stmt, execution_options=_RECARREGAR).one()
     db.commit()
-    db.refresh(session)
     return session
 
 
-def pergunta_score(n):
-    return (
-        f"Pergunta {n}/30:\n\n"
-        "Responda de 1 a 5:\n"
-        "1 = Nunca\n5 = Sempre\n\n"
-        f"{QUESTION_TEXT[n]}"
+async def get_or_create_user_async(db: AsyncSession, whatsapp_number: str):
+    stmt = _upsert_usuarios(db.bind.dialect.name, [whatsapp_number])
+    user = (await db.scalars(stmt, execution_options=_RECARREGAR)).one()
+    await db.commit()
+    return user
+
+
+async def get_or_create_session_async(db: AsyncSession, user: User):
+    stmt = _upsert_sessoes(db.bind.dialect.name, [user])
+    session = (await db.scalars(stmt, execution_options=_RECARREGAR)).one()
+    await db.commit()
+    return session
+
+
+def carregar_usuarios_e_sessoes(db: Session, whatsapp_numbers) -> dict:
+    """
+    {número: (user, sessão em andamento)} para vários números: um SELECT
+    com join para quem já existe; os que faltam (usuário ou sessão) saem
+    de um upsert em lote cada. Não faz commit.
+    """
+    dialeto = db.get_bind().dialect.name
+    linhas = db.execute(
+        select(User, ScoreSession)
+        .outerjoin(ScoreSession, and_(ScoreSession.user_id == User.id, ScoreSession.status == "em_andamento"))
+        .where(User.whatsapp_number.in_(whatsapp_numbers)),
+        execution_options=_RECARREGAR,
     )
+    encontrados = {user.whatsapp_number: (user, session) for user, session in linhas}
+
+    novos = [n for n in whatsapp_numbers if n not in encontrados]
+    if novos:
+        for user in db.scalars(_upsert_usuarios(dialeto, novos), execution_options=_RECARREGAR):
+            encontrados[user.whatsapp_number] = (user, None)
+
+    sem_sessao = [user for user, session in encontrados.values() if session is None]
+    if sem_sessao:
+        por_id = {user.id: user for user in sem_sessao}
+        for session in db.scalars(_upsert_sessoes(dialeto, sem_sessao), execution_options=_RECARREGAR):
+            user = por_id[session.user_id]
+            encontrados[user.whatsapp_number] = (user, session)
+    return encontrados
 
 
 # ------------------------------------------------------------
 #   CÁLCULO DOS PILARES
 # ------------------------------------------------------------
 def calcular_pilares(db, session):
-    respostas = session.answers
-    soma = {
-        "tempo":0,"familia":0,"decisao":0,"dinheiro":0,
-        "fe_principios":0,"legado":0,"energia_saude":0,
-        "networking":0,"aprendizado":0,"risco_medo":0,
-    }
-    for r in respostas:
-        soma[r.pillar_code] += r.answer_value
-
-    db.add(ScorePillars(score_session_id=session.id, **soma))
-    db.commit()
-    return soma
+    # somas mantidas a cada resposta: nada para carregar nem somar aqui,
+    # a não ser na sessão que começou antes das colunas compactas
+    completar_da_tabela(db, session)
+    return somas_da_sessao(session)
 
 
 def determinar_pilares(soma):
@@ -186,55 +323,155 @@ def calcular_score_total(soma):
     return sum(soma.values())
 
 
-def determinar_perfil(score):
-    if score >= 120:
-        return "Realizador Visionário"
-    if score >= 100:
-        return "Construtor Consistente"
-    if score >= 80:
-        return "Operador em Evolução"
-    return "Sobrecarregado em Recuperação"
+def determinar_perfil(score, questionario=None):
+    # os cortes de cada perfil vêm do questionário (v1: 120, 100 e 80)
+    return (questionario or get_questionario(VERSAO_LEGADO)).determinar_perfil(score)
 
 
 # ------------------------------------------------------------
 #   FINALIZAÇÃO DO SCORE / PDF / IA / WHATSAPP
 # ------------------------------------------------------------
-def finalizar_score(db, user, session, number):
-    soma = calcular_pilares(db, session)
-    pilar_forte, pilar_toxico = determinar_pilares(soma)
-    score = calcular_score_total(soma)
-    perfil = determinar_perfil(score)
+def _gravar_interpretacao_enviada(session_id: int, texto: str):
+    with engine.begin() as conn:
+        conn.execute(
+            update(ScoreSession).where(ScoreSession.id == session_id).values(interpretacao_enviada=texto)
+        )
 
-    session.pilar_dominante = pilar_forte
-    session.pilar_toxico = pilar_toxico
-    session.score_total = score
-    session.perfil_nome = perfil
-    session.status = "concluida"
-    db.commit()
 
-    # IA cria as interpretações
-    interpretacao = montar_interpretacao_combinada(perfil, pilar_forte, pilar_toxico)
-    convite = montar_convite_sessao(perfil, pilar_toxico)
+async def _textos_e_grafico_em_paralelo(
+    number, session_id, ja_enviada, soma, pilar_max, perfil, pilar_forte, pilar_toxico
+):
+    """
+    Interpretação em streaming (cada parágrafo vai direto para o WhatsApp),
+    convite e gráfico radar, tudo ao mesmo tempo.
+
+    Cada parágrafo entregue fica gravado na sessão: um retry do job usa o
+    que já foi enviado (`ja_enviada`) em vez de mandar outra leitura.
+    """
+    from app.services.gpt_logic import montar_convite, montar_textos_relatorio
+    from app.services.pdf_creator import preparar_radar
+
+    inicio = time.perf_counter()
+    enviados = []
+
+    async def ao_paragrafo(paragrafo):
+        if not enviados:
+            metrics.observar("relatorio_primeiro_paragrafo_segundos", time.perf_counter() - inicio)
+        await enviar_whatsapp_texto_async(number, paragrafo, PRIORIDADE_RELATORIO)
+        enviados.append(paragrafo)
+        await asyncio.to_thread(_gravar_interpretacao_enviada, session_id, "\n\n".join(enviados))
+
+    async def sem_stream():
+        return ja_enviada, await montar_convite(perfil, pilar_toxico)
+
+    if ja_enviada:
+        textos = sem_stream()
+    else:
+        textos = montar_textos_relatorio(perfil, pilar_forte, pilar_toxico, ao_paragrafo)
+    if settings.pdf_pool_processos > 0:
+        # com o pool, o radar é desenhado junto com o PDF no processo de render
+        interpretacao, convite = await textos
+        return interpretacao, convite, None
+
+    (interpretacao, convite), radar_png = await asyncio.gather(
+        textos,
+        asyncio.to_thread(preparar_radar, soma, pilar_max),
+    )
+    return interpretacao, convite, radar_png
+
 
-    dados_pdf = {
+def _dados_pdf(db, user, session, soma, interpretacao, convite, radar_png=None) -> dict:
+    return {
+        # eixo do radar: pilares e escala mudam com a versão do questionário
+        "pilar_max": questionario_da_sessao(session).pilar_max,
+        # posição do usuário entre os outros ("top X%"), por pilar e no total
+        **para_relatorio(db, user.renda_faixa, soma, session.score_total),
         "nome": user.nome,
-        "score_total": score,
-        "perfil": perfil,
-        "pilar_dominante": pilar_forte,
-        "pilar_toxico": pilar_toxico,
+        "score_total": session.score_total,
+        "perfil": session.perfil_nome,
+        "pilar_dominante": session.pilar_dominante,
+        "pilar_toxico": session.pilar_toxico,
         "pilares": soma,
         "interpretacao": interpretacao,
         "convite_sessao": convite,
         "renda_qualificada": session.renda_qualificada,
+        "radar_png": radar_png,
+        "gerado_em": session.completed_at,
     }
 
-    pdf_path = gerar_pdf_relatorio(dados_pdf, session.id)
-    session.pdf_url = pdf_path
+
+def _guardar_pdf(db, session, pdf_bytes: bytes):
+    chave = get_relatorio_store().salvar(pdf_bytes)
+    if chave != session.pdf_hash:
+        # PDF novo: o media id antigo (se houver) não vale mais
+        session.media_id = None
+        session.media_expira_em = None
+    session.pdf_hash = chave
+    session.pdf_url = f"/relatorios/{chave}"
     db.commit()
 
+
+def finalizar_score(db, user, session, number):
+    if session.status == "concluida":
+        # job reexecutado depois da entrega (caiu antes de marcar o job como concluído)
+        return
+
+    # import tardio: IA (openai) e render (reportlab) só rodam no worker; o
+    # processo web importa este módulo sem pagar por eles (app.services.precarga)
+    from app.services.gpt_logic import montar_textos_relatorio
+    from app.services.render_pool import renderizar_pdf
+
+    with metrics.etapa("pilares"):
+        soma = calcular_pilares(db, session)
+        pilar_forte, pilar_toxico = determinar_pilares(soma)
+        score = calcular_score_total(soma)
+        perfil = determinar_perfil(score, questionario_da_sessao(session))
+    registrar_resultado(session, perfil, pilar_forte, pilar_toxico)
+
+    # a sessão segue "em_andamento" (estado FINALIZANDO) até o relatório
+    # chegar: mensagens nesse meio-tempo não começam outro questionário
+    if session.pillars is None:
+        # job reexecutado (retry) já gravou os pilares
+        db.add(ScorePillars(score_session_id=session.id, **soma))
+    session.pilar_dominante = pilar_forte
+    session.pilar_toxico = pilar_toxico
+    session.score_total = score
+    session.perfil_nome = perfil
+    if session.completed_at is None:
+        session.completed_at = datetime.utcnow()
+    db.commit()
+
+    # job reexecutado depois do PDF pronto: não paga IA nem render de novo
+    pdf_bytes = None
+    store = get_relatorio_store()
+    if not session.pdf_hash or store.tamanho(session.pdf_hash) is None:
+        # IA cria as interpretações
+        # (as duas chamadas rodam em paralelo, com deadline e texto padrão)
+        radar_png = None
+        if settings.llm_streaming:
+            ja_enviada = session.interpretacao_enviada
+            if not ja_enviada:
+                enviar_whatsapp_texto(
+                    number,
+                    f"Seu perfil no Score de Riqueza é *{perfil}* ({score} pontos).\n\n"
+                    "Enquanto preparo seu relatório em PDF, aqui vai a leitura do seu momento:"
+                )
+            interpretacao, convite, radar_png = rodar(
+                _textos_e_grafico_em_paralelo(
+                    number, session.id, ja_enviada, soma, questionario_da_sessao(session).pilar_max,
+                    perfil, pilar_forte, pilar_toxico,
+                )
+            )
+        else:
+            interpretacao, convite = rodar(montar_textos_relatorio(perfil, pilar_forte, pilar_toxico))
+
+        # os bytes vão do render direto para o store e para o upload
+        pdf_bytes = renderizar_pdf(_dados_pdf(db, user, session, soma, interpretacao, convite, radar_png))
+        _guardar_pdf(db, session, pdf_bytes)
+
     # envia PDF
     enviar_whatsapp_texto(number, "Seu Score de Riqueza está pronto. Estou enviando seu relatório…")
-    enviar_whatsapp_documento(number, pdf_path)
+    enviar_relatorio(db, session, number, pdf_bytes)
 
     if session.renda_qualificada:
         enviar_whatsapp_texto(
@@ -250,88 +487,334 @@ def finalizar_score(db, user, session, number):
             "Seu relatório está pronto! Aplique as recomendações para fortalecer seus próximos passos."
         )
 
+    # entregue: a sessão fecha e entra no histograma dos percentis na mesma transação
+    session.status = "concluida"
+    registrar_percentis(db, user.renda_faixa, soma, score)
+    db.commit()
 
-# ------------------------------------------------------------
-#   MÁQUINA DE ESTADOS DO WHATSAPP
-# ------------------------------------------------------------
-def process_message(db: Session, user: User, session: ScoreSession, msg: str, number: str):
 
-    # COLETAR NOME
-    if session.estado_atual == "COLETAR_NOME":
-        session.estado_atual = "AGUARDANDO_NOME"
-        db.commit()
-        return enviar_whatsapp_texto(number, "Vamos começar. Qual é o seu nome completo?")
+def avisar_falha_relatorio(to):
+    """As tentativas do relatório acabaram: a sessão fica em FINALIZANDO e a próxima mensagem tenta de novo."""
+    enviar_whatsapp_texto(
+        to,
+        "Não consegui gerar seu relatório agora. "
+        "Envie qualquer mensagem daqui a pouco que eu tento de novo."
+    )
 
-    if session.estado_atual == "AGUARDANDO_NOME":
-        user.nome = msg
-        session.estado_atual = "COLETAR_INSTAGRAM"
-        db.commit()
-        return enviar_whatsapp_texto(number, f"Certo, {user.nome}. Qual é o seu @ do Instagram?")
 
-    # INSTAGRAM
-    if session.estado_atual == "COLETAR_INSTAGRAM":
-        user.instagram = msg
-        session.estado_atual = "COLETAR_RENDA"
-        db.commit()
-        return enviar_whatsapp_texto(number,
-            "Agora me diga sua renda mensal:\n\n"
-            "1. Até R$ 5.000\n"
-            "2. R$ 5.001–10.000\n"
-            "3. R$ 10.001–20.000\n"
-            "4. R$ 20.001–50.000\n"
-            "5. R$ 50.001–100.000\n"
-            "6. Acima de R$ 100.000\n\n"
-            "Responda apenas com o número."
-        )
+def regenerar_relatorio(db, session):
+    """
+    Refaz o PDF de uma sessão concluída com o resultado gravado nela (ex.:
+    depois de `python -m app.cli repontuar`). Não manda nada ao usuário:
+    o próximo pedido de reenvio já sobe o PDF novo.
+    """
+    from app.services.gpt_logic import montar_textos_relatorio
+    from app.services.render_pool import renderizar_pdf
 
-    # RENDA
-    if session.estado_atual == "COLETAR_RENDA":
-        if msg not in ["1","2","3","4","5","6"]:
-            return enviar_whatsapp_texto(number, "Responda com um número de 1 a 6.")
-
-        renda_map = {
-            "1":"Até R$ 5.000",
-            "2":"R$ 5.001–10.000",
-            "3":"R$ 10.001–20.000",
-            "4":"R$ 20.001–50.000",
-            "5":"R$ 50.001–100.000",
-            "6":"Acima de R$ 100.000",
-        }
-
-        user.renda_faixa = renda_map[msg]
-        session.renda_qualificada = msg != "1"
-        session.estado_atual = "PERGUNTA_1"
-        db.commit()
+    interpretacao, convite = rodar(
+        montar_textos_relatorio(session.perfil_nome, session.pilar_dominante, session.pilar_toxico)
+    )
+    pdf_bytes = renderizar_pdf(
+        _dados_pdf(db, session.user, session, somas_da_sessao(session), interpretacao, convite)
+    )
+    _guardar_pdf(db, session, pdf_bytes)
 
-        return enviar_whatsapp_texto(number,
-            "Vamos iniciar as 30 perguntas do Score de Riqueza.\n"
-            "Responda sempre com números de 1 a 5.\n\n"
-            + pergunta_score(1)
-        )
 
-    # PERGUNTAS 1 A 30
-    if session.estado_atual.startswith("PERGUNTA_"):
-        n = int(session.estado_atual.split("_")[1])
+# ------------------------------------------------------------
+#   MÁQUINA DE ESTADOS DO WHATSAPP
+# ------------------------------------------------------------
+def _inicio(db, user, session, passo, msg):
+    # PEDIDO DE REENVIO DO ÚLTIMO RELATÓRIO (antes de começar um novo score)
+    if msg.lower() in ("relatorio", "relatório"):
+        anterior = (
+            db.query(ScoreSession)
+            .filter(
+                ScoreSession.user_id == user.id,
+                ScoreSession.status == "concluida",
+                ScoreSession.pdf_url.isnot(None),
+            )
+            .order_by(ScoreSession.completed_at.desc(), ScoreSession.id.desc())
+            .first()
+        )
+        if anterior is not None:
+            enfileirar_reenvio(db, anterior)
+            return "Certo! Vou reenviar o seu último relatório."
+
+    session.estado_atual = passo.proximo
+    return passo.resposta
+
+
+def _nome(db, user, session, passo, msg):
+    user.nome = msg
+    session.estado_atual = passo.proximo
+    return passo.resposta.format(nome=msg)
+
+
+def _instagram(db, user, session, passo, msg):
+    user.instagram = msg
+    session.estado_atual = passo.proximo
+    return passo.resposta
+
+
+def _renda(db, user, session, passo, msg):
+    faixa = passo.validas.get(msg)
+    if faixa is None:
+        return passo.invalida
+    user.renda_faixa = faixa
+    session.renda_qualificada = faixa != FAIXAS_RENDA[0]
+    session.estado_atual = passo.proximo
+    return passo.resposta
+
+
+def _pergunta(db, user, session, passo, msg):
+    valor = passo.validas.get(msg)
+    if valor is None:
+        return passo.invalida
+
+    registrar_resposta(session, passo.pergunta, valor)
+    verificar_especulacao(db, session, passo.pergunta)
+    session.estado_atual = passo.proximo
+    if passo.ultima:
+        # o trabalho pesado (IA, PDF, envio) vai para a fila do app.worker
+        enfileirar_finalizacao(db, session)
+    return passo.resposta
+
+
+def _finalizando(db, user, session, passo, msg):
+    # RELATÓRIO NA FILA; se as tentativas acabaram, a mensagem põe o job de volta
+    if session.relatorio_status == "falhou":
+        enfileirar_finalizacao(db, session)
+        return "Vou tentar gerar seu relatório de novo. Já já ele chega por aqui."
+    return passo.resposta
+
+
+# ação de cada tipo de passo, na ordem das constantes de app.services.questionario
+# (INICIO, NOME, INSTAGRAM, RENDA, PERGUNTA, FINALIZANDO)
+_ACOES = (_inicio, _nome, _instagram, _renda, _pergunta, _finalizando)
+
+
+def aplicar_mensagem(db: Session, user: User, session: ScoreSession, msg: str) -> str:
+    """
+    Aplica a mensagem na máquina de estados e devolve o texto de resposta.
+    Não envia nada nem faz commit: quem chama decide como enviar (sync ou
+    async) e quando gravar (uma mensagem ou um lote por transação).
+
+    O passo atual sai da tabela compilada do questionário da sessão
+    (app.services.questionario): um dict e um índice, sem cadeia de ifs.
+    """
+    passo = questionario_da_sessao(session).passo(session.estado_atual)
+    if passo is None:
+        # fallback
+        return "Vamos seguir passo a passo."
+    # cronômetro em linha: é a etapa mais frequente e dura ~1 µs
+    inicio = time.perf_counter()
+    texto = _ACOES[passo.tipo](db, user, session, passo, msg)
+    metrics.registrar_etapa("transicao", time.perf_counter() - inicio, passo.estado)
+    return texto
+
+
+def responder_do_cache(number: str, msg: str, message_id: str = None):
+    """
+    Caminho rápido das perguntas 1 a 29: aplica a resposta no estado em
+    cache (app.services.estado_conversa), sem tocar no banco. Devolve None
+    quando a mensagem precisa do caminho normal: número fora do cache,
+    outro estado, pergunta 30 ou resposta que decide a especulação.
+    """
+    if not settings.estado_cache_ativo:
+        return None
+
+    store = get_estado_store()
+    with metrics.etapa("lookup", origem="cache") as e:
+        estado = store.ler(number)
+        passo = None if estado is None else questionario_da_sessao(estado).passo(estado.estado_atual)
+        if passo is not None:
+            e.estado = passo.estado
+    if passo is None or passo.tipo != PERGUNTA:
+        metrics.incrementar("estado_cache_total", resultado="miss")
+        return None
+
+    with metrics.etapa("transicao", estado=passo.estado):
+        return _responder_pergunta_do_cache(store, estado, passo, msg, message_id)
+
+
+def _responder_pergunta_do_cache(store, estado, passo, msg, message_id):
+    valor = passo.validas.get(msg)
+    if valor is None:
+        metrics.incrementar("estado_cache_total", resultado="hit")
+        return passo.invalida
+
+    registrar_resposta(estado, passo.pergunta, valor)
+    # transições que precisam do banco: a cópia alterada é descartada e a
+    # mensagem é reaplicada a partir do estado gravado
+    if passo.ultima or resultado_a_especular(estado, passo.pergunta) is not None:
+        metrics.incrementar("estado_cache_total", resultado="transicao")
+        return None
+
+    estado.estado_atual = passo.proximo
+    estado.alterado_em = datetime.utcnow()
+    if message_id:
+        # o id vai para o banco no mesmo flush do estado (lista nova: a cópia
+        # lida do store divide a lista com o original)
+        estado.mensagens = estado.mensagens + [[message_id, passo.resposta]]
+    store.salvar(estado)
+    metrics.incrementar("estado_cache_total", resultado="hit")
+    return passo.resposta
+
+
+async def gravar_estado_pendente_async(db: AsyncSession, number: str):
+    """Grava e tira do cache o estado do número antes do caminho normal."""
+    if not settings.estado_cache_ativo:
+        return
+    estado = get_estado_store().remover(number)
+    if estado is not None:
+        await db.run_sync(lambda sync_db: gravar_estados(sync_db, [estado]))
+
+
+def lembrar_estado(number: str, session: ScoreSession):
+    """Depois do caminho normal, guarda a sessão no cache se ela estiver nas perguntas."""
+    if not settings.estado_cache_ativo:
+        return
+    passo = questionario_da_sessao(session).passo(session.estado_atual)
+    if passo is not None and passo.tipo == PERGUNTA:
+        get_estado_store().salvar(EstadoConversa.da_sessao(number, session), sujo=False)
+
+
+def _aplicar_e_gravar(db: Session, user: User, session: ScoreSession, msg: str,
+                      number: str = None, message_id: str = None) -> str:
+    texto = aplicar_mensagem(db, user, session, msg)
+    if message_id:
+        # id processado na mesma transação da transição (reentrega nunca reaplica)
+        gravar_ids(db, [linha_id(message_id, number, texto)])
+    db.commit()
+    return texto
 
-        if msg not in ["1","2","3","4","5"]:
-            return enviar_whatsapp_texto(number, "Responda com um número de 1 a 5.")
 
-        resposta = ScoreAnswer(
-            score_session_id=session.id,
-            question_number=n,
-            pillar_code=PILAR_MAP[n],
-            answer_value=int(msg),
-        )
-        db.add(resposta)
-        db.commit()
+def process_message(db: Session, user: User, session: ScoreSession, msg: str, number: str):
+    texto = _aplicar_e_gravar(db, user, session, msg)
+    enviar_whatsapp_texto(number, texto)
+    return texto
+
+
+async def responder_async(number: str, texto: str):
+    try:
+        await enviar_whatsapp_texto_async(number, texto)
+    except Exception:
+        # a transição já foi gravada; falha no envio não deve virar 500
+        # (a Meta reentregaria a mesma mensagem e ela seria aplicada de novo)
+        logger.exception("Falha ao enviar resposta para %s", number)
+
+
+async def process_message_async(db: AsyncSession, user: User, session: ScoreSession, msg: str, number: str,
+                                message_id: str = None):
+    # a máquina de estados é a mesma do caminho sync; o run_sync executa o
+    # código ORM com I/O async por baixo, sem travar o event loop
+    texto = await db.run_sync(lambda sync_db: _aplicar_e_gravar(sync_db, user, session, msg, number, message_id))
+    await responder_async(number, texto)
+    return texto
+
+
+async def atender_mensagem_async(db: AsyncSession, number: str, msg: str, message_id: str = None) -> str:
+    """
+    Entrada do webhook. Cada id de mensagem é aplicado uma vez só (as
+    reentregas recebem a resposta guardada); depois, cache da conversa
+    primeiro e banco quando precisar.
+    """
+    return await processar_uma_vez(db, message_id, lambda: _atender_async(db, number, msg, message_id))
+
+
+async def _atender_async(db: AsyncSession, number: str, msg: str, message_id: str = None) -> str:
+    texto = responder_do_cache(number, msg, message_id)
+    if texto is not None:
+        await responder_async(number, texto)
+        return texto
+
+    with metrics.etapa("lookup", origem="banco") as e:
+        await gravar_estado_pendente_async(db, number)
+        user = await get_or_create_user_async(db, number)
+        session = await get_or_create_session_async(db, user)
+        e.estado = session.estado_atual
+    texto = await process_message_async(db, user, session, msg, number, message_id)
+    lembrar_estado(number, session)
+    return texto
 
-        if n == 30:
-            finalizar_score(db, user, session, number)
-            return
 
-        session.estado_atual = f"PERGUNTA_{n+1}"
+# ------------------------------------------------------------
+#   LOTES (ENVELOPE DA META COM VÁRIAS MENSAGENS)
+# ------------------------------------------------------------
+async def atender_lote_async(db: AsyncSession, mensagens: list) -> list:
+    """
+    Entrada do webhook para o envelope nativo. Devolve as respostas na
+    ordem das mensagens; None nas que falharam (o envelope volta a ser
+    entregue e as que já foram aplicadas saem como duplicatas).
+    """
+    metrics.incrementar("webhook_lotes_total")
+    metrics.incrementar("webhook_lote_mensagens_total", len(mensagens))
+    return await processar_lote_uma_vez(db, mensagens, lambda novas: _atender_lote_async(db, novas))
+
+
+async def _atender_lote_async(db: AsyncSession, mensagens: list) -> list:
+    respostas = [None] * len(mensagens)
+    por_numero = {}
+    for i, m in enumerate(mensagens):
+        por_numero.setdefault(m.numero, []).append(i)
+
+    # cache primeiro; a partir da primeira que precisa do banco, o resto
+    # do número vai junto para o banco, na ordem
+    pelo_banco = {}
+    for numero, indices in por_numero.items():
+        for k, i in enumerate(indices):
+            texto = responder_do_cache(numero, mensagens[i].texto, mensagens[i].message_id)
+            if texto is None:
+                pelo_banco[numero] = indices[k:]
+                break
+            respostas[i] = texto
+
+    if pelo_banco:
+        try:
+            sessoes = await db.run_sync(lambda sync_db: _aplicar_lote(sync_db, mensagens, pelo_banco, respostas))
+        except Exception:
+            logger.exception("Falha ao aplicar lote de %s número(s)", len(pelo_banco))
+            for indices in pelo_banco.values():
+                for i in indices:
+                    respostas[i] = None
+        else:
+            for numero, session in sessoes.items():
+                lembrar_estado(numero, session)
+
+    # cada número recebe as respostas em ordem; números diferentes em paralelo
+    async def responder_numero(numero, indices):
+        for i in indices:
+            if respostas[i] is not None:
+                await responder_async(numero, respostas[i])
+
+    await asyncio.gather(*(responder_numero(n, indices) for n, indices in por_numero.items()))
+    return respostas
+
+
+def _aplicar_lote(db: Session, mensagens: list, pelo_banco: dict, respostas: list) -> dict:
+    """Aplica as mensagens que precisam do banco numa transação só. Devolve {número: sessão}."""
+    estados = []
+    if settings.estado_cache_ativo:
+        store = get_estado_store()
+        estados = [e for e in (store.remover(n) for n in pelo_banco) if e is not None]
+    try:
+        # o estado em cache entra na mesma transação das transições
+        gravar_estados(db, estados, commit=False)
+        with metrics.etapa("lookup", origem="banco", estado=""):
+            carregados = carregar_usuarios_e_sessoes(db, list(pelo_banco))
+        ids = []
+        for numero, indices in pelo_banco.items():
+            user, session = carregados[numero]
+            for i in indices:
+                respostas[i] = aplicar_mensagem(db, user, session, mensagens[i].texto)
+                if mensagens[i].message_id:
+                    ids.append(linha_id(mensagens[i].message_id, numero, respostas[i]))
+        gravar_ids(db, ids)
         db.commit()
-        return enviar_whatsapp_texto(number, pergunta_score(n+1))
-
-    # fallback
-    enviar_whatsapp_texto(number, "Vamos seguir passo a passo.")
\ No newline at end of file
+    except Exception:
+        db.rollback()
+        if estados:
+            # nada foi gravado: o estado volta para o cache, sujo
+            store.marcar_sujos(estados)
+        raise
+    return {numero: session for numero, (_, session) in carregados.items()}
@@ -0,0 +1,107 @@
+# app/worker.py
+"""
+Worker da fila de jobs (relatórios do Score).
+
+Uso:
+    python -m app.worker              # processos definidos em JOB_PROCESSOS
+    python -m app.worker --processos 2 --threads 8
+"""
+import argparse
+import logging
+import multiprocessing
+import threading
+import time
+
+from app import metrics
+from app.config import settings
+from app.db import engine, Base, SessionLocal
+from app.services.migracoes import migrar
+from app.services.jobs import processar_proximo_job, recuperar_jobs_orfaos
+from app.services.precarga import iniciar_precarga_worker
+from app.services.render_pool import fechar_render_pool
+
+logger = logging.getLogger("app.worker")
+
+
+def loop_worker(intervalo: float, threads: int = 1, indice: int = 0):
+    # cada processo precisa das próprias conexões (não herdar as do pai)
+    engine.dispose()
+    if settings.worker_metricas_porta:
+        # métricas são por processo: cada um expõe /metrics na sua porta
+        metrics.servir(settings.worker_metricas_porta + indice)
+    # IA e PDF são importados tarde; aquece em paralelo ao primeiro poll
+    iniciar_precarga_worker()
+
+    # várias threads por processo: IA e envio são I/O, e o render (CPU)
+    # vai para o pool de processos; assim relatórios simultâneos não fazem fila
+    extras = [
+        threading.Thread(target=_loop_jobs, args=(intervalo, False), name=f"jobs-{i}", daemon=True)
+        for i in range(1, threads)
+    ]
+    for t in extras:
+        t.start()
+    try:
+        _loop_jobs(intervalo, True)
+    finally:
+        fechar_render_pool()
+
+
+def _loop_jobs(intervalo: float, resgata_orfaos: bool):
+    ultimo_resgate = time.monotonic()
+    while True:
+        try:
+            processou = processar_proximo_job()
+        except Exception:
+            logger.exception("Erro inesperado no loop do worker")
+            processou = False
+
+        # de tempos em tempos devolve para a fila jobs de workers que morreram
+        if resgata_orfaos and time.monotonic() - ultimo_resgate > settings.job_lease_segundos / 2:
+            _resgatar_orfaos()
+            ultimo_resgate = time.monotonic()
+
+        if not processou:
+            time.sleep(intervalo)
+
+
+def _resgatar_orfaos():
+    db = SessionLocal()
+    try:
+        recuperar_jobs_orfaos(db)
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker da fila de relatórios do Score de Riqueza")
+    parser.add_argument("--processos", type=int, default=settings.job_processos)
+    parser.add_argument("--threads", type=int, default=settings.job_threads)
+    parser.add_argument("--intervalo", type=float, default=settings.job_intervalo_poll_segundos)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+
+    from app import models  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    migrar(engine)
+
+    # recuperação na subida: jobs que estavam executando quando o worker caiu
+    _resgatar_orfaos()
+
+    if args.processos <= 1:
+        loop_worker(args.intervalo, args.threads)
+        return
+
+    processos = [
+        multiprocessing.Process(target=loop_worker, args=(args.intervalo, args.threads, i), name=f"worker-{i}")
+        for i in range(args.processos)
+    ]
+    for p in processos:
+        p.start()
+    for p in processos:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
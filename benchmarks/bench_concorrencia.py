@@ -0,0 +1,96 @@
+# benchmarks/bench_concorrencia.py
+"""
+Compara a escala de concorrência do webhook:
+
+- "sync":  caminho antigo (get_db sync + envio HTTP bloqueante dentro do async def)
+- "async": caminho atual (AsyncSession + httpx async)
+
+Cada usuário simulado manda as 6 primeiras mensagens da conversa, em
+sequência; N usuários rodam ao mesmo tempo. A Graph API é o stub local
+com latência fixa.
+
+    python -m benchmarks.bench_concorrencia --usuarios 1 10 50 200 --latencia 0.05
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+PORTA_STUB = 9101
+
+_tmp = tempfile.mkdtemp(prefix="bench_score_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/bench.db"
+os.environ["WHATSAPP_API_URL"] = f"http://127.0.0.1:{PORTA_STUB}"
+os.environ.setdefault("WHATSAPP_PHONE_ID", "bench")
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+
+from app import models  # noqa: E402,F401
+from app.db import Base, engine, SessionLocal  # noqa: E402
+from app.main import app as app_async  # noqa: E402
+from app.services import whatsapp_logic  # noqa: E402
+from benchmarks.stub_graph import iniciar_em_thread  # noqa: E402
+
+MENSAGENS = ["oi", "Fulano", "@fulano", "3", "4", "5"]
+
+
+def criar_app_sync() -> FastAPI:
+    """Reproduz o webhook antigo: tudo bloqueante dentro de um async def."""
+    app = FastAPI()
+
+    @app.post("/webhook/whatsapp")
+    async def webhook(request: Request):
+        body = await request.json()
+        number, message = whatsapp_logic.extract_message_and_number(body)
+        db = SessionLocal()
+        try:
+            user = whatsapp_logic.get_or_create_user(db, number)
+            session = whatsapp_logic.get_or_create_session(db, user)
+            reply = whatsapp_logic.process_message(db, user, session, message, number)
+        finally:
+            db.close()
+        return {"reply": reply}
+
+    return app
+
+
+async def conversa(client: httpx.AsyncClient, numero: str):
+    for texto in MENSAGENS:
+        r = await client.post("/webhook/whatsapp", json={"from": numero, "text": texto})
+        r.raise_for_status()
+
+
+async def rodada(app, prefixo: str, usuarios: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(conversa(client, f"{prefixo}{i}") for i in range(usuarios)))
+        return time.perf_counter() - inicio
+
+
+async def main_async(niveis, latencia):
+    Base.metadata.create_all(bind=engine)
+    iniciar_em_thread(PORTA_STUB, latencia)
+    app_sync = criar_app_sync()
+
+    print(f"latência Graph stub: {latencia * 1000:.0f} ms, {len(MENSAGENS)} mensagens por usuário")
+    print(f"{'usuários':>9} | {'sync msg/s':>11} | {'async msg/s':>11} | {'ganho':>6}")
+    for n in niveis:
+        t_sync = await rodada(app_sync, f"s{n}_", n)
+        t_async = await rodada(app_async, f"a{n}_", n)
+        total = n * len(MENSAGENS)
+        print(f"{n:>9} | {total / t_sync:>11.1f} | {total / t_async:>11.1f} | {t_sync / t_async:>5.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de concorrência do webhook (sync x async)")
+    parser.add_argument("--usuarios", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--latencia", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.usuarios, args.latencia))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+# benchmarks/bench_conversa.py
+"""
+Teste de carga da conversa inteira, de ponta a ponta.
+
+N usuários simulados percorrem o questionário completo pelo
+/webhook/whatsapp real (app em processo, via ASGI): COLETAR_NOME,
+AGUARDANDO_NOME, COLETAR_INSTAGRAM, COLETAR_RENDA e PERGUNTA_1..30. A
+conversa anda em rodadas: em cada uma, todos mandam a próxima mensagem ao
+mesmo tempo (até C requisições em voo), então cada rodada é um estado e
+as medidas de latência e de SQL saem separadas por estado. O estado em
+cache é descarregado no fim de cada rodada, como o flusher faria.
+
+A última resposta enfileira finalizar_score; W threads de worker
+(app.services.jobs.processar_proximo_job) esvaziam a fila e medem o job
+inteiro e cada etapa dele (pilares, IA, PDF, upload, envio).
+
+A Graph API e a OpenAI são stubs locais com latência e taxa de erro
+configuráveis (benchmarks.stub_graph e benchmarks.stub_openai).
+
+Relatório: vazão, p50/p95/p99 por estado e por etapa da finalização,
+comandos SQL e commits por mensagem e por execução de job. --saida grava tudo em
+JSON; --comparar confronta com um JSON anterior e sai com código 1 se
+alguma latência, contagem de SQL ou vazão piorou além da tolerância.
+
+    python -m benchmarks.bench_conversa --usuarios 1000 --concorrencia 200 --saida base.json
+    python -m benchmarks.bench_conversa --usuarios 1000 --concorrencia 200 \\
+        --graph-latencia 0.05 --llm-latencia 0.8 --llm-erros 0.05 --comparar base.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+PORTA_GRAPH = 9108
+PORTA_OPENAI = 9110
+FORMATO = 1  # versão do JSON de resultado
+
+# métricas comparadas com a linha de base: menor é melhor, exceto a vazão
+_MENOR_MELHOR = ("p50_ms", "p95_ms", "p99_ms", "sql_por_mensagem", "commits_por_mensagem", "sql_por_job")
+_MAIOR_MELHOR = ("msg_s", "relatorios_s")
+
+
+def _preparar_ambiente(args):
+    tmp = tempfile.mkdtemp(prefix="bench_conversa_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    os.environ["RELATORIOS_DIR"] = os.path.join(tmp, "relatorios")
+    os.environ["WHATSAPP_API_URL"] = f"http://127.0.0.1:{PORTA_GRAPH}"
+    os.environ.setdefault("WHATSAPP_PHONE_ID", "bench")
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{PORTA_OPENAI}/v1"
+    os.environ["OPENAI_API_KEY"] = "stub"
+    # o token bucket limitaria a vazão ao ritmo de envio, não ao do bot
+    os.environ["WHATSAPP_MSGS_POR_SEGUNDO"] = "100000"
+    os.environ["PDF_POOL_PROCESSOS"] = str(args.render_processos)
+    # retries dos jobs dentro do tempo do benchmark
+    os.environ["JOB_BACKOFF_BASE_SEGUNDOS"] = "0.2"
+    os.environ["JOB_BACKOFF_MAX_SEGUNDOS"] = "2"
+    if args.sem_cache:
+        os.environ["ESTADO_CACHE_ATIVO"] = "false"
+    if args.sem_especulacao:
+        os.environ["ESPECULACAO_ATIVA"] = "false"
+
+
+# ------------------------------------------------------------
+#   COLETA
+# ------------------------------------------------------------
+def percentil(ordenadas, q: float) -> float:
+    """Nearest-rank sobre a lista já ordenada."""
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas), max(1, math.ceil(q * len(ordenadas)))) - 1]
+
+
+def resumo(amostras) -> dict:
+    ordenadas = sorted(amostras)
+    return {
+        "n": len(ordenadas),
+        "media_ms": 1000 * sum(ordenadas) / len(ordenadas) if ordenadas else 0.0,
+        "p50_ms": 1000 * percentil(ordenadas, 0.50),
+        "p95_ms": 1000 * percentil(ordenadas, 0.95),
+        "p99_ms": 1000 * percentil(ordenadas, 0.99),
+    }
+
+
+class ColetorEtapas:
+    """
+    Guarda a duração exata de cada etapa de app.metrics (o histograma só
+    tem os limites dos buckets). A chave é a etapa com os labels extras,
+    ex.: "lookup/cache", "llm_interpretacao".
+    """
+
+    def __init__(self):
+        self.amostras = defaultdict(list)
+
+    def instalar(self):
+        from app import metrics
+
+        original = metrics.registrar_etapa
+
+        def registrar_etapa(nome, duracao, estado=None, **labels):
+            original(nome, duracao, estado, **labels)
+            self.amostras["/".join((nome, *labels.values()))].append(duracao)
+
+        metrics.registrar_etapa = registrar_etapa
+
+    def trocar(self) -> dict:
+        amostras, self.amostras = self.amostras, defaultdict(list)
+        return {nome: resumo(valores) for nome, valores in sorted(amostras.items())}
+
+
+def roteiro(questionario) -> list:
+    """[(estado, texto)] de uma conversa completa, com respostas sorteadas."""
+    from app.services.questionario import INICIO, NOME, INSTAGRAM
+
+    passos = []
+    for passo in questionario.passos:
+        if passo.tipo == INICIO:
+            texto = "oi"
+        elif passo.tipo == NOME:
+            texto = "Fulano de Tal"
+        elif passo.tipo == INSTAGRAM:
+            texto = "@fulano"
+        elif passo.validas:
+            texto = random.choice(list(passo.validas))
+        else:
+            break  # FINALIZANDO: a conversa acabou
+        passos.append((passo.estado, texto))
+    return passos
+
+
+# ------------------------------------------------------------
+#   CONVERSA
+# ------------------------------------------------------------
+async def rodada(client, mensagens, concorrencia: int):
+    """Manda [(numero, texto, id)] com até `concorrencia` em voo. Devolve (latências, erros)."""
+    semaforo = asyncio.Semaphore(concorrencia)
+    latencias = []
+    erros = 0
+
+    async def uma(numero, texto, message_id):
+        nonlocal erros
+        async with semaforo:
+            inicio = time.perf_counter()
+            r = await client.post("/webhook/whatsapp", json={"from": numero, "text": texto, "id": message_id})
+            latencias.append(time.perf_counter() - inicio)
+            if r.status_code != 200:
+                erros += 1
+
+    await asyncio.gather(*(uma(*m) for m in mensagens))
+    return latencias, erros
+
+
+async def conversar(client, contagem, coletor, args) -> dict:
+    from app.services.estado_conversa import descarregar
+    from app.services.questionario import get_questionario
+
+    prefixo = uuid.uuid4().hex[:6]
+    numeros = [f"c{prefixo}_{i}" for i in range(args.usuarios)]
+    # cada usuário com as próprias respostas (pilares e perfis variados)
+    roteiros = {n: roteiro(get_questionario()) for n in numeros}
+    estados = [estado for estado, _ in roteiros[numeros[0]]]
+
+    por_estado = {}
+    total_sql = total_commits = total_erros = 0
+    coletor.trocar()
+    inicio = time.perf_counter()
+    for k, estado in enumerate(estados):
+        contagem.update(sql=0, commit=0)
+        mensagens = [(n, roteiros[n][k][1], f"{n}-{k}") for n in numeros]
+        latencias, erros = await rodada(client, mensagens, args.concorrencia)
+        await asyncio.to_thread(descarregar)
+
+        por_estado[estado] = {
+            **resumo(latencias),
+            "erros": erros,
+            "sql_por_mensagem": contagem["sql"] / len(numeros),
+            "commits_por_mensagem": contagem["commit"] / len(numeros),
+            "etapas": coletor.trocar(),
+        }
+        total_sql += contagem["sql"]
+        total_commits += contagem["commit"]
+        total_erros += erros
+        print(f"  {estado:<18} p50 {por_estado[estado]['p50_ms']:7.1f} ms  "
+              f"p99 {por_estado[estado]['p99_ms']:7.1f} ms  SQL/msg {por_estado[estado]['sql_por_mensagem']:5.2f}")
+    duracao = time.perf_counter() - inicio
+
+    total = len(numeros) * len(estados)
+    return {
+        "mensagens": total,
+        "duracao_s": duracao,
+        "msg_s": total / duracao,
+        "erros": total_erros,
+        "sql_por_mensagem": total_sql / total,
+        "commits_por_mensagem": total_commits / total,
+        "estados": por_estado,
+    }
+
+
+# ------------------------------------------------------------
+#   FINALIZAÇÃO (worker)
+# ------------------------------------------------------------
+def _jobs_por_status(monitor, tipo: str = None) -> dict:
+    from sqlalchemy import text
+
+    sql = "SELECT status, COUNT(*) FROM score_jobs"
+    if tipo:
+        sql += " WHERE tipo = :tipo"
+    with monitor.connect() as conn:
+        return dict(conn.execute(text(sql + " GROUP BY status"), {"tipo": tipo}).all())
+
+
+def finalizar(contagem, coletor, monitor, args) -> dict:
+    from app.services.jobs import processar_proximo_job
+
+    contagem.update(sql=0, commit=0)
+    coletor.trocar()
+    duracoes = []
+    parar = threading.Event()
+
+    def loop():
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            if processar_proximo_job():
+                duracoes.append(time.perf_counter() - inicio)
+            else:
+                time.sleep(0.05)
+
+    threads = [threading.Thread(target=loop, name=f"bench-worker-{i}", daemon=True) for i in range(args.workers)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    limite = inicio + args.timeout_finalizacao
+    # a contagem usa um engine à parte, fora das contas de SQL
+    while time.perf_counter() < limite:
+        status = _jobs_por_status(monitor)
+        if not status.get("pendente") and not status.get("executando"):
+            break
+        time.sleep(0.2)
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    for t in threads:
+        t.join()
+
+    # a especulação também enfileira jobs; a vazão conta só os relatórios
+    status = _jobs_por_status(monitor, "finalizar_score")
+    concluidos = status.get("concluido", 0)
+    return {
+        "jobs": sum(status.values()),
+        "concluidos": concluidos,
+        "falhos": status.get("falhou", 0),
+        "abertos": status.get("pendente", 0) + status.get("executando", 0),
+        "execucoes": len(duracoes),  # todos os tipos, com as novas tentativas
+        "duracao_s": duracao,
+        "relatorios_s": concluidos / duracao if duracao else 0.0,
+        "sql_por_job": contagem["sql"] / len(duracoes) if duracoes else 0.0,
+        "commits_por_job": contagem["commit"] / len(duracoes) if duracoes else 0.0,
+        "job": resumo(duracoes),
+        "etapas": coletor.trocar(),
+    }
+
+
+# ------------------------------------------------------------
+#   LINHA DE BASE
+# ------------------------------------------------------------
+def _folhas(dados, caminho=""):
+    for chave, valor in dados.items():
+        atual = f"{caminho}.{chave}" if caminho else chave
+        if isinstance(valor, dict):
+            yield from _folhas(valor, atual)
+        elif isinstance(valor, (int, float)):
+            yield atual, chave, valor
+
+
+def comparar(atual: dict, base: dict, tolerancia: float, minimo_ms: float) -> list:
+    """[(métrica, antes, depois, variação, piorou)] das métricas que mudaram além da tolerância."""
+    antes = {caminho: valor for caminho, _, valor in _folhas(base)}
+    mudancas = []
+    for caminho, chave, depois in _folhas(atual):
+        if chave not in _MENOR_MELHOR and chave not in _MAIOR_MELHOR:
+            continue
+        anterior = antes.get(caminho)
+        if not anterior:
+            continue
+        # etapas de microssegundos oscilam muito em termos relativos
+        if chave.endswith("_ms") and abs(depois - anterior) < minimo_ms:
+            continue
+        variacao = (depois - anterior) / anterior
+        if abs(variacao) <= tolerancia:
+            continue
+        piorou = variacao > 0 if chave in _MENOR_MELHOR else variacao < 0
+        mudancas.append((caminho, anterior, depois, variacao, piorou))
+    return mudancas
+
+
+def imprimir(resultado: dict):
+    conversa = resultado["conversa"]
+    fin = resultado["finalizacao"]
+    print(f"\nconversa: {conversa['mensagens']} mensagens em {conversa['duracao_s']:.1f} s "
+          f"({conversa['msg_s']:.0f} msg/s), {conversa['erros']} erro(s) HTTP, "
+          f"{conversa['sql_por_mensagem']:.2f} SQL/msg, {conversa['commits_por_mensagem']:.2f} commits/msg")
+    print(f"finalização: {fin['concluidos']}/{fin['jobs']} relatório(s) em {fin['duracao_s']:.1f} s "
+          f"({fin['relatorios_s']:.1f}/s), {fin['falhos']} falho(s), {fin['abertos']} em aberto, "
+          f"{fin['sql_por_job']:.1f} SQL/job")
+    print(f"{'etapa':<28} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for nome, r in [("job", fin["job"])] + list(fin["etapas"].items()):
+        print(f"{nome:<28} {r['n']:>7} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+    print(f"stubs: {resultado['stubs']}")
+
+
+# ------------------------------------------------------------
+#   EXECUÇÃO
+# ------------------------------------------------------------
+async def main_async(args) -> dict:
+    import httpx
+    from sqlalchemy import create_engine, event
+
+    from app import models  # noqa: F401
+    from app.db import Base, SQLALCHEMY_DATABASE_URL, async_engine, engine
+    from app.main import app, on_shutdown
+    from app.services.loop_async import rodar
+    from app.services.render_pool import fechar_render_pool
+    from app.services.whatsapp_client import get_whatsapp_client
+    from benchmarks import stub_graph, stub_openai
+
+    Base.metadata.create_all(bind=engine)
+    graph = stub_graph.iniciar_em_thread(PORTA_GRAPH, args.graph_latencia, args.graph_erros)
+    openai = stub_openai.iniciar_em_thread(PORTA_OPENAI, args.llm_latencia, args.llm_erros, args.llm_latencia_pedaco)
+
+    contagem = {"sql": 0, "commit": 0}
+    for _engine in (engine, async_engine.sync_engine):
+        event.listen(_engine, "before_cursor_execute",
+                     lambda *a: contagem.__setitem__("sql", contagem["sql"] + 1))
+        event.listen(_engine, "commit",
+                     lambda *a: contagem.__setitem__("commit", contagem["commit"] + 1))
+    coletor = ColetorEtapas()
+    coletor.instalar()
+    monitor = create_engine(SQLALCHEMY_DATABASE_URL)
+
+    print(f"{args.usuarios} usuários, {args.concorrencia} em voo, {args.workers} worker(s)")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        conversa = await conversar(client, contagem, coletor, args)
+    finalizacao = await asyncio.to_thread(finalizar, contagem, coletor, monitor, args)
+    # o worker usa o cliente da Graph API no loop de fundo (app.services.loop_async);
+    # o estado do loop do webhook fecha no on_shutdown
+    await asyncio.to_thread(rodar, get_whatsapp_client().fechar())
+    fechar_render_pool()
+    await on_shutdown()
+
+    return {
+        "formato": FORMATO,
+        "gerado_em": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("saida", "comparar")},
+        "conversa": conversa,
+        "finalizacao": finalizacao,
+        "stubs": {
+            "graph_mensagens": len(graph.state.mensagens),
+            "graph_midias": len(graph.state.midias),
+            "graph_erros": graph.state.erros,
+            "llm_chamadas": openai.state.chamadas,
+            "llm_streams": openai.state.streams,
+            "llm_erros": openai.state.erros,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga da conversa completa, com stubs locais")
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=100, help="requisições ao webhook em voo")
+    parser.add_argument("--workers", type=int, default=4, help="threads de worker na finalização")
+    parser.add_argument("--render-processos", type=int, default=2, help="PDF_POOL_PROCESSOS (0 = na thread)")
+    parser.add_argument("--graph-latencia", type=float, default=0.02)
+    parser.add_argument("--graph-erros", type=float, default=0.0)
+    parser.add_argument("--llm-latencia", type=float, default=0.3, help="até o primeiro pedaço")
+    parser.add_argument("--llm-latencia-pedaco", type=float, default=0.01)
+    parser.add_argument("--llm-erros", type=float, default=0.0)
+    parser.add_argument("--sem-cache", action="store_true", help="estado da conversa sempre pelo banco")
+    parser.add_argument("--sem-especulacao", action="store_true")
+    parser.add_argument("--timeout-finalizacao", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", help="grava o resultado em JSON")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior (linha de base)")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="variação relativa aceita")
+    parser.add_argument("--minimo-ms", type=float, default=0.5, help="diferença de latência ignorada")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    _preparar_ambiente(args)
+
+    resultado = asyncio.run(main_async(args))
+    imprimir(resultado)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"resultado gravado em {args.saida}")
+
+    if not args.comparar:
+        return
+    with open(args.comparar, encoding="utf-8") as f:
+        base = json.load(f)
+    if base.get("formato") != FORMATO:
+        sys.exit(f"{args.comparar}: formato {base.get('formato')}, esperado {FORMATO}")
+    mudancas = comparar(resultado, base, args.tolerancia, args.minimo_ms)
+    print(f"\ncomparado com {args.comparar} ({base.get('gerado_em')}), tolerância {args.tolerancia:.0%}:")
+    for caminho, antes, depois, variacao, piorou in mudancas:
+        print(f"  {'PIOROU' if piorou else 'melhorou':<8} {caminho:<60} {antes:>10.2f} -> {depois:>10.2f} ({variacao:+.0%})")
+    if not mudancas:
+        print("  sem mudanças além da tolerância")
+    sys.exit(1 if any(piorou for *_, piorou in mudancas) else 0)
+
+
+if __name__ == "__main__":
+    main()
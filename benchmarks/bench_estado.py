@@ -0,0 +1,110 @@
+# benchmarks/bench_estado.py
+"""
+Idas ao banco por mensagem do webhook, com e sem o cache do estado da
+conversa (app.services.estado_conversa).
+
+Cada usuário simulado faz a conversa inteira (nome, Instagram, renda e
+as 30 perguntas); N usuários rodam ao mesmo tempo. Conta comandos SQL
+e commits no engine do webhook e no do flusher (o flush em lote entra
+na conta do modo com cache).
+
+    python -m benchmarks.bench_estado --usuarios 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+PORTA_STUB = 9104
+
+_tmp = tempfile.mkdtemp(prefix="bench_estado_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/bench.db"
+os.environ["WHATSAPP_API_URL"] = f"http://127.0.0.1:{PORTA_STUB}"
+os.environ.setdefault("WHATSAPP_PHONE_ID", "bench")
+os.environ["ESPECULACAO_ATIVA"] = "false"
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app import models  # noqa: E402,F401
+from app.config import settings  # noqa: E402
+from app.db import Base, async_engine, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services import estado_conversa  # noqa: E402
+from benchmarks.stub_graph import iniciar_em_thread  # noqa: E402
+from benchmarks.stub_redis import RedisMemoria  # noqa: E402
+
+contagem = {"sql": 0, "commit": 0}
+
+
+def _contar_sql(*args):
+    contagem["sql"] += 1
+
+
+def _contar_commit(*args):
+    contagem["commit"] += 1
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _contar_sql)
+    event.listen(_engine, "commit", _contar_commit)
+
+
+def mensagens():
+    # pergunta 30 fica de fora: dispara a finalização, que não é o alvo aqui
+    return ["oi", "Fulano", "@fulano", "3"] + [random.choice("12345") for _ in range(29)]
+
+
+async def conversa(client: httpx.AsyncClient, numero: str):
+    for texto in mensagens():
+        r = await client.post("/webhook/whatsapp", json={"from": numero, "text": texto})
+        r.raise_for_status()
+
+
+async def rodada(modo: str, usuarios: int) -> dict:
+    settings.estado_cache_ativo = modo != "sem cache"
+    if modo == "redis (fake)":
+        estado_conversa._store = estado_conversa.EstadoStoreRedis("", "bench:", cliente=RedisMemoria())
+    else:
+        estado_conversa._store = estado_conversa.EstadoStoreMemoria()
+
+    contagem.update(sql=0, commit=0)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(conversa(client, f"{modo[0]}{usuarios}_{i}") for i in range(usuarios)))
+        if settings.estado_cache_ativo:
+            estado_conversa.descarregar()
+        duracao = time.perf_counter() - inicio
+
+    total = usuarios * len(mensagens())
+    return {
+        "sql_por_msg": contagem["sql"] / total,
+        "commits_por_msg": contagem["commit"] / total,
+        "msg_s": total / duracao,
+    }
+
+
+async def main_async(usuarios: int):
+    Base.metadata.create_all(bind=engine)
+    iniciar_em_thread(PORTA_STUB, 0.0)
+
+    print(f"{usuarios} usuários, {len(mensagens())} mensagens cada")
+    print(f"{'modo':<13} | {'SQL/msg':>7} | {'commits/msg':>11} | {'msg/s':>7}")
+    for modo in ("sem cache", "memoria", "redis (fake)"):
+        r = await rodada(modo, usuarios)
+        print(f"{modo:<13} | {r['sql_por_msg']:>7.2f} | {r['commits_por_msg']:>11.2f} | {r['msg_s']:>7.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Idas ao banco por mensagem, com e sem cache do estado")
+    parser.add_argument("--usuarios", type=int, default=50)
+    args = parser.parse_args()
+    random.seed(42)
+    asyncio.run(main_async(args.usuarios))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# benchmarks/bench_exportacao.py
+"""
+Exportação em massa (app.services.exportacao) sobre N sessões sintéticas.
+
+Grava N usuários com sessão concluída, pilares e respostas abertas num
+sqlite temporário e exporta em cada formato. Cada exportação roda num
+processo novo, para o pico de memória (RSS) ser só dela; "tudo_em_memoria"
+é o jeito antigo (.all() e depois escrever), para comparação.
+
+Depois mede a incremental: marca gravada, 1% das sessões alteradas, e a
+segunda exportação só leva essas (mais as da janela de sobreposição antes
+da marca; as sessões sintéticas têm updated_at um segundo depois da outra).
+
+    python -m benchmarks.bench_exportacao --n 1000000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+LOTE_INSERT = 50_000
+
+
+def _preparar_ambiente():
+    tmp = tempfile.mkdtemp(prefix="bench_exportacao_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    return tmp
+
+
+def popular(n: int):
+    from sqlalchemy import insert
+
+    from app import models  # noqa: F401
+    from app.db import Base, engine
+    from app.models import ScoreOpenAnswers, ScorePillars, ScoreSession, User
+    from app.services.questionario import FAIXAS_RENDA, PERFIS, PILARES
+
+    Base.metadata.create_all(bind=engine)
+    base = datetime(2025, 1, 1)
+    inicio = time.perf_counter()
+    for a in range(0, n, LOTE_INSERT):
+        ids = range(a + 1, min(a + LOTE_INSERT, n) + 1)
+        with engine.begin() as conn:
+            conn.execute(insert(User), [
+                {"id": i, "whatsapp_number": f"55119{i:08d}", "nome": f"Pessoa {i}", "instagram": f"@pessoa{i}",
+                 "renda_faixa": random.choice(FAIXAS_RENDA), "created_at": base, "updated_at": base + timedelta(seconds=i)}
+                for i in ids
+            ])
+            conn.execute(insert(ScoreSession), [
+                {"id": i, "user_id": i, "status": "concluida", "score_total": random.randint(30, 150),
+                 "perfil_nome": random.choice(PERFIS), "pilar_dominante": random.choice(PILARES),
+                 "pilar_toxico": random.choice(PILARES), "renda_qualificada": random.random() < 0.7,
+                 "created_at": base, "completed_at": base + timedelta(minutes=10),
+                 "updated_at": base + timedelta(seconds=i)}
+                for i in ids
+            ])
+            conn.execute(insert(ScorePillars), [
+                {"score_session_id": i, **{p: random.randint(3, 15) for p in PILARES}} for i in ids
+            ])
+            conn.execute(insert(ScoreOpenAnswers), [
+                {"score_session_id": i, "motivo_compra": "Quero clareza", "ganho_buscado": "Mais tempo",
+                 "maior_desafio": "Delegar"}
+                for i in ids
+            ])
+    print(f"{n} sessões gravadas em {time.perf_counter() - inicio:.1f} s")
+
+
+def _rodar(formato: str, destino: str, incremental, fila):
+    from app.db import SessionLocal
+    from app.services.exportacao import exportar
+
+    inicio = time.perf_counter()
+    db = SessionLocal()
+    try:
+        if formato == "tudo_em_memoria":
+            import csv
+            from app.services.exportacao import NOMES, consulta
+
+            linhas = db.execute(consulta()).all()
+            with open(destino, "w", newline="", encoding="utf-8") as f:
+                escritor = csv.writer(f)
+                escritor.writerow(NOMES)
+                escritor.writerows(linhas)
+        else:
+            with open(destino, "wb") as f:
+                for bloco in exportar(db, formato, incremental=incremental):
+                    f.write(bloco)
+    finally:
+        db.close()
+    fila.put((time.perf_counter() - inicio, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def medir(formato: str, destino: str, incremental=None):
+    ctx = multiprocessing.get_context("spawn")
+    fila = ctx.Queue()
+    p = ctx.Process(target=_rodar, args=(formato, destino, incremental, fila))
+    p.start()
+    duracao, pico_mb = fila.get()
+    p.join()
+    return duracao, pico_mb, os.path.getsize(destino)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportação em streaming sobre sessões sintéticas")
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--formatos", default="csv,ndjson,parquet,tudo_em_memoria")
+    args = parser.parse_args()
+    random.seed(42)
+    tmp = _preparar_ambiente()
+    popular(args.n)
+
+    print(f"{'formato':<16} {'tempo s':>8} {'linhas/s':>10} {'MB':>8} {'pico RSS MB':>12}")
+    for formato in args.formatos.split(","):
+        destino = os.path.join(tmp, f"sessoes.{formato}")
+        try:
+            duracao, pico, tamanho = medir(formato, destino)
+        except Exception as e:  # parquet sem pyarrow, por exemplo
+            print(f"{formato:<16} falhou: {e}")
+            continue
+        print(f"{formato:<16} {duracao:>8.1f} {args.n / duracao:>10,.0f} {tamanho / 1e6:>8.1f} {pico:>12.0f}")
+
+    # incremental: primeira passada grava a marca, a segunda só leva o que mudou
+    from sqlalchemy import update
+
+    from app.db import engine
+    from app.models import ScoreSession
+
+    destino = os.path.join(tmp, "incremental.ndjson")
+    duracao, _, _ = medir("ndjson", destino, incremental="bench")
+    alteradas = max(1, args.n // 100)
+    with engine.begin() as conn:
+        conn.execute(
+            update(ScoreSession).where(ScoreSession.id <= alteradas).values(perfil_nome="Construtor Consistente")
+        )
+    duracao_delta, _, _ = medir("ndjson", destino, incremental="bench")
+    with open(destino, encoding="utf-8") as f:
+        linhas = sum(1 for _ in f)
+    print(f"incremental: completa {duracao:.1f} s; delta de {alteradas} alterada(s) "
+          f"em {duracao_delta:.1f} s, {linhas} linha(s) exportada(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/bench_importacao.py
+"""
+Tempo de importação do processo web, módulo a módulo.
+
+Roda `python -X importtime -c "import app.main"` em processos novos
+(cache de bytecode já quente: a primeira rodada só aquece e fica de
+fora), soma o tempo cumulativo de cada pacote de primeiro nível e de
+cada módulo app.*, e mostra a mediana das rodadas.
+
+Também confere que app.main não importa as dependências pesadas que só
+o worker usa (openai, reportlab, matplotlib): se alguém voltar a
+importá-las no topo de um módulo do caminho do webhook, sai com código 1.
+
+    python -m benchmarks.bench_importacao
+    python -m benchmarks.bench_importacao --modulo app.worker --rodadas 7
+    python -m benchmarks.bench_importacao --limite-ms 500
+
+Sai com código 1 se o total passar de --limite-ms ou se algum módulo
+proibido aparecer.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+PROIBIDOS_WEB = ("openai", "reportlab", "matplotlib", "numpy")
+
+# import time:       self [us] | cumulative | imported package
+_LINHA = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| \s*(\S+)")
+
+
+def importar(modulo: str) -> dict:
+    """Uma rodada em processo novo. Devolve {módulo: µs cumulativos}."""
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite://")
+    saida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if saida.returncode != 0:
+        raise SystemExit(f"falha ao importar {modulo}:\n{saida.stderr[-2000:]}")
+
+    tempos = {}
+    for linha in saida.stderr.splitlines():
+        casou = _LINHA.match(linha)
+        if not casou:
+            continue
+        cumulativo, nome = casou.groups()
+        # um módulo aparece uma vez só (na primeira importação)
+        tempos[nome] = int(cumulativo)
+    return tempos
+
+
+def relevante(nome: str) -> bool:
+    """Pacotes de primeiro nível (o tempo do pacote já inclui os submódulos) e módulos app.*."""
+    return "." not in nome or nome.startswith("app.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação por módulo (-X importtime)")
+    parser.add_argument("--modulo", default="app.main")
+    parser.add_argument("--rodadas", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--limite-ms", type=float, default=0.0, help="0 = sem limite")
+    args = parser.parse_args()
+
+    importar(args.modulo)  # aquece o cache de bytecode
+    rodadas = [importar(args.modulo) for _ in range(args.rodadas)]
+    nomes = set().union(*rodadas)
+    medianas = {
+        nome: statistics.median(r.get(nome, 0) for r in rodadas) / 1000
+        for nome in nomes if relevante(nome)
+    }
+    total = statistics.median(r.get(args.modulo, 0) for r in rodadas) / 1000
+
+    print(f"import {args.modulo}: {total:.0f} ms (mediana de {args.rodadas} rodadas)")
+    print(f"{'módulo':<44} {'ms':>8}")
+    for nome, ms in sorted(medianas.items(), key=lambda x: -x[1])[:args.top]:
+        print(f"{nome:<44} {ms:>8.1f}")
+
+    erro = 0
+    proibidos = sorted({n.split(".")[0] for n in nomes} & set(PROIBIDOS_WEB))
+    if args.modulo == "app.main" and proibidos:
+        print(f"app.main importou dependências do worker: {', '.join(proibidos)}")
+        erro = 1
+    if args.limite_ms and total > args.limite_ms:
+        print(f"acima do limite de {args.limite_ms:.0f} ms")
+        erro = 1
+    sys.exit(erro)
+
+
+if __name__ == "__main__":
+    main()
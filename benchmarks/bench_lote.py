@@ -0,0 +1,175 @@
+# benchmarks/bench_lote.py
+"""
+Vazão do webhook com o envelope nativo da Meta, por tamanho de lote.
+
+N usuários fazem o cadastro e R respostas de pergunta. As mensagens de
+cada rodada (uma por usuário) vão em envelopes com B mensagens de números
+diferentes, com até C envelopes em voo. Para cada B mede mensagens por
+segundo, comandos SQL e commits por mensagem, e confere no fim que cada
+número está em PERGUNTA_{R+1} com R respostas.
+
+Com --sem-cache todas as respostas passam pelo banco, que é onde o lote
+economiza consultas e commits.
+
+    python -m benchmarks.bench_lote --usuarios 200 --lotes 1,10,50
+    python -m benchmarks.bench_lote --usuarios 200 --lotes 1,10,50 --sem-cache
+
+Sai com código 1 se algum número terminar inconsistente.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+PORTA_STUB = 9107
+
+
+def _preparar_ambiente(args):
+    tmp = tempfile.mkdtemp(prefix="bench_lote_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    os.environ["WHATSAPP_API_URL"] = f"http://127.0.0.1:{PORTA_STUB}"
+    os.environ.setdefault("WHATSAPP_PHONE_ID", "bench")
+    os.environ["ESPECULACAO_ATIVA"] = "false"
+    # o token bucket limitaria a vazão ao ritmo de envio, não ao do webhook
+    os.environ["WHATSAPP_MSGS_POR_SEGUNDO"] = "100000"
+    if args.sem_cache:
+        os.environ["ESTADO_CACHE_ATIVO"] = "false"
+
+
+def envelope(mensagens) -> dict:
+    """mensagens: [(numero, texto, message_id)] no formato da Cloud API."""
+    agora = int(time.time())
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "bench",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"phone_number_id": "bench"},
+                    "messages": [
+                        {"from": numero, "id": message_id, "timestamp": str(agora),
+                         "type": "text", "text": {"body": texto}}
+                        for numero, texto, message_id in mensagens
+                    ],
+                },
+            }],
+        }],
+    }
+
+
+async def enviar_rodada(client, mensagens, lote: int, concorrencia: int):
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def um(pedaco):
+        async with semaforo:
+            r = await client.post("/webhook/whatsapp", json=envelope(pedaco))
+            r.raise_for_status()
+
+    await asyncio.gather(*(um(mensagens[i:i + lote]) for i in range(0, len(mensagens), lote)))
+
+
+def conferir(numeros, rodadas: int) -> list:
+    from app.db import SessionLocal
+    from app.models import ScoreSession, User
+    from app.services.respostas import respostas_da_sessao
+
+    db = SessionLocal()
+    try:
+        sessoes = (
+            db.query(User.whatsapp_number, ScoreSession)
+            .join(ScoreSession, ScoreSession.user_id == User.id)
+            .filter(User.whatsapp_number.in_(numeros), ScoreSession.status == "em_andamento")
+            .all()
+        )
+    finally:
+        db.close()
+    esperado = f"PERGUNTA_{rodadas + 1}"
+    por_numero = {numero: session for numero, session in sessoes}
+    return [
+        numero for numero in numeros
+        if numero not in por_numero
+        or por_numero[numero].estado_atual != esperado
+        or len(respostas_da_sessao(por_numero[numero])) != rodadas
+    ]
+
+
+async def medir(client, contagem, lote: int, args) -> dict:
+    prefixo = uuid.uuid4().hex[:6]
+    numeros = [f"l{prefixo}_{i}" for i in range(args.usuarios)]
+    textos = ["oi", "Fulano", "@fulano", "3"] + [random.choice("12345") for _ in range(args.rodadas)]
+
+    contagem.update(sql=0, commit=0)
+    inicio = time.perf_counter()
+    for k, texto in enumerate(textos):
+        rodada = [(n, texto, f"{n}-{k}") for n in numeros]
+        await enviar_rodada(client, rodada, lote, args.concorrencia)
+    duracao = time.perf_counter() - inicio
+
+    from app.services.estado_conversa import descarregar
+    descarregar()
+
+    total = len(numeros) * len(textos)
+    return {
+        "lote": lote,
+        "msg_s": total / duracao,
+        "sql": contagem["sql"] / total,
+        "commits": contagem["commit"] / total,
+        "problemas": conferir(numeros, args.rodadas),
+    }
+
+
+async def main_async(args) -> int:
+    import httpx
+    from sqlalchemy import event
+
+    from app import models  # noqa: F401
+    from app.db import Base, async_engine, engine
+    from app.main import app, on_shutdown
+    from benchmarks.stub_graph import iniciar_em_thread
+
+    Base.metadata.create_all(bind=engine)
+    iniciar_em_thread(PORTA_STUB, args.latencia)
+
+    contagem = {"sql": 0, "commit": 0}
+    event.listen(async_engine.sync_engine, "before_cursor_execute",
+                 lambda *a: contagem.__setitem__("sql", contagem["sql"] + 1))
+    event.listen(async_engine.sync_engine, "commit",
+                 lambda *a: contagem.__setitem__("commit", contagem["commit"] + 1))
+
+    resultados = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for lote in args.lotes:
+            resultados.append(await medir(client, contagem, lote, args))
+    await on_shutdown()
+
+    print(f"{args.usuarios} usuários, cadastro + {args.rodadas} respostas, "
+          f"{args.concorrencia} envelope(s) em voo, cache {'desligado' if args.sem_cache else 'ligado'}")
+    print(f"{'lote':>6} {'msg/s':>9} {'SQL/msg':>9} {'commits/msg':>12} {'inconsistentes':>15}")
+    for r in resultados:
+        print(f"{r['lote']:>6} {r['msg_s']:>9.0f} {r['sql']:>9.2f} {r['commits']:>12.2f} {len(r['problemas']):>15}")
+    return 1 if any(r["problemas"] for r in resultados) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão do webhook por tamanho do envelope da Meta")
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--rodadas", type=int, default=10, help="respostas de pergunta por usuário (até 29)")
+    parser.add_argument("--lotes", type=lambda s: [int(x) for x in s.split(",")], default=[1, 10, 50])
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--latencia", type=float, default=0.0, help="latência do stub da Graph API")
+    parser.add_argument("--sem-cache", action="store_true")
+    args = parser.parse_args()
+    random.seed(42)
+    _preparar_ambiente(args)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# benchmarks/bench_pdf.py
+"""
+Benchmark do PDF completo: template (grade do radar em cache) x desenho
+direto (como o relatório era gerado antes do pdf_template).
+
+Gera N relatórios sintéticos (nomes, pilares e textos de tamanho parecido
+com os da IA) e mede tempo por relatório e bytes por PDF.
+
+    python -m benchmarks.bench_pdf --n 1000
+"""
+import argparse
+import io
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from textwrap import wrap
+
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from app.services.pdf_creator import desenhar_radar, gerar_pdf_bytes
+from app.services.questionario import PERFIS, PILARES
+
+PALAVRAS = (
+    "decisão tempo família energia propósito crescimento clareza foco legado riqueza "
+    "dinheiro estratégia rotina coragem aprendizado relações presença ciclo escolhas "
+    "prioridades visão disciplina confiança resultado"
+).split()
+NOMES = ("Ana", "Bruno", "Carla", "Diego", "Elisa", "Fábio", "Giovana", "Henrique", "Íris", "João")
+SOBRENOMES = ("Silva", "Souza", "Oliveira", "Pereira", "Lima", "Carvalho", "Ferreira", "Almeida")
+
+
+def texto_sintetico(tamanho: int) -> str:
+    palavras = []
+    total = 0
+    while total < tamanho:
+        palavra = random.choice(PALAVRAS)
+        palavras.append(palavra)
+        total += len(palavra) + 1
+    return " ".join(palavras).capitalize() + "."
+
+
+def dados_sinteticos() -> dict:
+    pilares = {p: random.randint(3, 15) for p in PILARES}
+    return {
+        "nome": f"{random.choice(NOMES)} {random.choice(SOBRENOMES)}",
+        "score_total": sum(pilares.values()),
+        "perfil": random.choice(PERFIS),
+        "pilar_dominante": max(pilares, key=pilares.get),
+        "pilar_toxico": min(pilares, key=pilares.get),
+        "pilares": pilares,
+        "interpretacao": "\n\n".join(texto_sintetico(random.randint(400, 800)) for _ in range(3)),
+        "convite_sessao": texto_sintetico(random.randint(400, 800)),
+        "renda_qualificada": random.random() < 0.8,
+        "gerado_em": datetime(2026, 1, 1) + timedelta(minutes=random.randint(0, 500000)),
+    }
+
+
+# ------------------------------------------------------------
+#   REFERÊNCIA: DESENHO DIRETO (antes do template)
+# ------------------------------------------------------------
+def _linhas(c, texto, x, y, max_chars=95, leading=14):
+    for linha in wrap(texto or "", max_chars):
+        c.drawString(x, y, linha)
+        y -= leading
+    return y
+
+
+def pdf_desenho_direto(dados: dict) -> bytes:
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4, invariant=1)
+    width, height = A4
+    x, y = 50, height - 60
+
+    c.setFont("Helvetica-Bold", 22)
+    c.drawString(x, y, dados["nome"])
+    y -= 28
+    c.setFont("Helvetica", 13)
+    c.drawString(x, y, "Relatório Pessoal do Score de Riqueza™")
+    y -= 18
+    c.setFont("Helvetica", 10)
+    c.drawString(x, y, f"Método desenvolvido por Fernando Tessaro • Gerado em {dados['gerado_em']:%d/%m/%Y %H:%M}")
+    y -= 35
+
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(x, y, "Resumo Geral")
+    y -= 20
+    c.setFont("Helvetica", 12)
+    for rotulo, chave in (("Score Total", "score_total"), ("Perfil identificado", "perfil"),
+                          ("Pilar mais forte", "pilar_dominante"), ("Pilar mais vulnerável", "pilar_toxico")):
+        c.drawString(x, y, f"{rotulo}: {dados[chave]}")
+        y -= 16
+    y -= 14
+
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(x, y, "Distribuição dos Pilares")
+    y -= 300
+    desenhar_radar(c, dados["pilares"], x, y, 280)
+    y -= 20
+
+    c.setFont("Helvetica", 11)
+    for nome_pilar, valor in dados["pilares"].items():
+        c.drawString(x, y, f"{nome_pilar.replace('_', ' ').capitalize()}: {valor}")
+        y -= 14
+    c.showPage()
+
+    y = height - 60
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(x, y, "Leitura do seu momento")
+    c.setFont("Helvetica", 11)
+    y = _linhas(c, dados["interpretacao"], x, y - 20) - 25
+    if dados["renda_qualificada"]:
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(x, y, "Convite estratégico")
+        c.setFont("Helvetica", 11)
+        _linhas(c, dados["convite_sessao"], x, y - 20)
+
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def pdf_desenho_direto_a85(dados: dict) -> bytes:
+    # configuração antiga: streams em Flate + ASCII85
+    rl_config.useA85 = 1
+    try:
+        return pdf_desenho_direto(dados)
+    finally:
+        rl_config.useA85 = 0
+
+
+# ------------------------------------------------------------
+#   MEDIÇÃO
+# ------------------------------------------------------------
+def medir(func, entradas):
+    func(entradas[0])  # aquecimento (fontes, grade do radar em cache)
+    tempos = []
+    tamanhos = []
+    for dados in entradas:
+        inicio = time.perf_counter()
+        pdf = func(dados)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        tamanhos.append(len(pdf))
+    tempos.sort()
+    return {
+        "ms_medio": statistics.fmean(tempos),
+        "ms_p95": tempos[int(len(tempos) * 0.95) - 1],
+        "bytes_medio": statistics.fmean(tamanhos),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF: template x desenho direto")
+    parser.add_argument("--n", type=int, default=1000)
+    args = parser.parse_args()
+    random.seed(42)
+
+    entradas = [dados_sinteticos() for _ in range(args.n)]
+    resultados = {
+        "direto (A85)": medir(pdf_desenho_direto_a85, entradas),
+        "direto": medir(pdf_desenho_direto, entradas),
+        "template": medir(gerar_pdf_bytes, entradas),
+    }
+
+    print(f"{args.n} relatórios sintéticos")
+    print(f"{'modo':<14} | {'ms médio':>9} | {'ms p95':>7} | {'bytes/PDF':>9}")
+    for modo, r in resultados.items():
+        print(f"{modo:<14} | {r['ms_medio']:>9.2f} | {r['ms_p95']:>7.2f} | {r['bytes_medio']:>9.0f}")
+
+    antes, depois = resultados["direto (A85)"], resultados["template"]
+    print(
+        f"template x antes: {antes['ms_medio'] / depois['ms_medio']:.2f}x mais rápido, "
+        f"{1 - depois['bytes_medio'] / antes['bytes_medio']:.0%} menor"
+    )
+
+
+if __name__ == "__main__":
+    main()
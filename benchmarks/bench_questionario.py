@@ -0,0 +1,79 @@
+# benchmarks/bench_questionario.py
+"""
+Custo da máquina de estados por mensagem (aplicar_mensagem), sem banco:
+conversas inteiras (nome, Instagram, renda e todas as perguntas) sobre
+objetos em memória, para cada versão do questionário carregada.
+
+Com --versao-extra, compila junto uma versão sintética (uma pergunta
+por pilar) para conferir que várias versões lado a lado não mudam o
+custo de cada uma.
+
+    python -m benchmarks.bench_questionario --conversas 2000
+    python -m benchmarks.bench_questionario --conversas 2000 --versao-extra
+"""
+import argparse
+import os
+import random
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ["ESPECULACAO_ATIVA"] = "false"
+
+from app.services import questionario  # noqa: E402
+from app.services.whatsapp_logic import aplicar_mensagem  # noqa: E402
+
+
+def versao_sintetica() -> questionario.Questionario:
+    return questionario.compilar({
+        "versao": "bench",
+        "escala": {"minimo": 1, "maximo": 5, "legenda": "1 = Nunca\n5 = Sempre"},
+        "perfis": [{"nome": nome, "minimo": minimo}
+                   for nome, minimo in zip(questionario.PERFIS, (40, 34, 26, 0))],
+        "perguntas": [{"pilar": p, "texto": f"Pergunta de {p}"} for p in questionario.PILARES],
+    })
+
+
+def conversa(q: questionario.Questionario) -> list:
+    escala = [str(v) for v in range(q.escala[0], q.escala[1] + 1)]
+    return ["oi", "Fulano", "@fulano", "3"] + [random.choice(escala) for _ in range(q.num_perguntas)]
+
+
+def medir(q: questionario.Questionario, conversas: int) -> float:
+    roteiros = [conversa(q) for _ in range(conversas)]
+    total = 0
+    inicio = time.perf_counter()
+    for mensagens in roteiros:
+        user = SimpleNamespace(id=1, nome=None, instagram=None, renda_faixa=None)
+        session = SimpleNamespace(
+            estado_atual="COLETAR_NOME", questionario_versao=q.versao, respostas=None,
+            soma_pilares=None, renda_qualificada=False, especulacao_chave=None,
+            relatorio_status=None, id=1,
+        )
+        for msg in mensagens[:-1]:
+            aplicar_mensagem(None, user, session, msg)
+        total += len(mensagens) - 1
+    # a última resposta enfileira a finalização (precisa de banco): fica de fora
+    return (time.perf_counter() - inicio) / total * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo por mensagem da máquina de estados compilada")
+    parser.add_argument("--conversas", type=int, default=2000)
+    parser.add_argument("--versao-extra", action="store_true")
+    args = parser.parse_args()
+    random.seed(42)
+
+    versoes = dict(questionario.questionarios())
+    if args.versao_extra:
+        extra = versao_sintetica()
+        questionario._compilados[extra.versao] = versoes[extra.versao] = extra
+
+    print(f"{len(versoes)} versão(ões) carregada(s), {args.conversas} conversas por versão")
+    print(f"{'versão':<8} {'perguntas':>9} {'µs/mensagem':>12}")
+    for versao, q in sorted(versoes.items()):
+        print(f"{versao:<8} {q.num_perguntas:>9} {medir(q, args.conversas):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
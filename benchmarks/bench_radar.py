@@ -0,0 +1,77 @@
+# benchmarks/bench_radar.py
+"""
+Micro-benchmark do radar do PDF: matplotlib (PNG 150 dpi) x reportlab vetorial.
+
+Mede o tempo de desenhar o radar numa página e o tamanho do PDF resultante.
+
+    python -m benchmarks.bench_radar --n 200
+"""
+import argparse
+import io
+import random
+import time
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from app.services.pdf_creator import desenhar_radar, gerar_grafico_radar
+from app.services.questionario import PILARES
+
+
+def pilares_aleatorios():
+    return {p: random.randint(3, 15) for p in PILARES}
+
+
+def pagina_matplotlib(pilares) -> int:
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    c.drawImage(ImageReader(gerar_grafico_radar(pilares)), 50, 400, width=280, height=280,
+                mask="auto", preserveAspectRatio=True)
+    c.showPage()
+    c.save()
+    return len(buf.getvalue())
+
+
+def pagina_vetorial(pilares) -> int:
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    desenhar_radar(c, pilares, 50, 400, 280)
+    c.showPage()
+    c.save()
+    return len(buf.getvalue())
+
+
+def medir(func, n):
+    entradas = [pilares_aleatorios() for _ in range(n)]
+    func(entradas[0])  # aquecimento (imports, fontes)
+    tamanhos = []
+    inicio = time.perf_counter()
+    for pilares in entradas:
+        tamanhos.append(func(pilares))
+    total = time.perf_counter() - inicio
+    return total / n * 1000, sum(tamanhos) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Radar: matplotlib x reportlab vetorial")
+    parser.add_argument("--n", type=int, default=100)
+    args = parser.parse_args()
+    random.seed(42)
+
+    t_import = time.perf_counter()
+    import matplotlib.pyplot  # noqa: F401
+    t_import = (time.perf_counter() - t_import) * 1000
+
+    ms_mpl, kb_mpl = medir(pagina_matplotlib, args.n)
+    ms_vet, kb_vet = medir(pagina_vetorial, args.n)
+
+    print(f"import matplotlib.pyplot: {t_import:.0f} ms (só no motor matplotlib)")
+    print(f"{'motor':<12} | {'ms/radar':>9} | {'bytes/página':>12}")
+    print(f"{'matplotlib':<12} | {ms_mpl:>9.2f} | {kb_mpl:>12.0f}")
+    print(f"{'reportlab':<12} | {ms_vet:>9.2f} | {kb_vet:>12.0f}")
+    print(f"ganho: {ms_mpl / ms_vet:.1f}x mais rápido, {kb_mpl / kb_vet:.1f}x menor")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/bench_score_lote.py
+"""
+Pontuação em lote (app.services.score_lote) x sessão a sessão.
+
+Gera N sessões sintéticas (30 respostas de 1 a 5) e mede:
+
+- "python": somar + determinar_pilares + calcular_score_total +
+  determinar_perfil por sessão, como a finalização faz
+- "numpy":  pontuar() sobre a matriz N×30 inteira
+
+e confere que os dois dão o mesmo resultado. Com --banco M, grava M
+sessões concluídas num sqlite temporário, troca os cortes dos perfis e
+mede o repontuar() completo (leitura em lotes, cálculo e UPDATE).
+
+    python -m benchmarks.bench_score_lote --n 1000000 --banco 200000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+
+def _preparar_ambiente():
+    tmp = tempfile.mkdtemp(prefix="bench_score_lote_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+
+
+def sinteticas(n: int) -> list:
+    return [bytes(random.randint(1, 5) for _ in range(30)) for _ in range(n)]
+
+
+def medir_kernel(blobs):
+    from app.services.questionario import PILARES, get_questionario
+    from app.services.respostas import desempacotar, somar
+    from app.services.score_lote import matriz_respostas, pontuar
+    from app.services.whatsapp_logic import calcular_score_total, determinar_perfil, determinar_pilares
+
+    q = get_questionario("v1")
+
+    inicio = time.perf_counter()
+    esperado = []
+    for blob in blobs:
+        soma = dict(zip(PILARES, somar(desempacotar(blob), q)))
+        forte, toxico = determinar_pilares(soma)
+        score = calcular_score_total(soma)
+        esperado.append((score, determinar_perfil(score, q), forte, toxico))
+    t_python = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    respostas = matriz_respostas(blobs)
+    t_matriz = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    r = pontuar(respostas, q)
+    t_numpy = time.perf_counter() - inicio
+
+    nomes = [nome for _, nome in q.perfis]
+    divergentes = sum(
+        1 for i, (score, perfil, forte, toxico) in enumerate(esperado)
+        if (score, perfil, forte, toxico)
+        != (int(r["total"][i]), nomes[r["perfil"][i]], PILARES[r["forte"][i]], PILARES[r["toxico"][i]])
+    )
+    n = len(blobs)
+    print(f"{n} sessões")
+    print(f"  python (por sessão): {t_python:8.3f} s  {n / t_python:>12,.0f} sessões/s")
+    print(f"  numpy (matriz):      {t_matriz:8.3f} s  montagem da matriz N×30")
+    print(f"  numpy (pontuar):     {t_numpy:8.3f} s  {n / t_numpy:>12,.0f} sessões/s ({t_python / t_numpy:.0f}x)")
+    print(f"  divergências:        {divergentes}")
+    return divergentes
+
+
+def medir_repontuar(m: int, lote: int):
+    from sqlalchemy import insert
+
+    from app import models  # noqa: F401
+    from app.db import Base, SessionLocal, engine
+    from app.models import ScorePillars, ScoreSession, User
+    from app.services.questionario import PILARES, get_questionario
+    from app.services.score_lote import matriz_respostas, pontuar, repontuar
+
+    Base.metadata.create_all(bind=engine)
+    q = get_questionario("v1")
+    blobs = sinteticas(m)
+    r = pontuar(matriz_respostas(blobs), q)
+    nomes = [nome for _, nome in q.perfis]
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": 1, "whatsapp_number": "bench"}])
+        conn.execute(insert(ScoreSession), [
+            {
+                "id": i + 1, "user_id": 1, "status": "concluida", "respostas": blob,
+                "soma_pilares": r["somas"][i].astype("uint8").tobytes(),
+                "score_total": int(r["total"][i]), "perfil_nome": nomes[r["perfil"][i]],
+                "pilar_dominante": PILARES[r["forte"][i]], "pilar_toxico": PILARES[r["toxico"][i]],
+            }
+            for i, blob in enumerate(blobs)
+        ])
+        conn.execute(insert(ScorePillars), [
+            {"score_session_id": i + 1, **dict(zip(PILARES, map(int, r["somas"][i])))} for i in range(m)
+        ])
+
+    # o corte mais perto da média (respostas uniformes dão ~90) sobe 10 pontos:
+    # parte das sessões muda de perfil
+    i = min(range(len(q.perfis) - 1), key=lambda k: abs(q.perfis[k][0] - 90))
+    minimo, nome = q.perfis[i]
+    q.perfis = q.perfis[:i] + ((minimo + 10, nome),) + q.perfis[i + 1:]
+
+    db = SessionLocal()
+    try:
+        inicio = time.perf_counter()
+        resultado = repontuar(db, lote=lote)
+        duracao = time.perf_counter() - inicio
+    finally:
+        db.close()
+    print(f"repontuar em sqlite: {m} sessões em {duracao:.2f} s ({m / duracao:,.0f}/s), "
+          f"{resultado['alteradas']} alterada(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pontuação em lote (NumPy) x sessão a sessão")
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--banco", type=int, default=0, help="sessões no teste do repontuar (0 = pula)")
+    parser.add_argument("--lote", type=int, default=10_000)
+    args = parser.parse_args()
+    random.seed(42)
+    _preparar_ambiente()
+
+    divergentes = medir_kernel(sinteticas(args.n))
+    if args.banco:
+        medir_repontuar(args.banco, args.lote)
+    raise SystemExit(1 if divergentes else 0)
+
+
+if __name__ == "__main__":
+    main()
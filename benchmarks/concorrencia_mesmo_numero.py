@@ -0,0 +1,113 @@
+# benchmarks/concorrencia_mesmo_numero.py
+"""
+Teste de concorrência do get_or_create de usuário e sessão: dispara K
+webhooks ao mesmo tempo para cada um de N números novos e confere no
+banco que cada número terminou com exatamente um usuário e uma sessão
+em andamento, sem erro HTTP.
+
+Por padrão roda o app em processo (sqlite temporário, Graph API no stub).
+Com --url, manda para um servidor já no ar (ex.: uvicorn com --workers 4
+em PostgreSQL) e confere no banco da DATABASE_URL, que deve ser o mesmo.
+
+    python -m benchmarks.concorrencia_mesmo_numero --numeros 20 --paralelas 10
+    DATABASE_URL=postgresql://... python -m benchmarks.concorrencia_mesmo_numero --url http://127.0.0.1:8000
+
+Sai com código 1 se encontrar duplicata ou erro.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+
+PORTA_STUB = 9105
+
+
+def _preparar_ambiente(externo: bool):
+    if not externo:
+        tmp = tempfile.mkdtemp(prefix="bench_upsert_")
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        os.environ["WHATSAPP_API_URL"] = f"http://127.0.0.1:{PORTA_STUB}"
+        os.environ.setdefault("WHATSAPP_PHONE_ID", "bench")
+
+
+async def disparar(client, numeros, paralelas) -> int:
+    async def um(numero):
+        r = await client.post("/webhook/whatsapp", json={"from": numero, "text": "oi"})
+        return r.status_code
+
+    codigos = await asyncio.gather(*(um(n) for n in numeros for _ in range(paralelas)))
+    return sum(c != 200 for c in codigos)
+
+
+def conferir(numeros) -> list:
+    from sqlalchemy import func
+
+    from app.db import SessionLocal
+    from app.models import ScoreSession, User
+
+    db = SessionLocal()
+    try:
+        usuarios = dict(
+            db.query(User.whatsapp_number, func.count(User.id))
+            .filter(User.whatsapp_number.in_(numeros))
+            .group_by(User.whatsapp_number)
+        )
+        sessoes = dict(
+            db.query(User.whatsapp_number, func.count(ScoreSession.id))
+            .join(ScoreSession, ScoreSession.user_id == User.id)
+            .filter(User.whatsapp_number.in_(numeros), ScoreSession.status == "em_andamento")
+            .group_by(User.whatsapp_number)
+        )
+    finally:
+        db.close()
+    return [
+        (n, usuarios.get(n, 0), sessoes.get(n, 0))
+        for n in numeros
+        if usuarios.get(n, 0) != 1 or sessoes.get(n, 0) != 1
+    ]
+
+
+async def main_async(args) -> int:
+    import httpx
+
+    prefixo = uuid.uuid4().hex[:8]
+    numeros = [f"t{prefixo}_{i}" for i in range(args.numeros)]
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        from app import models  # noqa: F401
+        from app.db import Base, engine
+        from app.main import app
+        from benchmarks.stub_graph import iniciar_em_thread
+
+        Base.metadata.create_all(bind=engine)
+        iniciar_em_thread(PORTA_STUB, 0.0)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    async with client:
+        erros = await disparar(client, numeros, args.paralelas)
+
+    problemas = conferir(numeros)
+    print(f"{args.numeros} números x {args.paralelas} webhooks simultâneos")
+    print(f"respostas com erro: {erros}")
+    print(f"números com usuário/sessão duplicado ou ausente: {len(problemas)}")
+    for numero, usuarios, sessoes in problemas[:10]:
+        print(f"  {numero}: {usuarios} usuário(s), {sessoes} sessão(ões) em andamento")
+    return 1 if erros or problemas else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhooks simultâneos para o mesmo número")
+    parser.add_argument("--numeros", type=int, default=20)
+    parser.add_argument("--paralelas", type=int, default=10)
+    parser.add_argument("--url", default=None, help="servidor já no ar (senão roda o app em processo)")
+    args = parser.parse_args()
+    _preparar_ambiente(externo=bool(args.url))
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
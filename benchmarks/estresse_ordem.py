@@ -0,0 +1,139 @@
+# benchmarks/estresse_ordem.py
+"""
+Teste de estresse da ordem por número: cada usuário simulado passa pelo
+cadastro e depois manda uma rajada de respostas de uma vez, sem esperar
+as anteriores. N usuários fazem isso ao mesmo tempo.
+
+Confere no fim, para cada número:
+
+- a sessão está em PERGUNTA_{K+1} com exatamente K respostas gravadas
+  (nenhuma mensagem aplicada duas vezes na mesma pergunta)
+- cada resposta "Pergunta n+1/30" foi dada à mensagem cujo valor está
+  gravado na pergunta n (estado e respostas andaram juntos)
+
+Com --sem-ordem, as filas por número ficam desligadas (ORDEM_POR_NUMERO=false) para
+comparar; com --sem-cache, tudo passa pelo banco, que é onde as corridas
+aparecem dentro de um processo só.
+
+    python -m benchmarks.estresse_ordem --usuarios 50 --rajada 20
+    python -m benchmarks.estresse_ordem --usuarios 50 --rajada 20 --sem-cache --sem-ordem
+
+Sai com código 1 se algum número terminar inconsistente.
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import uuid
+
+PORTA_STUB = 9106
+
+
+def _preparar_ambiente(args):
+    tmp = tempfile.mkdtemp(prefix="bench_ordem_")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+    os.environ["WHATSAPP_API_URL"] = f"http://127.0.0.1:{PORTA_STUB}"
+    os.environ.setdefault("WHATSAPP_PHONE_ID", "bench")
+    os.environ["ESPECULACAO_ATIVA"] = "false"
+    if args.sem_ordem:
+        os.environ["ORDEM_POR_NUMERO"] = "false"
+    if args.sem_cache:
+        os.environ["ESTADO_CACHE_ATIVO"] = "false"
+
+
+async def usuario(client, numero: str, rajada: int) -> list:
+    for texto in ("oi", "Fulano", "@fulano", "3"):
+        r = await client.post("/webhook/whatsapp", json={"from": numero, "text": texto})
+        r.raise_for_status()
+
+    valores = [random.choice("12345") for _ in range(rajada)]
+
+    async def uma(valor, i):
+        r = await client.post("/webhook/whatsapp", json={"from": numero, "text": valor, "id": f"{numero}-{i}"})
+        r.raise_for_status()
+        return valor, r.json()["reply"]
+
+    return await asyncio.gather(*(uma(v, i) for i, v in enumerate(valores)))
+
+
+def conferir(resultados: dict, rajada: int) -> list:
+    from app.db import SessionLocal
+    from app.models import ScoreSession, User
+    from app.services.respostas import respostas_da_sessao
+
+    problemas = []
+    db = SessionLocal()
+    try:
+        for numero, pares in resultados.items():
+            session = (
+                db.query(ScoreSession).join(User)
+                .filter(User.whatsapp_number == numero, ScoreSession.status == "em_andamento")
+                .one()
+            )
+            respostas = respostas_da_sessao(session)
+            esperado = f"PERGUNTA_{rajada + 1}"
+            if session.estado_atual != esperado or len(respostas) != rajada:
+                problemas.append(f"{numero}: {session.estado_atual}, {len(respostas)} resposta(s)")
+                continue
+            for valor, resposta in pares:
+                n = int(re.match(r"Pergunta (\d+)/30", resposta).group(1)) - 1
+                if respostas.get(n) != int(valor):
+                    problemas.append(f"{numero}: pergunta {n} gravou {respostas.get(n)}, mensagem era {valor}")
+                    break
+    finally:
+        db.close()
+    return problemas
+
+
+async def main_async(args) -> int:
+    import httpx
+
+    from app import models  # noqa: F401
+    from app.db import Base, engine
+    from app.main import app, on_shutdown
+    from app.services.estado_conversa import descarregar
+    from benchmarks.stub_graph import iniciar_em_thread
+
+    Base.metadata.create_all(bind=engine)
+    iniciar_em_thread(PORTA_STUB, args.latencia)
+
+    prefixo = uuid.uuid4().hex[:6]
+    numeros = [f"o{prefixo}_{i}" for i in range(args.usuarios)]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        inicio = time.perf_counter()
+        pares = await asyncio.gather(*(usuario(client, n, args.rajada) for n in numeros))
+        duracao = time.perf_counter() - inicio
+    descarregar()
+    await on_shutdown()
+
+    problemas = conferir(dict(zip(numeros, pares)), args.rajada)
+    total = args.usuarios * (args.rajada + 4)
+    print(f"{args.usuarios} usuários, rajada de {args.rajada} respostas cada "
+          f"(ordem {'desligada' if args.sem_ordem else 'ligada'}, cache {'desligado' if args.sem_cache else 'ligado'})")
+    print(f"{total} mensagens em {duracao:.2f}s ({total / duracao:.0f} msg/s)")
+    print(f"números inconsistentes: {len(problemas)}")
+    for linha in problemas[:10]:
+        print(f"  {linha}")
+    return 1 if problemas else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rajadas de mensagens por número: ordem e consistência")
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--rajada", type=int, default=20)
+    parser.add_argument("--latencia", type=float, default=0.01, help="latência do stub da Graph API")
+    parser.add_argument("--sem-ordem", action="store_true")
+    parser.add_argument("--sem-cache", action="store_true")
+    args = parser.parse_args()
+    random.seed(42)
+    _preparar_ambiente(args)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
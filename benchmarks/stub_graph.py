@@ -0,0 +1,81 @@
+# benchmarks/stub_graph.py
+"""
+Servidor falso da Graph API do WhatsApp, para benchmarks locais.
+
+Responde /{phone_id}/messages e /{phone_id}/media com latência e taxa de
+erro configuráveis (503 ou 429 com Retry-After) e guarda o que recebeu.
+
+    python -m benchmarks.stub_graph --porta 9100 --latencia 0.2 --taxa-erro 0.1
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def criar_app(latencia: float = 0.0, taxa_erro: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Stub Graph API")
+    app.state.latencia = latencia
+    app.state.taxa_erro = taxa_erro
+    app.state.mensagens = []
+    app.state.midias = []
+    app.state.erros = 0
+
+    def _erro_simulado():
+        if random.random() >= app.state.taxa_erro:
+            return None
+        app.state.erros += 1
+        if random.random() < 0.5:
+            return JSONResponse({"error": {"code": 130429}}, status_code=429, headers={"Retry-After": "1"})
+        return JSONResponse({"error": {"code": 2}}, status_code=503)
+
+    @app.post("/{phone_id}/messages")
+    async def messages(phone_id: str, request: Request):
+        await asyncio.sleep(app.state.latencia)
+        erro = _erro_simulado()
+        if erro is not None:
+            return erro
+        corpo = await request.body()
+        app.state.mensagens.append((phone_id, corpo))
+        n = len(app.state.mensagens)
+        return JSONResponse({"messaging_product": "whatsapp", "messages": [{"id": f"wamid.stub{n}"}]})
+
+    @app.post("/{phone_id}/media")
+    async def media(phone_id: str, request: Request):
+        await asyncio.sleep(app.state.latencia)
+        erro = _erro_simulado()
+        if erro is not None:
+            return erro
+        corpo = await request.body()
+        app.state.midias.append((phone_id, len(corpo)))
+        return JSONResponse({"id": f"media.stub{len(app.state.midias)}"})
+
+    return app
+
+
+def iniciar_em_thread(porta: int, latencia: float = 0.0, taxa_erro: float = 0.0) -> FastAPI:
+    """Sobe o stub em uma thread daemon e espera ele aceitar conexões."""
+    app = criar_app(latencia, taxa_erro)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=porta, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub local da Graph API do WhatsApp")
+    parser.add_argument("--porta", type=int, default=9100)
+    parser.add_argument("--latencia", type=float, default=0.0)
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(criar_app(args.latencia, args.taxa_erro), host="127.0.0.1", port=args.porta)
+
+
+if __name__ == "__main__":
+    main()
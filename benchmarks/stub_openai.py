@@ -0,0 +1,144 @@
+# benchmarks/stub_openai.py
+"""
+Servidor falso da API de chat da OpenAI, para benchmarks locais.
+
+Responde /v1/chat/completions (com e sem stream=True) com latência e taxa
+de erro configuráveis (500 ou 429 com Retry-After). O SDK da OpenAI usa o
+stub quando OPENAI_BASE_URL aponta para ele:
+
+    OPENAI_BASE_URL=http://127.0.0.1:9110/v1 OPENAI_API_KEY=stub ...
+
+    python -m benchmarks.stub_openai --porta 9110 --latencia 0.8 --taxa-erro 0.05
+
+No stream, `latencia` é o tempo até o primeiro pedaço e `latencia_pedaco`
+o intervalo entre pedaços; sem stream, a resposta sai depois de
+latencia + latencia_pedaco * pedaços (o mesmo tempo total).
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PARAGRAFOS = (
+    "Seu perfil mostra alguém que já construiu base e agora precisa de direção.",
+    "O pilar forte sustenta as decisões difíceis e dá ritmo ao resto da vida.",
+    "O pilar tóxico é onde a energia vaza: cuidar dele muda o jogo inteiro.",
+)
+
+
+def _texto(corpo: dict) -> str:
+    # parágrafos separados por linha em branco, como a interpretação real
+    pedido = (corpo.get("messages") or [{}])[-1].get("content") or ""
+    if "convite" in pedido.lower():
+        return "Vamos destravar isso juntos numa Sessão Solucionista."
+    return "\n\n".join(PARAGRAFOS)
+
+
+def _pedacos(texto: str, tamanho: int = 24):
+    return [texto[i:i + tamanho] for i in range(0, len(texto), tamanho)]
+
+
+def criar_app(latencia: float = 0.0, taxa_erro: float = 0.0, latencia_pedaco: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Stub OpenAI")
+    app.state.latencia = latencia
+    app.state.latencia_pedaco = latencia_pedaco
+    app.state.taxa_erro = taxa_erro
+    app.state.chamadas = 0
+    app.state.streams = 0
+    app.state.erros = 0
+
+    def _erro_simulado():
+        if random.random() >= app.state.taxa_erro:
+            return None
+        app.state.erros += 1
+        if random.random() < 0.5:
+            return JSONResponse(
+                {"error": {"message": "Rate limit", "type": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+        return JSONResponse({"error": {"message": "Erro simulado", "type": "server_error"}}, status_code=500)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        corpo = await request.json()
+        app.state.chamadas += 1
+        await asyncio.sleep(app.state.latencia)
+        erro = _erro_simulado()
+        if erro is not None:
+            return erro
+
+        n = app.state.chamadas
+        modelo = corpo.get("model", "stub")
+        criado = int(time.time())
+        pedacos = _pedacos(_texto(corpo))
+
+        if not corpo.get("stream"):
+            await asyncio.sleep(app.state.latencia_pedaco * len(pedacos))
+            return JSONResponse({
+                "id": f"chatcmpl-stub{n}",
+                "object": "chat.completion",
+                "created": criado,
+                "model": modelo,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pedacos)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        app.state.streams += 1
+
+        def chunk(delta: dict, fim=None) -> str:
+            return "data: " + json.dumps({
+                "id": f"chatcmpl-stub{n}",
+                "object": "chat.completion.chunk",
+                "created": criado,
+                "model": modelo,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": fim}],
+            }) + "\n\n"
+
+        async def eventos():
+            yield chunk({"role": "assistant", "content": ""})
+            for i, pedaco in enumerate(pedacos):
+                if i:
+                    await asyncio.sleep(app.state.latencia_pedaco)
+                yield chunk({"content": pedaco})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(eventos(), media_type="text/event-stream")
+
+    return app
+
+
+def iniciar_em_thread(porta: int, latencia: float = 0.0, taxa_erro: float = 0.0,
+                      latencia_pedaco: float = 0.0) -> FastAPI:
+    """Sobe o stub em uma thread daemon e espera ele aceitar conexões."""
+    app = criar_app(latencia, taxa_erro, latencia_pedaco)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=porta, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub local da API de chat da OpenAI")
+    parser.add_argument("--porta", type=int, default=9110)
+    parser.add_argument("--latencia", type=float, default=0.0)
+    parser.add_argument("--latencia-pedaco", type=float, default=0.0)
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(criar_app(args.latencia, args.taxa_erro, args.latencia_pedaco), host="127.0.0.1", port=args.porta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/stub_redis.py
+"""
+Redis falso, em memória, com os comandos do redis-py usados pelo
+EstadoStoreRedis (get/getex/getdel/set/mget/delete com TTL, sadd/srem/spop
+em SET e pipeline com transação). Serve para exercitar o backend "redis" sem servidor:
+
+    from benchmarks.stub_redis import RedisMemoria
+    store = EstadoStoreRedis("", "score:estado:", cliente=RedisMemoria())
+
+Como o redis-py sem decode_responses, devolve bytes.
+"""
+import threading
+import time
+
+
+def _bytes(valor) -> bytes:
+    return valor if isinstance(valor, bytes) else str(valor).encode()
+
+
+class RedisMemoria:
+    def __init__(self):
+        self.valores = {}  # chave -> (bytes, expira_em monotonic ou None)
+        self.conjuntos = {}  # chave -> set de bytes
+        # reentrante: o pipeline segura o lock enquanto roda os comandos
+        self._lock = threading.RLock()
+
+    def _vivo(self, chave):
+        item = self.valores.get(chave)
+        if item is None:
+            return None
+        valor, expira = item
+        if expira is not None and expira <= time.monotonic():
+            del self.valores[chave]
+            return None
+        return valor
+
+    def get(self, chave):
+        with self._lock:
+            return self._vivo(chave)
+
+    def getex(self, chave, ex=None):
+        with self._lock:
+            valor = self._vivo(chave)
+            if valor is not None and ex is not None:
+                self.valores[chave] = (valor, time.monotonic() + ex)
+            return valor
+
+    def getdel(self, chave):
+        with self._lock:
+            valor = self._vivo(chave)
+            self.valores.pop(chave, None)
+            return valor
+
+    def set(self, chave, valor, ex=None):
+        with self._lock:
+            self.valores[chave] = (_bytes(valor), time.monotonic() + ex if ex else None)
+        return True
+
+    def mget(self, chaves):
+        with self._lock:
+            return [self._vivo(c) for c in chaves]
+
+    def delete(self, *chaves):
+        with self._lock:
+            return sum(self.valores.pop(c, None) is not None for c in chaves)
+
+    def sadd(self, chave, *membros):
+        with self._lock:
+            conjunto = self.conjuntos.setdefault(chave, set())
+            antes = len(conjunto)
+            conjunto.update(_bytes(m) for m in membros)
+            return len(conjunto) - antes
+
+    def srem(self, chave, *membros):
+        with self._lock:
+            conjunto = self.conjuntos.get(chave, set())
+            antes = len(conjunto)
+            conjunto.difference_update(_bytes(m) for m in membros)
+            return antes - len(conjunto)
+
+    def spop(self, chave, count=None):
+        with self._lock:
+            conjunto = self.conjuntos.get(chave, set())
+            if count is None:
+                return conjunto.pop() if conjunto else None
+            return [conjunto.pop() for _ in range(min(count, len(conjunto)))]
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    """Enfileira os comandos e roda todos de uma vez, sem nada no meio (MULTI/EXEC)."""
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._comandos = []
+
+    def __getattr__(self, nome):
+        metodo = getattr(self._cliente, nome)
+
+        def enfileirar(*args, **kwargs):
+            self._comandos.append((metodo, args, kwargs))
+            return self
+        return enfileirar
+
+    def execute(self):
+        with self._cliente._lock:
+            resultados = [metodo(*args, **kwargs) for metodo, args, kwargs in self._comandos]
+        self._comandos = []
+        return resultados
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._comandos = []
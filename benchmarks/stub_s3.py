@@ -0,0 +1,92 @@
+# benchmarks/stub_s3.py
+"""
+Cliente S3 falso, em memória, com a mesma API do boto3 usada pelo
+RelatorioStoreS3 (put/get/head/copy/delete_object e list_objects_v2
+paginado, inclusive Range no get_object). Serve para exercitar o backend "s3" sem
+credenciais nem rede:
+
+    from benchmarks.stub_s3 import ClienteS3Memoria
+    store = RelatorioStoreS3("bucket", "relatorios/", cliente=ClienteS3Memoria())
+"""
+from datetime import datetime, timezone
+import io
+import threading
+
+
+class ErroS3(Exception):
+    def __init__(self, codigo: str):
+        super().__init__(codigo)
+        self.response = {"Error": {"Code": codigo}}
+
+
+class _Corpo:
+    def __init__(self, dados: bytes):
+        self._buf = io.BytesIO(dados)
+
+    def read(self, n: int = -1) -> bytes:
+        return self._buf.read(n)
+
+    def iter_chunks(self, chunk_size: int = 1024):
+        while True:
+            bloco = self._buf.read(chunk_size)
+            if not bloco:
+                break
+            yield bloco
+
+
+class ClienteS3Memoria:
+    def __init__(self, pagina: int = 1000):
+        self.pagina = pagina
+        self.objetos = {}  # (bucket, key) -> (bytes, LastModified)
+        self._lock = threading.Lock()
+
+    def _pegar(self, bucket, key):
+        with self._lock:
+            objeto = self.objetos.get((bucket, key))
+        if objeto is None:
+            raise ErroS3("NoSuchKey")
+        return objeto
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        with self._lock:
+            self.objetos[(Bucket, Key)] = (bytes(Body), datetime.now(timezone.utc))
+        return {}
+
+    def head_object(self, Bucket, Key):
+        dados, modificado = self._pegar(Bucket, Key)
+        return {"ContentLength": len(dados), "LastModified": modificado}
+
+    def get_object(self, Bucket, Key, Range=None):
+        dados, modificado = self._pegar(Bucket, Key)
+        if Range:
+            inicio, _, fim = Range[len("bytes="):].partition("-")
+            dados = dados[int(inicio): int(fim) + 1 if fim else None]
+        return {"Body": _Corpo(dados), "ContentLength": len(dados), "LastModified": modificado}
+
+    def copy_object(self, Bucket, Key, CopySource, MetadataDirective="COPY", **kwargs):
+        dados, _ = self._pegar(CopySource["Bucket"], CopySource["Key"])
+        if (CopySource["Bucket"], CopySource["Key"]) == (Bucket, Key) and MetadataDirective != "REPLACE":
+            # como no S3: cópia sobre si mesmo sem mudar nada é recusada
+            raise ErroS3("InvalidRequest")
+        with self._lock:
+            self.objetos[(Bucket, Key)] = (dados, datetime.now(timezone.utc))
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self.objetos.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None):
+        with self._lock:
+            chaves = sorted(k for b, k in self.objetos if b == Bucket and k.startswith(Prefix))
+            inicio = int(ContinuationToken or 0)
+            pagina = chaves[inicio: inicio + self.pagina]
+            conteudo = [
+                {"Key": k, "Size": len(self.objetos[(Bucket, k)][0]), "LastModified": self.objetos[(Bucket, k)][1]}
+                for k in pagina
+            ]
+        resposta = {"Contents": conteudo, "IsTruncated": inicio + self.pagina < len(chaves)}
+        if resposta["IsTruncated"]:
+            resposta["NextContinuationToken"] = str(inicio + self.pagina)
+        return resposta
@@ -0,0 +1,102 @@
+# benchmarks/teste_relatorio_store.py
+"""
+Teste dos backends do relatorio_store: disco local (diretório temporário)
+e S3, contra o cliente em memória de benchmarks.stub_s3.
+
+Para cada backend confere:
+
+- salvar / ler / tamanho / existência, e a mesma chave para os mesmos bytes
+- leitura por intervalo (Range), inclusive aberto no fim
+- listar
+- despejo por idade: um relatório reaproveitado (salvar dos mesmos bytes)
+  tem a idade renovada e fica; o outro, igualmente velho, sai
+- despejo por tamanho total: saem os mais antigos até caber
+
+    python -m benchmarks.teste_relatorio_store
+
+Sai com código 1 se alguma verificação falhar.
+"""
+from datetime import datetime, timedelta, timezone
+import os
+import tempfile
+import time
+
+from app.services.relatorio_store import RelatorioStoreLocal, RelatorioStoreS3, chave_do_conteudo
+from benchmarks.stub_s3 import ClienteS3Memoria
+
+DOIS_DIAS = 2 * 24 * 3600
+
+
+def _envelhecer_local(store, chave, segundos):
+    quando = time.time() - segundos
+    if os.path.exists(store._caminho(chave)):
+        os.utime(store._caminho(chave), (quando, quando))
+
+
+def _envelhecer_s3(store, chave, segundos):
+    cliente = store.cliente
+    k = (store.bucket, store._objeto(chave))
+    if k in cliente.objetos:
+        dados, _ = cliente.objetos[k]
+        cliente.objetos[k] = (dados, datetime.now(timezone.utc) - timedelta(seconds=segundos))
+
+
+def verificar(nome, store, envelhecer) -> list:
+    falhas = []
+
+    def conferir(condicao, descricao):
+        if not condicao:
+            falhas.append(f"{nome}: {descricao}")
+
+    a, b, c = b"%PDF-a" * 100, b"%PDF-b" * 100, b"%PDF-c" * 100
+
+    chave_a = store.salvar(a)
+    conferir(chave_a == chave_do_conteudo(a), "chave não é o sha256 do conteúdo")
+    conferir(store.salvar(a) == chave_a, "mesmos bytes deram outra chave")
+    conferir(store.ler(chave_a) == a, "ler devolveu outros bytes")
+    conferir(store.tamanho(chave_a) == len(a), "tamanho errado")
+    conferir(store._existe(chave_a), "chave gravada não existe")
+    conferir(store.ler("0" * 64) is None and store.tamanho("0" * 64) is None, "chave inexistente encontrada")
+    conferir(b"".join(store.iterar(chave_a, 10, 19)) == a[10:20], "Range [10, 19] errado")
+    conferir(b"".join(store.iterar(chave_a, 590)) == a[590:], "Range aberto no fim errado")
+
+    chave_b = store.salvar(b)
+    conferir({k for k, _, _ in store.listar()} == {chave_a, chave_b}, "listar não devolveu as duas chaves")
+
+    # os dois ficam velhos; "a" é reaproveitado (re-render com os mesmos bytes)
+    envelhecer(store, chave_a, DOIS_DIAS)
+    envelhecer(store, chave_b, DOIS_DIAS)
+    store.salvar(a)
+    apagados = store.despejar(max_idade=timedelta(days=1))
+    conferir(apagados == 1, f"despejo por idade apagou {apagados}, esperado 1")
+    conferir(store._existe(chave_a), "relatório reaproveitado foi despejado por idade")
+    conferir(not store._existe(chave_b), "relatório velho não foi despejado")
+
+    # por tamanho: só cabe um, sai o mais antigo ("a")
+    envelhecer(store, chave_a, 60)
+    chave_c = store.salvar(c)
+    apagados = store.despejar(max_bytes=len(c))
+    conferir(apagados == 1, f"despejo por tamanho apagou {apagados}, esperado 1")
+    conferir(not store._existe(chave_a) and store._existe(chave_c), "despejo por tamanho não tirou o mais antigo")
+
+    store.apagar(chave_c)
+    store.apagar(chave_c)  # apagar o que não existe não é erro
+    conferir(list(store.listar()) == [], "store não ficou vazio")
+    return falhas
+
+
+def main():
+    falhas = []
+    with tempfile.TemporaryDirectory(prefix="teste_store_") as tmp:
+        falhas += verificar("local", RelatorioStoreLocal(tmp), _envelhecer_local)
+    cliente = ClienteS3Memoria(pagina=1)  # paginação do list_objects_v2 também entra
+    falhas += verificar("s3", RelatorioStoreS3("bucket", "relatorios/", cliente=cliente), _envelhecer_s3)
+
+    for falha in falhas:
+        print(f"FALHOU {falha}")
+    print("ok" if not falhas else f"{len(falhas)} falha(s)")
+    raise SystemExit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()